@@ -1,14 +1,29 @@
 import os
 import time
+import random
+import argparse
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
 from dotenv import load_dotenv
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables.config import RunnableConfig
 
 from my_packages import DataLoader
 from my_packages import GraphAbout
 from my_packages.MyNeo4j import MyNeo4jGraph
+from my_packages.TokenCache import TokenCache
+from my_packages.ExtractionCache import ExtractionCache, prompt_fingerprint
+from my_packages.AdaptiveConcurrency import get_shared_controller, is_retryable_error
+from my_packages.Checkpoint import ExtractionCheckpoint
+from my_packages.DeadLetter import DeadLetterQueue
+from my_packages.GraphWriter import BackgroundGraphWriter
+from my_packages.LLMUsage import UsageTracker, estimate_message_tokens
+from my_packages import ResultParser
+from my_packages.ChunkFilter import KeywordFilter, MEDICAL_KEYWORDS, vocabulary_from_types
+from my_packages.BulkExport import BulkImportWriter
 
 # 加载环境变量
 load_dotenv(".env")
@@ -24,40 +39,90 @@ INSTRUCT_MODEL = 'deepseek-chat'
 # 指定测试数据的目录路径
 DIRECTORY_PATH = './data'
 
-if __name__ == '__main__':
-    # 读入测试数据
-    file_contents = DataLoader.read_txt_files(DIRECTORY_PATH)
-    for file_content in file_contents: # [0]:文件名(string) [1]:文件内容(string)
-        print("读入文件:", file_content[0])
-    print('')
+# 分词时每批送入模型的段落数
+TOKENIZE_BATCH_SIZE = 64
+# 分块使用的进程数，为1时在主进程中串行分块
+CHUNK_WORKERS = 1
+# 分词缓存的路径及最大条目数
+TOKEN_CACHE_PATH = './cache/tokens.sqlite'
+TOKEN_CACHE_MAX_ENTRIES = 2000000
+# 实体关系提取结果缓存的路径及最大条目数，可用python -m my_packages.ExtractionCache查看或清理
+EXTRACTION_CACHE_PATH = './cache/extractions.sqlite'
+EXTRACTION_CACHE_MAX_ENTRIES = 500000
+# 提取阶段断点记录的路径，程序中断后使用--resume参数继续
+CHECKPOINT_PATH = './cache/checkpoint.sqlite'
+# 提取失败的Chunk的记录路径，使用--retry-failed参数只重新处理这些Chunk，
+# 可用python -m my_packages.DeadLetter查看或清空
+DEAD_LETTER_PATH = './cache/dead_letters.sqlite'
+# 每个Chunk的提取最多尝试的次数（请求出错或输出无法解析时重试），及重试等待的基准秒数
+EXTRACTION_MAX_ATTEMPTS = 3
+EXTRACTION_RETRY_DELAY = 2.0
+# 提取前的Chunk预筛选：关键词密度（每100个字符命中医学关键词的次数）低于PREFILTER_MIN_DENSITY的Chunk，
+# PREFILTER_MODE为'defer'时放到任务队列的最后，为'skip'时不提取并记入死信记录（可用--retry-failed重新提取），
+# 为None时不筛选。
+# 被筛选的Chunk追加记录到PREFILTER_REPORT_PATH（制表符分隔：文件名、Chunk序号、chunk_id、得分、开头的文本）
+# 阈值按样本文本校准：医学正文的密度在4以上，导航栏、版权信息、分享提示等在2以下
+PREFILTER_MODE = 'defer'
+PREFILTER_MIN_DENSITY = 2.0
+PREFILTER_REPORT_PATH = './cache/prefilter_report.tsv'
+# 是否在提取的同时由后台线程写入Neo4j，每个Chunk的结果一返回就解析并排队写入
+OVERLAP_WRITES = True
+# 后台写入每批的GraphDocument数及等待写入队列的长度上限
+WRITE_BATCH_SIZE = 32
+WRITE_QUEUE_SIZE = 256
+# 写入Neo4j时跨文档批量导入（MyNeo4jGraph.add_graph_documents的bulk模式），每批（一个事务）的节点或关系行数
+GRAPH_IMPORT_BATCH_SIZE = 1000
+# 每个实体保留的描述句子数上限（按句子哈希去重），为None时只去重不限制
+DESCRIPTION_MAX_SENTENCES = 40
+# 多个Chunk合并为一个提取请求：每个请求最多包含的Chunk数（为1时不合并）及合并文本的token数上限
+PACK_MAX_CHUNKS = 4
+PACK_TOKEN_BUDGET = 1600
+# 是否流式处理：每读入一组文件就完成分块、提取、写入的全部流程再读下一组文件，
+# 内存占用只与最大的一组文件有关。为False时一次读入所有文件，分块可以多进程并行。
+STREAM_FILES = True
+# 流式处理时每组的文件数，同一组文件的Chunk共用一个LLM任务队列
+STREAM_GROUP_SIZE = 16
+# 是否增量构建：不清空数据库，只处理新增或修改的文件，并删除已修改或已删除文件的旧数据。
+# 文件清单保存在__Document__结点的contentHash属性中，以相对于DIRECTORY_PATH的路径（fileName属性）区分文件。
+# 默认与原来一样清空数据库后重新构建，用--incremental或把这里改为True启用增量构建。
+INCREMENTAL = False
+# LLM请求的初始、最小和最大并发数，实际并发数根据延迟和限流情况自适应调整
+LLM_INITIAL_CONCURRENCY = 12
+LLM_MIN_CONCURRENCY = 2
+LLM_MAX_CONCURRENCY = 48
+# 提示词编码：'compact'时类型列表编码为一行紧凑的"名称(说明)"并只在系统提示词中出现一次，
+# 去掉提示词的缩进，每个请求的提示词前缀逐字节相同；'legacy'时使用原来的提示词
+PROMPT_ENCODING = 'compact'
+# LLM的输出格式：'tuple'为原来的("entity" : ...)元组格式；'terse'为每行一条、字段以"|"分隔、
+# 类型用编号表示的紧凑格式，生成的token更少（总是使用紧凑的提示词编码）。
+# 离线比较：同样的15条实体关系记录，元组格式957字符（估计422 token），紧凑格式533字符（估计283 token），
+# 输出token约少1/3。但紧凑格式要求描述只有一句话，提取质量和实际延迟尚未在真实数据上比较，
+# 默认仍使用示例和描述合并都基于它调好的元组格式；用--compare-output-formats N在样本上比较后再切换
+OUTPUT_FORMAT = 'tuple'
 
-    # 使用自定义函数进行分块
-    for file_content in file_contents:
-        print("分块文件:", file_content[0])
-        chunks = DataLoader.chunk_text(file_content[1], chunk_size=500, overlap=50)
-        file_content.append(chunks) # [2]:各块内容(list)
-    print('')
+
+# 分块，file_content追加[2]:各块内容(Chunk列表)
+def chunk_files(file_contents, token_cache, workers=1):
+    all_chunks = DataLoader.parallel_chunk_texts(
+        [file_content[1] for file_content in file_contents],
+        chunk_size=500,
+        overlap=50,
+        batch_size=TOKENIZE_BATCH_SIZE,
+        workers=workers,
+        cache=token_cache
+    )
+    for file_content, chunks in zip(file_contents, all_chunks):
+        file_content.append(chunks) # [2]:各块内容(Chunk列表)
 
     # 打印分块结果
     for file_content in file_contents:
         print(f"File: {file_content[0]} Chunks: {len(file_content[2])}")
         for i, chunk in enumerate(file_content[2]):
-            print(f"Chunk {i+1}: {len(chunk)} tokens.")
+            print(f"Chunk {i+1}: {chunk.token_count} tokens.")
     print('')
 
-    # 在Neo4j中创建文档与Chunk的图结构
-    # 连接数据库
-    graph = MyNeo4jGraph(
-        url=NEO4J_URI, 
-        username=NEO4J_USERNAME, 
-        password=NEO4J_PASSWORD
-    )
-    print("数据库成功连接")
-    print('')
-    
-    # 清空数据库
-    graph.query("MATCH (n) CALL (n) {DETACH DELETE n} IN TRANSACTIONS")
-
+# 在Neo4j中创建文档与Chunk的图结构，file_content追加[3]:各块的id和各块document格式的内容(list)
+def create_chunk_structure(graph, file_contents):
     # 创建Document结点
     for file_content in file_contents:
         doc = GraphAbout.create_Document(graph, "local", DIRECTORY_PATH, file_content[0])
@@ -69,11 +134,538 @@ if __name__ == '__main__':
         result = GraphAbout.create_relation_between_chunks(graph, file_name , chunks)
         file_content.append(result) # [3]:各块的id和各块document格式的内容(list)
 
+# 使用大模型提取实体和关系，file_content追加[4]:实体列表和关系列表(list)
+# prompt_inputs为提示词中除input_text以外的参数
+# 内容相同的Chunk（id相同）只提取一次：数据库中已提取过的和本批中重复出现的Chunk不再调用LLM，
+# 其结果记为None，写入时跳过，实体关系通过共享的Chunk结点关联到每个文件。
+# extraction_cache不为None时，先从缓存中读取LLM的输出，只对未命中的Chunk调用LLM。
+# checkpoint不为None时，已完成的Chunk直接使用断点记录中的输出，每个请求完成后立即记录。
+# on_result不为None时，每得到一个Chunk的结果就调用on_result(file_content, Chunk序号, GraphDocument对象)，
+# 请求的输出在生成的同时由result_format的流式解析器解析；从缓存或断点读取的结果没有GraphDocument对象，传入None。
+# packed_chain不为None时，多个Chunk合并为一个请求，输出按编号拆分回各Chunk，拆分失败的Chunk用chain单独重试。
+# 每个Chunk的错误互不影响：请求出错或输出无法解析时按指数退避重试，最多尝试EXTRACTION_MAX_ATTEMPTS次，
+# 仍然失败的Chunk结果记为None，记入dead_letters（不为None时），其它Chunk继续处理。
+# chunk_filter不为None时，按PREFILTER_MODE跳过或推后关键词密度低的Chunk，跳过的Chunk记入dead_letters。
+# graph为None时不访问数据库。
+# seen为之前各组已处理的chunk_id集合（离线导出时跨组共用），其中的Chunk按重复处理，本组的Chunk也加入其中。
+def extract_entities_and_relationships(
+    graph, chain, prompt_inputs, file_contents,
+    extraction_cache=None, checkpoint=None, on_result=None, packed_chain=None,
+    result_format=ResultParser.TUPLE_FORMAT, dead_letters=None, chunk_filter=None, seen=None
+):
+    # graph为None时（离线导出）不查询数据库中已提取过的Chunk
+    extracted = set() if graph is None else GraphAbout.get_extracted_chunk_ids(
+        graph, {chunk["chunk_id"] for file_content in file_contents for chunk in file_content[3]}
+    )
+    seen = set() if seen is None else seen
+    saved_existing = 0
+    saved_duplicate = 0
+    # 所有文件中需要调用LLM的Chunk，元素为(文件序号, Chunk序号)
+    tasks = []
+    # 预筛选得分低的Chunk，元素为(文件序号, Chunk序号, 得分)
+    filtered = []
+    for f, file_content in enumerate(file_contents):
+        # 筛选需要提取的Chunk
+        pending = []
+        for i, chunk in enumerate(file_content[3]):
+            chunk_id = chunk["chunk_id"]
+            if chunk_id in extracted:
+                saved_existing += 1
+            elif chunk_id in seen:
+                saved_duplicate += 1
+            else:
+                seen.add(chunk_id)
+                pending.append(i)
+        results = [None] * len(file_content[3])
+        # 从断点记录中读取已完成的提取结果
+        if checkpoint is not None:
+            completed = checkpoint.get_completed([file_content[3][i]["chunk_id"] for i in pending])
+            for i in pending:
+                results[i] = completed.get(file_content[3][i]["chunk_id"])
+            pending = [i for i in pending if results[i] is None]
+        # 从缓存中读取已有的提取结果
+        if extraction_cache is not None:
+            cached = extraction_cache.get_many([file_content[3][i]["chunk_id"] for i in pending])
+            for i in pending:
+                results[i] = cached.get(file_content[3][i]["chunk_id"])
+            pending = [i for i in pending if results[i] is None]
+        file_content.append(results) # [4]:实体列表和关系列表(list)
+        if chunk_filter is not None and PREFILTER_MODE is not None:
+            kept = []
+            for i in pending:
+                score = chunk_filter.score(file_content[2][i].text)
+                if score >= chunk_filter.min_density:
+                    kept.append(i)
+                else:
+                    filtered.append((f, i, score))
+            pending = kept
+        tasks.extend((f, i) for i in pending)
+        if checkpoint is not None:
+            checkpoint.mark_pending([(file_content[3][i]["chunk_id"], file_content[0]) for i in pending])
+        if on_result is not None:
+            for i, result in enumerate(results):
+                if result is not None:
+                    on_result(file_content, i)
+
+    if filtered:
+        report_filtered_chunks(file_contents, filtered)
+        if PREFILTER_MODE == 'skip' and dead_letters is not None:
+            # 跳过的Chunk记入死信记录，误判时可以用--retry-failed重新提取
+            for f, i, score in filtered:
+                chunk = file_contents[f][2][i]
+                dead_letters.add(
+                    file_contents[f][3][i]["chunk_id"], file_contents[f][0], chunk.text, chunk.token_count,
+                    f"skipped by prefilter: score {score:.3f}"
+                )
+        if PREFILTER_MODE == 'defer':
+            # 得分低的Chunk排在所有文件的其它Chunk之后
+            deferred = [(f, i) for f, i, _ in filtered]
+            tasks.extend(deferred)
+            if checkpoint is not None:
+                checkpoint.mark_pending([(file_contents[f][3][i]["chunk_id"], file_contents[f][0]) for f, i in deferred])
+
+    # 所有文件的Chunk进入同一个任务队列，由一个线程池并行处理，不必等一个文件全部完成再开始下一个文件。
+    # 同时进行中的请求数由共用的自适应并发控制器决定，限流时自动退避重试。
+    controller = get_shared_controller()
+    t0 = time.time()
+    remaining = [0] * len(file_contents)
+    for f, _ in tasks:
+        remaining[f] += 1
+    # packed_chain不为None时，相邻的多个Chunk合并为一个请求
+    if packed_chain is not None:
+        packs = make_packs(file_contents, tasks, PACK_TOKEN_BUDGET, PACK_MAX_CHUNKS)
+    else:
+        packs = [[task] for task in tasks]
+
+    # 处理结果出错或被中断后置位，之后取得并发名额的请求不再调用LLM
+    stopped = threading.Event()
+    def check_stopped():
+        if stopped.is_set():
+            raise CancelledError()
+
+    # 创建一个Chunk的流式解析器
+    def make_parser(f, i):
+        chunk = file_contents[f][3][i]
+        return result_format.parser(chunk["chunk_id"], chunk["chunk_doc"].page_content)
+
+    # 请求一个Chunk，返回(输出, GraphDocument对象)，输出无法解析时抛出UnparseableResult
+    def request_chunk(f, i):
+        check_stopped()
+        parser = make_parser(f, i)
+        output = stream_request(chain, {**prompt_inputs, "input_text": file_contents[f][2][i].text}, parser)
+        graph_document = parser.close()
+        parser.check()
+        parser.accept()
+        return output, graph_document
+
+    # 单独请求一个Chunk并重试，重试后仍然失败时返回异常对象而不抛出
+    def request_chunk_isolated(f, i):
+        try:
+            return call_with_retries(controller, request_chunk, f, i)
+        except CancelledError:
+            raise
+        except Exception as e:
+            return e
+
+    # 请求一个合并的包，返回包中每个Chunk的(输出, GraphDocument对象)，缺失或被截断的为None
+    def request_pack(pack):
+        check_stopped()
+        router = ResultParser.PackedStreamParser([make_parser(f, i) for f, i in pack])
+        stream_request(packed_chain, {
+            **prompt_inputs,
+            "text_count": len(pack),
+            "input_text": GraphAbout.pack_texts([file_contents[f][2][i].text for f, i in pack])
+        }, router)
+        return router.close()
+
+    # 请求一个包，返回包中各Chunk的(输出, GraphDocument对象)或失败的异常对象，及单独重试的Chunk数
+    def run_pack(pack):
+        check_stopped()
+        if len(pack) == 1:
+            return [request_chunk_isolated(*pack[0])], 0
+        try:
+            results = controller.call(request_pack, pack)
+        except CancelledError:
+            raise
+        except Exception:
+            # 合并请求失败时包中的Chunk全部单独请求
+            results = [None] * len(pack)
+        # 输出中缺失、被截断或无法解析的Chunk单独重试
+        fallback = 0
+        for k, result in enumerate(results):
+            if result is None:
+                results[k] = request_chunk_isolated(*pack[k])
+                fallback += 1
+        return results, fallback
+
+    fallbacks = 0
+    failed = 0
+    executor = ThreadPoolExecutor(max_workers=controller.max_concurrency)
+    try:
+        futures = {executor.submit(run_pack, pack): pack for pack in packs}
+        for future in as_completed(futures):
+            pack = futures[future]
+            try:
+                results, fallback = future.result()
+            except Exception as e:
+                if checkpoint is not None:
+                    for f, i in pack:
+                        checkpoint.mark_failed(file_contents[f][3][i]["chunk_id"], repr(e))
+                raise
+            fallbacks += fallback
+            # 一个Pack的结果一次写入缓存
+            if extraction_cache is not None:
+                extraction_cache.put_many([
+                    (file_contents[f][3][i]["chunk_id"], result[0])
+                    for (f, i), result in zip(pack, results) if not isinstance(result, Exception)
+                ])
+            for (f, i), result in zip(pack, results):
+                file_content = file_contents[f]
+                chunk_id = file_content[3][i]["chunk_id"]
+                remaining[f] -= 1
+                if isinstance(result, Exception):
+                    # 失败的Chunk结果保持为None，写入时跳过
+                    failed += 1
+                    print("Chunk提取失败:", file_content[0], i + 1, repr(result))
+                    if checkpoint is not None:
+                        checkpoint.mark_failed(chunk_id, repr(result))
+                    if dead_letters is not None:
+                        chunk = file_content[2][i]
+                        dead_letters.add(chunk_id, file_content[0], chunk.text, chunk.token_count, repr(result))
+                else:
+                    output, graph_document = result
+                    file_content[4][i] = output
+                    if checkpoint is not None:
+                        checkpoint.mark_done(chunk_id, output)
+                    if dead_letters is not None:
+                        dead_letters.remove([chunk_id])
+                    if on_result is not None:
+                        on_result(file_content, i, graph_document)
+                if remaining[f] == 0:
+                    print("文件完成:", file_content[0], "耗时：", time.time()-t0, "秒")
+    except BaseException:
+        # 请求或处理结果出错（包括on_result出错）及KeyboardInterrupt时，取消队列中尚未开始的请求，
+        # 已开始但还在等待并发名额的请求也不再调用LLM，只损失正在进行中的请求
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    t2 = time.time()
+    print("LLM处理完成，Chunk数：", len(tasks), "请求数：", len(packs) + fallbacks, "（单独重试", fallbacks, "次）失败：", failed, "耗时：", t2-t0, "秒")
+    print("LLM并发状态:", controller.stats())
+    print("去重节省LLM调用:", saved_existing + saved_duplicate, "次（已提取", saved_existing, "次，重复", saved_duplicate, "次）")
+    print("")
+
+# 输出并记录预筛选得分低的Chunk，filtered的元素为(文件序号, Chunk序号, 得分)
+def report_filtered_chunks(file_contents, filtered):
+    action = "推后" if PREFILTER_MODE == 'defer' else "跳过"
+    print(f"预筛选{action}Chunk:", len(filtered), "个，记录在", PREFILTER_REPORT_PATH)
+    directory = os.path.dirname(PREFILTER_REPORT_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(PREFILTER_REPORT_PATH, "a", encoding="utf-8") as report:
+        for f, i, score in filtered:
+            file_content = file_contents[f]
+            excerpt = " ".join(file_content[2][i].text[:60].split())
+            print(f"  {file_content[0]} Chunk {i + 1} 得分 {score:.2f}: {excerpt}")
+            report.write(f"{file_content[0]}\t{i + 1}\t{file_content[3][i]['chunk_id']}\t{score:.3f}\t{excerpt}\n")
+
+# 在并发控制下调用fn，限流等可重试的错误由controller退避重试；其它错误（包括输出无法解析）
+# 按指数退避加随机抖动重试，最多尝试EXTRACTION_MAX_ATTEMPTS次
+def call_with_retries(controller, fn, *args):
+    attempt = 1
+    while True:
+        try:
+            return controller.call(fn, *args)
+        except CancelledError:
+            raise
+        except Exception as e:
+            # controller已经用完了可重试错误的重试次数
+            if is_retryable_error(e) or attempt >= EXTRACTION_MAX_ATTEMPTS:
+                raise
+        time.sleep(random.uniform(0, EXTRACTION_RETRY_DELAY * 2 ** (attempt - 1)))
+        attempt += 1
+
+# 流式请求：输出一边生成一边交给parser解析，返回完整的输出文本
+def stream_request(chain, inputs, parser):
+    pieces = []
+    for piece in chain.stream(inputs):
+        pieces.append(piece)
+        parser.feed(piece)
+    return "".join(pieces)
+
+# 按顺序把待请求的Chunk分成若干包，每包的token数不超过budget且Chunk数不超过max_chunks，
+# 单个Chunk超过budget时单独成包。tasks的元素为(文件序号, Chunk序号)。
+def make_packs(file_contents, tasks, budget, max_chunks):
+    packs = []
+    current = []
+    tokens = 0
+    for f, i in tasks:
+        n = file_contents[f][2][i].token_count
+        if current and (len(current) >= max_chunks or tokens + n > budget):
+            packs.append(current)
+            current = []
+            tokens = 0
+        current.append((f, i))
+        tokens += n
+    if current:
+        packs.append(current)
+    return packs
+
+# 由一个Chunk的提取结果构造GraphDocument对象，没有结果或没有识别出实体关系时返回None
+# result_format为输出格式对应的解析器，默认解析原来的元组格式；graph_document为请求时已解析好的结果
+def build_graph_document(file_content, i, result_format=ResultParser.TUPLE_FORMAT, graph_document=None):
+    chunk = file_content[3][i]
+    result = file_content[4][i]
+    if result is None:  # 已提取过的Chunk
+        return None
+    if graph_document is None:
+        graph_document = result_format(chunk["chunk_id"] ,chunk["chunk_doc"].page_content, result)
+    # 删除没有识别出实体关系的空的图对象
+    if len(graph_document.nodes)>0 or len(graph_document.relationships)>0:
+        return graph_document
+    return None
+
+# 构造GraphDocument对象并写入Neo4j，file_content追加[5]:图对象列表(list)
+# parsed为请求时已解析好的结果，chunk_id -> GraphDocument对象，其中没有的Chunk从输出文本解析
+def write_graph_documents(graph, file_contents, result_format=ResultParser.TUPLE_FORMAT, parsed=None):
+    parsed = parsed or {}
+    # 构造所有文档所有Chunk的GraphDocument对象
+    for file_content in file_contents:
+        graph_documents = []
+        for i in range(len(file_content[3])):
+            graph_document = build_graph_document(
+                file_content, i, result_format, parsed.get(file_content[3][i]["chunk_id"])
+            )
+            if graph_document is not None:
+                graph_documents.append(graph_document) # 根据实体和关系生成的图对象(GraphDocument)
+        file_content.append(graph_documents) # [5]:图对象列表(list)
+        
+    # 实体关系图写入Neo4j，此时每个Chunk是作为Documet结点创建的
+    # 所有文件的图对象一起按GRAPH_IMPORT_BATCH_SIZE行分批导入
+    graph.add_graph_documents(
+        [graph_document for file_content in file_contents for graph_document in file_content[5]],
+        baseEntityLabel=True,
+        include_source=True,
+        bulk=True,
+        batch_size=GRAPH_IMPORT_BATCH_SIZE
+    )
+    
+    # 合并块结点与Document结点
+    for file_content in file_contents:
+        graph_documents_chunk_chunk_Id=[]
+        for chunk in file_content[3]:
+            graph_documents_chunk_chunk_Id.append(chunk["chunk_id"])
+        
+        GraphAbout.merge_relationship_between_chunk_and_entites(graph, graph_documents_chunk_chunk_Id)
+        # 记录有提取结果的Chunk已经提取，包括没有提取出实体关系的Chunk；提取失败的Chunk结果为None
+        GraphAbout.mark_chunks_extracted(
+            graph, [chunk["chunk_id"] for chunk, result in zip(file_content[3], file_content[4]) if result is not None]
+        )
+
+# 对一组文件执行分块、建立Chunk结构、提取实体关系、写入图谱的全部流程
+def process_files(
+    graph, chain, prompt_inputs, file_contents,
+    token_cache=None, extraction_cache=None, checkpoint=None, workers=1, packed_chain=None,
+    result_format=ResultParser.TUPLE_FORMAT, dead_letters=None, chunk_filter=None
+):
+    chunk_files(file_contents, token_cache, workers)
+    create_chunk_structure(graph, file_contents)
+    extract_and_write(
+        graph, chain, prompt_inputs, file_contents, extraction_cache, checkpoint, packed_chain,
+        result_format, dead_letters, chunk_filter
+    )
+    # 全部写入后再记录文件哈希，中途失败的文件下次会重新处理；提取失败的Chunk在死信记录中，用--retry-failed处理
+    for file_content in file_contents:
+        GraphAbout.update_document_hash(graph, file_content[0], GraphAbout.document_content_hash(file_content[1]))
+
+# 对已建立Chunk结构的一组文件提取实体关系并写入图谱
+def extract_and_write(
+    graph, chain, prompt_inputs, file_contents,
+    extraction_cache=None, checkpoint=None, packed_chain=None,
+    result_format=ResultParser.TUPLE_FORMAT, dead_letters=None, chunk_filter=None
+):
+    if OVERLAP_WRITES:
+        # 提取结果一返回就解析并交给后台线程写入
+        writer = BackgroundGraphWriter(graph, WRITE_BATCH_SIZE, WRITE_QUEUE_SIZE, GRAPH_IMPORT_BATCH_SIZE)
+        def on_result(file_content, i, graph_document=None):
+            graph_document = build_graph_document(file_content, i, result_format, graph_document)
+            if graph_document is not None:
+                writer.submit(graph_document)
+            else:
+                # 没有提取出实体关系，也记录为已提取
+                writer.mark_extracted(file_content[3][i]["chunk_id"])
+        try:
+            extract_entities_and_relationships(
+                graph, chain, prompt_inputs, file_contents, extraction_cache, checkpoint, on_result, packed_chain,
+                result_format, dead_letters, chunk_filter
+            )
+        finally:
+            writer.close()
+        print("后台写入:", writer.written, "个图对象，写入耗时：", writer.write_time, "秒")
+    else:
+        # 保留请求时已解析好的结果，写入时不再重新解析，格式统计不重复计入
+        parsed = {}
+        def on_result(file_content, i, graph_document=None):
+            if graph_document is not None:
+                parsed[file_content[3][i]["chunk_id"]] = graph_document
+        extract_entities_and_relationships(
+            graph, chain, prompt_inputs, file_contents, extraction_cache, checkpoint, on_result, packed_chain,
+            result_format, dead_letters, chunk_filter
+        )
+        write_graph_documents(graph, file_contents, result_format, parsed)
+
+# 离线导出一组文件：分块、提取实体关系后不写入Neo4j，文档、Chunk结构和提取结果交给export_writer
+# （BulkExport.BulkImportWriter）合并后写成neo4j-admin database import的导入文件。
+# seen为之前各组已处理的chunk_id集合，在各组间共用，之前的组中出现过的Chunk不再提取
+def export_files(
+    export_writer, chain, prompt_inputs, file_contents,
+    token_cache=None, extraction_cache=None, workers=1, packed_chain=None,
+    result_format=ResultParser.TUPLE_FORMAT, dead_letters=None, chunk_filter=None, seen=None
+):
+    chunk_files(file_contents, token_cache, workers)
+    chunk_structures = []
+    for file_content in file_contents:
+        result, chunk_rows, relationships = GraphAbout.build_chunk_rows(file_content[0], file_content[2])
+        chunk_structures.append((chunk_rows, relationships))
+        file_content.append(result) # [3]:各块的id和各块document格式的内容(list)
+    def on_result(file_content, i, graph_document=None):
+        graph_document = build_graph_document(file_content, i, result_format, graph_document)
+        if graph_document is not None:
+            export_writer.add_graph_document(graph_document)
+    extract_entities_and_relationships(
+        None, chain, prompt_inputs, file_contents, extraction_cache, on_result=on_result,
+        packed_chain=packed_chain, result_format=result_format, dead_letters=dead_letters,
+        chunk_filter=chunk_filter, seen=seen
+    )
+    # 提取完成后写入文档和Chunk结构，有提取结果的Chunk记为已提取
+    for file_content, (chunk_rows, relationships) in zip(file_contents, chunk_structures):
+        file_name = file_content[0]
+        export_writer.add_document(
+            file_name, "local", DIRECTORY_PATH, GraphAbout.document_content_hash(file_content[1])
+        )
+        extracted = {chunk["chunk_id"] for chunk, result in zip(file_content[3], file_content[4]) if result is not None}
+        export_writer.add_chunks(file_name, chunk_rows, relationships, extracted)
+
+# 由死信记录重建的Chunk，只有提取需要的文本和token数
+class StoredChunk:
+    __slots__ = ("text", "token_count")
+
+    def __init__(self, text, token_count):
+        self.text = text
+        self.token_count = token_count
+
+# 只重新处理死信记录中的Chunk：按文件分组后提取实体关系并写入图谱，成功的Chunk从记录中删除。
+# Chunk结点在原来的运行中已经建立；Chunk结点已不存在（所属文件已修改或删除）的记录直接删除。
+def retry_failed_chunks(
+    graph, chain, prompt_inputs, dead_letters,
+    extraction_cache=None, packed_chain=None, result_format=ResultParser.TUPLE_FORMAT
+):
+    rows = dead_letters.get_all()
+    existing = GraphAbout.get_existing_chunk_ids(graph, [row[0] for row in rows])
+    dead_letters.remove(row[0] for row in rows if row[0] not in existing)
+    file_contents = {}
+    for chunk_id, file_name, text, token_count in rows:
+        if chunk_id not in existing:
+            continue
+        # [0]:文件名 [1]:文件内容（不需要） [2]:Chunk列表 [3]:各块的id和document格式的内容
+        file_content = file_contents.setdefault(file_name, [file_name, None, [], []])
+        file_content[2].append(StoredChunk(text, token_count))
+        file_content[3].append({"chunk_id": chunk_id, "chunk_doc": Document(page_content=text)})
+    print("重新处理失败的Chunk:", sum(len(file_content[3]) for file_content in file_contents.values()),
+          "个（已失效的记录", len(rows) - len(existing), "个）")
+    if file_contents:
+        extract_and_write(
+            graph, chain, prompt_inputs, list(file_contents.values()), extraction_cache,
+            packed_chain=packed_chain, result_format=result_format, dead_letters=dead_letters
+        )
+    print("仍然失败的Chunk:", dead_letters.count())
+
+# 增量构建时筛选需要处理的文件：跳过内容未变的文件，删除已修改文件的旧数据。
+# manifest为数据库中的文件清单，seen记录本次读到的所有文件（相对于数据目录的路径）。
+def select_changed_files(graph, file_contents, manifest, seen):
+    for file_content in file_contents:
+        file_name = file_content[0]
+        seen.add(file_name)
+        if file_name in manifest:
+            if manifest[file_name] == GraphAbout.document_content_hash(file_content[1]):
+                print("文件未修改，跳过:", file_name)
+                continue
+            print("文件已修改，删除旧数据:", file_name)
+            GraphAbout.delete_document(graph, file_name)
+        yield file_content
+
+# 把类型列表编码为一行："名称(说明)；名称(说明)；…"，代替列表中各字典的repr
+def encode_types(types):
+    return "；".join(f"{t['name']}({t['description']})" for t in types)
+
+# 去掉提示词每行的缩进和行尾空白
+def compact_prompt(prompt):
+    return "\n".join(line.strip() for line in prompt.strip().splitlines())
+
+# 估计平均到每个Chunk的提示词开销（不含Chunk文本本身）的输入token数，text_count为一个请求包含的Chunk数
+def prompt_overhead_tokens(chat_prompt, prompt_inputs, text_count=1):
+    messages = chat_prompt.format_messages(input_text="", text_count=text_count, **prompt_inputs)
+    return round(estimate_message_tokens(messages) / text_count)
+
+# 在固定的样本（数据目录中的前sample_size个Chunk）上逐个比较各输出格式，
+# 输出每个Chunk的输入、输出token数、耗时及解析出的实体和关系数，不使用缓存，不写入数据库
+def compare_output_formats(llm, output_formats, directory, sample_size, token_cache=None):
+    texts = []
+    for file_name, content in DataLoader.iter_txt_files(directory):
+        for chunks in DataLoader.chunk_texts([content], chunk_size=500, overlap=50,
+                                             batch_size=TOKENIZE_BATCH_SIZE, cache=token_cache):
+            texts.extend(chunk.text for chunk in chunks)
+        if len(texts) >= sample_size:
+            break
+    texts = texts[:sample_size]
+    print("输出格式比较，样本Chunk数:", len(texts))
+    controller = get_shared_controller()
+    for name, (chat_prompt, _, prompt_inputs, result_format) in output_formats.items():
+        tracker = UsageTracker()
+        chain = tracker.track(chat_prompt | llm) | StrOutputParser()
+        outputs = controller.map(chain.invoke, [{**prompt_inputs, "input_text": text} for text in texts])
+        nodes = relationships = 0
+        for text, output in zip(texts, outputs):
+            graph_document = result_format("", text, output)
+            nodes += len(graph_document.nodes)
+            relationships += len(graph_document.relationships)
+        stats = tracker.stats()
+        print(f"{name}: 每个Chunk输入token {stats['input_tokens_per_chunk']:.0f}，"
+              f"输出token {stats['output_tokens_per_chunk']:.0f}，耗时 {stats['latency_per_chunk']:.2f} 秒，"
+              f"实体 {nodes} 个，关系 {relationships} 个")
+    print('')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="构建知识图谱")
+    parser.add_argument("--resume", action="store_true", help="从上次中断处继续，跳过已完成提取的Chunk")
+    parser.add_argument("--retry-failed", action="store_true", help="只重新处理之前提取失败的Chunk（死信记录）")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="增量构建：不清空数据库，只处理新增或修改的文件，删除已修改或已删除文件的旧数据"
+    )
+    parser.add_argument(
+        "--compare-output-formats", type=int, metavar="N",
+        help="取数据目录中的前N个Chunk，比较各输出格式每个Chunk的输出token数和耗时，不写入数据库"
+    )
+    parser.add_argument(
+        "--export-import", metavar="DIR",
+        help="初次构建：不写入Neo4j，把图谱导出为neo4j-admin database import的CSV文件，保存到DIR"
+    )
+    args = parser.parse_args()
+
     # 使用大模型提取实体和关系
+    # 所有LLM请求共用的自适应并发控制器
+    get_shared_controller(
+        initial_concurrency=LLM_INITIAL_CONCURRENCY,
+        min_concurrency=LLM_MIN_CONCURRENCY,
+        max_concurrency=LLM_MAX_CONCURRENCY
+    )
     # 连接模型
     llm = ChatDeepSeek(
         model=INSTRUCT_MODEL,
-        temperature=1.0
+        temperature=1.0,
+        stream_usage=True
     )
     print("LLM成功连接")
     print('')
@@ -176,12 +768,41 @@ if __name__ == '__main__':
     输出：
     """
 
-    chat_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt), 
-        ("human", human_prompt)
-    ])
+    # 多个Chunk合并为一个请求时的用户提示词
+    packed_human_prompt="""
+    -真实数据- 
+    ###################### 
+    实体类型：{entity_types} 
+    关系类型：{relationship_types} 
+    以下共有{text_count}段文本，每段文本以单独一行的"<文本 编号>"开头。请对每段文本分别独立地识别实体和关系。
+    输出时，每段文本先单独一行输出它的"<文本 编号>"，再输出该段文本的实体和关系列表；
+    所有文本都输出完成后，单独一行输出"<全部完成>"。
+    文本：
+    {input_text} 
+    ###################### 
+    输出：
+    """
 
-    chain = chat_prompt | llm | StrOutputParser()
+    # 紧凑编码时的用户提示词：类型列表只在系统提示词中出现一次，
+    # 每个请求只有末尾的文本不同，前面的内容逐字节相同，便于服务端的前缀缓存命中
+    compact_human_prompt="""
+    -真实数据- 
+    ###################### 
+    文本：{input_text} 
+    ###################### 
+    输出：
+    """
+    compact_packed_human_prompt="""
+    -真实数据- 
+    ###################### 
+    每段文本以单独一行的"<文本 编号>"开头。请对每段文本分别独立地识别实体和关系。
+    输出时，每段文本先单独一行输出它的"<文本 编号>"，再输出该段文本的实体和关系列表；
+    所有文本都输出完成后，单独一行输出"<全部完成>"。
+    以下共有{text_count}段文本：
+    {input_text} 
+    ###################### 
+    输出：
+    """
 
     tuple_delimiter = " : "
     record_delimiter = "\n"
@@ -327,57 +948,258 @@ if __name__ == '__main__':
         {"name": "预测", "description": "预测疾病结局"}
     ]
 
-    for file_content in file_contents:
-        t0 = time.time()
-        # 并行处理提高效率
-        inputs = [{
-            "entity_types": entity_types,
-            "relationship_types": relationship_types,
-            "tuple_delimiter": tuple_delimiter,
-            "record_delimiter": record_delimiter,
-            "completion_delimiter": completion_delimiter,
-            "input_text": ''.join(chunk)
-        } for chunk in file_content[2]]
-        results = chain.batch(inputs, config=RunnableConfig(max_concurrency=12))
-            
-        t2 = time.time()
-        print("文件耗时：",t2-t0,"秒")
-        file_content.append(results) # [4]:实体列表和关系列表(list)
-    print("LLM处理完成")
-    print("")
+    legacy_inputs = {
+        "entity_types": entity_types,
+        "relationship_types": relationship_types,
+        "tuple_delimiter": tuple_delimiter,
+        "record_delimiter": record_delimiter,
+        "completion_delimiter": completion_delimiter
+    }
+    legacy_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt), 
+        ("human", human_prompt)
+    ])
+    legacy_packed_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt), 
+        ("human", packed_human_prompt)
+    ])
+    compact_inputs = {
+        **legacy_inputs,
+        "entity_types": encode_types(entity_types),
+        "relationship_types": encode_types(relationship_types)
+    }
+    compact_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", compact_prompt(system_prompt)), 
+        ("human", compact_prompt(compact_human_prompt))
+    ])
+    compact_packed_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", compact_prompt(system_prompt)), 
+        ("human", compact_prompt(compact_packed_human_prompt))
+    ])
 
-    # 构造所有文档所有Chunk的GraphDocument对象
-    for file_content in file_contents:
-        chunks = file_content[3]
-        results = file_content[4]
-        
-        graph_documents = []
-        for chunk, result in zip(chunks, results):
-            graph_document =  GraphAbout.convert_to_graph_document(chunk["chunk_id"] ,chunk["chunk_doc"].page_content, result)
-            graph_documents.append(graph_document) # 根据实体和关系生成的图对象(GraphDocument)
-        file_content.append(graph_documents) # [5]:图对象列表(list)
-        
-    # 实体关系图写入Neo4j，此时每个Chunk是作为Documet结点创建的
-    for file_content in file_contents:
-        # 删除没有识别出实体关系的空的图对象
-        graph_documents = []
-        for graph_document in file_content[5]:
-            if len(graph_document.nodes)>0 or len(graph_document.relationships)>0:
-                graph_documents.append(graph_document)
-        # 关系写入
-        graph.add_graph_documents(
-            graph_documents,
-            baseEntityLabel=True,
-            include_source=True
-        )
+
+    # 紧凑输出格式的系统提示词，类型以编号输出，描述只保留一句话
+    terse_system_prompt="""
+    -目标- 
+    给定文本和实体类型、关系类型的编号列表，识别文本中这些类型的所有实体以及实体之间的所有关系。 
+    -实体类型编号- 
+    {entity_types}；0=其他 
+    -关系类型编号- 
+    {relationship_types}；0=其他 
+    -输出格式- 
+    每行一条记录，字段之间用"|"分隔，字段内不要使用"|"，不要加引号： 
+    E|实体名称|实体类型编号|一句话描述实体的属性和活动 
+    R|源实体名称|目标实体名称|关系类型编号|关系强度(1-10的数字)|一句话说明两个实体为什么相关 
+    先输出所有实体，再输出实体之间*明显相关*的所有关系，源实体和目标实体必须是已输出的实体名称。 
+    所有内容用中文输出。不能归类为列表中的类型时使用编号0，***严禁使用列表中不存在的编号***。 
+    ###################### 
+    -示例- 
+    ###################### 
+    实体类型编号：1=人物；2=组织；3=事件；4=概念；0=其他 
+    关系类型编号：1=同事；2=研究；3=接触；4=领导；0=其他 
+    文本： 
+    Alex clenched his jaw against Taylor's authoritarian certainty. His and Jordan's shared commitment to discovery was an unspoken rebellion against Cruz's vision of control. Taylor paused beside Jordan and observed the device with something akin to reverence. 
+    输出： 
+    E|Alex|1|Alex对Taylor的专断感到不满，并与Jordan共同致力于探索 
+    E|Taylor|1|Taylor态度专断，但对装置表现出敬畏 
+    E|Jordan|1|Jordan致力于探索，与Taylor围绕装置有直接互动 
+    E|Cruz|1|Cruz代表控制与秩序的愿景 
+    E|装置|0|故事的核心，可能带来颠覆性影响 
+    R|Alex|Taylor|1|7|Alex受Taylor专断态度的影响 
+    R|Alex|Jordan|1|6|Alex与Jordan共同致力于探索 
+    R|Jordan|Cruz|0|5|Jordan对探索的坚持是对Cruz控制愿景的反抗 
+    R|Taylor|装置|2|9|Taylor对装置表现出敬畏 
+    ###################### 
+    """
+    terse_inputs = {
+        "entity_types": ResultParser.encode_type_codes(entity_types),
+        "relationship_types": ResultParser.encode_type_codes(relationship_types)
+    }
+    terse_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", compact_prompt(terse_system_prompt)), 
+        ("human", compact_prompt(compact_human_prompt))
+    ])
+    terse_packed_chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", compact_prompt(terse_system_prompt)), 
+        ("human", compact_prompt(compact_packed_human_prompt))
+    ])
+    terse_format = ResultParser.TerseFormat(
+        [t["name"] for t in entity_types], [t["name"] for t in relationship_types]
+    )
+
+    # 各输出格式的(提示词, 合并请求的提示词, 提示词参数, 解析函数)
+    output_formats = {
+        "tuple": (
+            (compact_chat_prompt, compact_packed_chat_prompt, compact_inputs) if PROMPT_ENCODING == 'compact'
+            else (legacy_chat_prompt, legacy_packed_chat_prompt, legacy_inputs)
+        ) + (ResultParser.TupleFormat(tuple_delimiter),),
+        "terse": (terse_chat_prompt, terse_packed_chat_prompt, terse_inputs, terse_format),
+    }
+
+    # 每个Chunk的提示词开销（不含Chunk文本）的估计输入token数
+    print("每个Chunk的提示词开销估计(token):")
+    print("  原始编码:", prompt_overhead_tokens(legacy_chat_prompt, legacy_inputs))
+    print("  紧凑编码:", prompt_overhead_tokens(compact_chat_prompt, compact_inputs))
+    print("  紧凑输出格式:", prompt_overhead_tokens(terse_chat_prompt, terse_inputs))
+    if PACK_MAX_CHUNKS > 1:
+        print(f"  原始编码，{PACK_MAX_CHUNKS}个Chunk合并:", prompt_overhead_tokens(legacy_packed_chat_prompt, legacy_inputs, PACK_MAX_CHUNKS))
+        print(f"  紧凑编码，{PACK_MAX_CHUNKS}个Chunk合并:", prompt_overhead_tokens(compact_packed_chat_prompt, compact_inputs, PACK_MAX_CHUNKS))
+    print('')
+
+    chat_prompt, packed_chat_prompt, prompt_inputs, result_format = output_formats[OUTPUT_FORMAT]
+
+    # 统计实际的输入、输出token数及命中前缀缓存的token数
+    usage_tracker = UsageTracker()
+    chain = usage_tracker.track(chat_prompt | llm) | StrOutputParser()
+    packed_chain = usage_tracker.track(packed_chat_prompt | llm) | StrOutputParser() if PACK_MAX_CHUNKS > 1 else None
+
+    # 分块时段落批量分词，分词结果缓存到磁盘
+    token_cache = TokenCache(TOKEN_CACHE_PATH, DataLoader.TOKENIZER_MODEL, TOKEN_CACHE_MAX_ENTRIES)
+
+    if args.compare_output_formats:
+        compare_output_formats(llm, output_formats, DIRECTORY_PATH, args.compare_output_formats, token_cache)
+        token_cache.close()
+        raise SystemExit(0)
+
+    # LLM提取结果缓存到磁盘，提示词、类型列表或模型改变时自动失效
+    extraction_cache = ExtractionCache(
+        EXTRACTION_CACHE_PATH,
+        prompt_fingerprint(
+            [message.prompt.template for message in chat_prompt.messages + packed_chat_prompt.messages],
+            prompt_inputs, INSTRUCT_MODEL
+        ),
+        EXTRACTION_CACHE_MAX_ENTRIES
+    )
+    # 提取失败的Chunk的记录
+    dead_letters = DeadLetterQueue(DEAD_LETTER_PATH)
+    # 提取前按实体类型词表和常见医学词素的关键词密度筛选Chunk
+    chunk_filter = KeywordFilter(vocabulary_from_types(entity_types) + MEDICAL_KEYWORDS, PREFILTER_MIN_DENSITY)
+
+    if args.export_import:
+        # 离线导出全部文件，不连接数据库
+        export_writer = BulkImportWriter(args.export_import, DESCRIPTION_MAX_SENTENCES)
+        file_iter = DataLoader.iter_txt_files(DIRECTORY_PATH)
+        # 各组共用，内容相同的Chunk在整个导出中只提取一次
+        seen = set()
+        while True:
+            file_contents = list(islice(file_iter, STREAM_GROUP_SIZE)) # [0]:文件名(string) [1]:文件内容(string)
+            if not file_contents:
+                break
+            for file_content in file_contents:
+                print("读入文件:", file_content[0])
+            export_files(
+                export_writer, chain, prompt_inputs, file_contents,
+                token_cache=token_cache, extraction_cache=extraction_cache, workers=CHUNK_WORKERS,
+                packed_chain=packed_chain, result_format=result_format, dead_letters=dead_letters,
+                chunk_filter=chunk_filter, seen=seen
+            )
+            del file_contents
+        print("导出文件:", export_writer.close())
+        print("导入命令（在", args.export_import, "中执行）:", export_writer.import_command())
+        print("LLM用量:", usage_tracker.stats())
+        print("输出解析:", result_format.stats())
+        if dead_letters.count():
+            print("提取失败的Chunk:", dead_letters.count(), "个")
+        dead_letters.close()
+        extraction_cache.close()
+        token_cache.close()
+        raise SystemExit(0)
+
+    # 在Neo4j中创建文档与Chunk的图结构
+    # 连接数据库
+    # 提取时限定的实体类型、关系类型（及"其他"）按类型分组用静态查询导入
+    graph = MyNeo4jGraph(
+        url=NEO4J_URI, 
+        username=NEO4J_USERNAME, 
+        password=NEO4J_PASSWORD,
+        relationship_types=[t["name"] for t in relationship_types] + [ResultParser.OTHER_TYPE],
+        entity_types=[t["name"] for t in entity_types] + [ResultParser.OTHER_TYPE],
+        max_description_sentences=DESCRIPTION_MAX_SENTENCES
+    )
+    print("数据库成功连接")
+    print('')
     
-    # 合并块结点与Document结点
-    for file_content in file_contents:
-        graph_documents_chunk_chunk_Id=[]
-        for chunk in file_content[3]:
-            graph_documents_chunk_chunk_Id.append(chunk["chunk_id"])
-        
-        GraphAbout.merge_relationship_between_chunk_and_entites(graph, graph_documents_chunk_chunk_Id)
+    if INCREMENTAL or args.incremental:
+        # 读取已构建的文件清单
+        manifest = GraphAbout.get_document_manifest(graph)
+        print("已构建文件数:", len(manifest))
+    elif args.resume or args.retry_failed:
+        # 继续上次的构建，保留已写入的数据
+        manifest = {}
+    else:
+        # 清空数据库
+        graph.query("MATCH (n) CALL (n) {DETACH DELETE n} IN TRANSACTIONS")
+        manifest = {}
+
+    if args.retry_failed:
+        retry_failed_chunks(
+            graph, chain, prompt_inputs, dead_letters, extraction_cache,
+            packed_chain=packed_chain, result_format=result_format
+        )
+        print("LLM用量:", usage_tracker.stats())
+        print("输出解析:", result_format.stats())
+        dead_letters.close()
+        extraction_cache.close()
+        token_cache.close()
+        graph.close()
+        raise SystemExit(0)
+
+    # 提取阶段的断点记录
+    checkpoint = ExtractionCheckpoint(CHECKPOINT_PATH)
+    if args.resume:
+        checkpoint.resume(extraction_cache.prompt_key)
+        print("从断点继续:", checkpoint.stats())
+    else:
+        checkpoint.start(extraction_cache.prompt_key)
+
+    seen = set()
+    changed_files = select_changed_files(graph, DataLoader.iter_txt_files(DIRECTORY_PATH), manifest, seen)
+    if STREAM_FILES:
+        # 逐组文件处理，一组文件的中间结果写入Neo4j后即释放
+        while True:
+            file_contents = list(islice(changed_files, STREAM_GROUP_SIZE)) # [0]:文件名(string) [1]:文件内容(string)
+            if not file_contents:
+                break
+            for file_content in file_contents:
+                print("读入文件:", file_content[0])
+            process_files(
+                graph, chain, prompt_inputs, file_contents,
+                token_cache=token_cache, extraction_cache=extraction_cache, checkpoint=checkpoint,
+                workers=CHUNK_WORKERS, packed_chain=packed_chain, result_format=result_format,
+                dead_letters=dead_letters, chunk_filter=chunk_filter
+            )
+            del file_contents
+    else:
+        # 读入全部数据
+        file_contents = list(changed_files)
+        for file_content in file_contents: # [0]:文件名(string) [1]:文件内容(string)
+            print("读入文件:", file_content[0])
+        print('')
+        if file_contents:
+            process_files(
+                graph, chain, prompt_inputs, file_contents,
+                token_cache=token_cache, extraction_cache=extraction_cache, checkpoint=checkpoint,
+                workers=CHUNK_WORKERS, packed_chain=packed_chain, result_format=result_format,
+                dead_letters=dead_letters, chunk_filter=chunk_filter
+            )
+
+    # 删除数据目录中已不存在的文件
+    for file_name in manifest.keys() - seen:
+        print("文件已删除，删除旧数据:", file_name)
+        GraphAbout.delete_document(graph, file_name)
+    print("分词缓存:", token_cache.stats())
+    token_cache.close()
+    print("提取缓存:", extraction_cache.stats())
+    extraction_cache.close()
+    print("LLM用量:", usage_tracker.stats())
+    print("输出解析:", result_format.stats())
+    for chunk_id, line, reason in result_format.examples:
+        print("  格式错误:", chunk_id, reason, line[:200])
+    print("断点记录:", checkpoint.stats())
+    checkpoint.close()
+    if dead_letters.count():
+        print("提取失败的Chunk:", dead_letters.count(), "个，可用--retry-failed重新处理")
+    dead_letters.close()
     print("知识图谱初步构建完成")
     print("")
 
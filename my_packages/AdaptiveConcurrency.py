@@ -0,0 +1,206 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# LLM请求的自适应并发控制（AIMD）
+# 请求成功且延迟正常时缓慢增加并发数（每完成约一轮并发数的请求增加increase）；
+# 遇到限流（429）、服务端错误（5xx）、超时或延迟明显变差时按decrease_factor成倍降低并发数，
+# 并对可重试的错误按指数退避加随机抖动后重试。
+
+# 视为限流或服务端暂时不可用、需要重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# 无法取得状态码时，按异常类名判断是否可重试（openai/httpx的异常类）
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "ServiceUnavailableError", "TimeoutException", "ConnectError", "ReadTimeout",
+}
+
+# 取得异常对应的HTTP状态码，没有时返回None
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+# 判断异常是否为可重试的限流或服务端错误
+def is_retryable_error(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+# 从异常的响应头中读取服务端建议的重试等待秒数
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveConcurrencyController:
+    def __init__(
+        self,
+        initial_concurrency=12,
+        min_concurrency=1,
+        max_concurrency=64,
+        increase=1.0,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+        max_retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        window=60.0,
+    ):
+        if not 1 <= min_concurrency <= initial_concurrency <= max_concurrency:  # 参数检查
+            raise ValueError("concurrency must satisfy 1 <= min <= initial <= max.")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1.")
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        # 短期平滑延迟超过长期基线延迟的latency_tolerance倍时视为拥塞
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 吞吐量统计的时间窗口（秒）
+        self.window = window
+
+        self._limit = float(initial_concurrency)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._ewma_latency = None
+        self._baseline_latency = None
+        self._last_decrease = 0.0
+        self._completions = deque()
+        self.completed = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+
+    # 当前允许的并发数
+    @property
+    def concurrency(self):
+        with self._condition:
+            return int(self._limit)
+
+    # 最近window秒内每秒完成的请求数
+    @property
+    def throughput(self):
+        with self._condition:
+            self._trim_completions(time.monotonic())
+            return len(self._completions) / self.window
+
+    def stats(self):
+        with self._condition:
+            self._trim_completions(time.monotonic())
+            return {
+                "concurrency": int(self._limit),
+                "in_flight": self._in_flight,
+                "throughput_per_second": len(self._completions) / self.window,
+                "completed": self.completed,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "ewma_latency": self._ewma_latency,
+                "baseline_latency": self._baseline_latency,
+            }
+
+    def _trim_completions(self, now):
+        while self._completions and now - self._completions[0] > self.window:
+            self._completions.popleft()
+
+    # 等待直到进行中的请求数小于当前并发数
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    # 乘性减小并发数，一个平滑延迟周期内只减小一次，避免同一批失败连续减半
+    def _decrease(self, now):
+        cooldown = self._ewma_latency or 1.0
+        if now - self._last_decrease >= cooldown:
+            self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+            self._last_decrease = now
+
+    # 请求结束，latency为成功请求的耗时，throttled表示遇到限流或服务端错误，failed表示其它错误
+    def release(self, latency=None, throttled=False, failed=False):
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                self._decrease(now)
+            elif failed:
+                self.errors += 1
+            elif latency is not None:
+                self.completed += 1
+                self._completions.append(now)
+                self._trim_completions(now)
+                if self._ewma_latency is None:
+                    self._ewma_latency = latency
+                    self._baseline_latency = latency
+                else:
+                    self._ewma_latency = 0.8 * self._ewma_latency + 0.2 * latency
+                    self._baseline_latency = 0.98 * self._baseline_latency + 0.02 * latency
+                # 完成足够多的请求、基线稳定后才根据延迟判断拥塞
+                if self.completed > 20 and self._ewma_latency > self.latency_tolerance * self._baseline_latency:
+                    self._decrease(now)
+                else:
+                    # 加性增加：大约每完成一轮当前并发数的请求增加increase
+                    self._limit = min(self.max_concurrency, self._limit + self.increase / self._limit)
+            self._condition.notify_all()
+
+    # 在并发控制下调用fn，可重试的错误按指数退避加随机抖动重试，超过max_retries后抛出
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            t0 = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable_error(e)
+                self.release(throttled=retryable, failed=not retryable)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                with self._condition:
+                    self.retries += 1
+                time.sleep(delay)
+                continue
+            self.release(latency=time.monotonic() - t0)
+            return result
+
+    # 在并发控制下对inputs中的每一项调用fn，结果按输入顺序返回
+    def map(self, fn, inputs):
+        inputs = list(inputs)
+        results = [None] * len(inputs)
+        if not inputs:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(inputs))) as executor:
+            futures = {executor.submit(self.call, fn, item): i for i, item in enumerate(inputs)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+
+# 所有DeepSeek请求共用的控制器，共享同一个速率限制
+_shared_controller = None
+_shared_lock = threading.Lock()
+
+# 获取共用的控制器，第一次调用时按传入的参数创建
+def get_shared_controller(**kwargs):
+    global _shared_controller
+    with _shared_lock:
+        if _shared_controller is None:
+            _shared_controller = AdaptiveConcurrencyController(**kwargs)
+        return _shared_controller
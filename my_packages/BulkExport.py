@@ -0,0 +1,282 @@
+import os
+import re
+import csv
+import sys
+import argparse
+
+from my_packages.MyNeo4j import (
+    BASE_ENTITY_LABEL, UNKNOWN_LABEL, MAX_DESCRIPTION_SENTENCES,
+    description_sentences, join_descriptions, normalize_relationship_type
+)
+
+# 离线批量导出：初次构建时不通过Cypher逐批MERGE写入Neo4j，而是把文档、Chunk、实体及它们之间的关系
+# 写成neo4j-admin database import使用的CSV结点文件和关系文件，再用离线导入工具一次性建库。
+# 实体的描述（按句子哈希去重、限制句子数）和标签（'未知'与确定类型的合并）在Python中按MyNeo4jGraph的规则合并，
+# 导入后的图与逐批写入的结果相同。
+# 文档、Chunk及其关系和MENTIONS关系边生成边写入文件，实体和实体之间的关系在close()时写入。
+# 导入命令写在输出目录的import.sh中，python -m my_packages.BulkExport verify DIR 检查生成的文件。
+
+# 数组属性（包括:LABEL列）的元素分隔符，句子中可能有分号，使用不会出现在文本中的单元分隔符
+ARRAY_DELIMITER = "\x1f"
+ARRAY_DELIMITER_OPTION = "U+001F"
+
+DOCUMENT_LABEL = "__Document__"
+CHUNK_LABEL = "__Chunk__"
+
+# 结点文件：文件名 -> 表头
+NODE_FILES = {
+    "documents.csv": ["fileName:ID(Document)", "type", "uri", "contentHash", ":LABEL"],
+    "chunks.csv": [
+        "id:ID(Chunk)", "text", "position:int", "length:int", "fileName",
+        "content_offset:int", "tokens:int", "extracted:boolean", ":LABEL"
+    ],
+    "entities.csv": None,  # 表头取决于实体的属性，写入时生成
+}
+# 关系文件：文件名 -> 表头
+RELATIONSHIP_FILES = {
+    "part_of.csv": [":START_ID(Chunk)", ":END_ID(Document)", "position:int", "content_offset:int", ":TYPE"],
+    "first_chunk.csv": [":START_ID(Document)", ":END_ID(Chunk)", ":TYPE"],
+    "next_chunk.csv": [":START_ID(Chunk)", ":END_ID(Chunk)", "fileName", ":TYPE"],
+    "mentions.csv": [":START_ID(Chunk)", ":END_ID(Entity)", ":TYPE"],
+    "relationships.csv": None,
+}
+
+# 导入后需要建立的约束，与MyNeo4jGraph.add_graph_documents建立的相同
+POST_IMPORT_CYPHER = [
+    f"CREATE CONSTRAINT IF NOT EXISTS FOR (b:{BASE_ENTITY_LABEL}) REQUIRE b.id IS UNIQUE;",
+]
+
+def _array(values):
+    return ARRAY_DELIMITER.join(value.replace(ARRAY_DELIMITER, " ") for value in values)
+
+# 一列属性的类型：全部为数字时为float，否则为字符串
+def _property_header(key, values):
+    if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return f"{key}:float"
+    return key
+
+# 合并中的实体：标签、其它属性、描述句子
+class _Entity:
+    __slots__ = ("types", "properties", "hashes", "texts", "described")
+
+    def __init__(self):
+        self.types = []
+        self.properties = {}
+        self.hashes = []
+        self.texts = []
+        self.described = False  # 只由关系创建的实体没有description属性
+
+    def labels(self):
+        types = self.types
+        if UNKNOWN_LABEL in types and len(types) > 1:
+            types = [t for t in types if t != UNKNOWN_LABEL]
+        return [BASE_ENTITY_LABEL] + types
+
+class BulkImportWriter:
+    def __init__(self, directory, max_description_sentences=MAX_DESCRIPTION_SENTENCES):
+        self.directory = directory
+        self.max_description_sentences = max_description_sentences
+        os.makedirs(directory, exist_ok=True)
+        self._files = {}
+        self._writers = {}
+        self.counts = {}
+        for name, header in {**NODE_FILES, **RELATIONSHIP_FILES}.items():
+            if header is not None:
+                self._open(name, header)
+        self._documents = set()
+        self._chunks = set()
+        self._part_of = set()
+        self._next_chunk = set()
+        self._mentions = set()
+        self._entities = {}
+        self._relationships = {}
+
+    def _open(self, name, header):
+        self._files[name] = open(os.path.join(self.directory, name), "w", encoding="utf-8", newline="")
+        self._writers[name] = csv.writer(self._files[name], lineterminator="\n")
+        self._writers[name].writerow(header)
+        self.counts[name] = 0
+
+    def _write(self, name, row):
+        self._writers[name].writerow(row)
+        self.counts[name] += 1
+
+    def add_document(self, file_name, type, uri, content_hash=None):
+        if file_name in self._documents:
+            return
+        self._documents.add(file_name)
+        self._write("documents.csv", [file_name, type, uri, content_hash or "", DOCUMENT_LABEL])
+
+    # chunk_rows和relationships为GraphAbout.build_chunk_rows返回的Chunk结点属性列表和关系列表，
+    # extracted为提取结果已经得到的chunk_id（写入extracted属性），提取完成后调用。
+    # 与GraphAbout.create_relation_between_chunks相同：内容相同的Chunk是同一个结点，只写入第一次出现时的属性，
+    # 每个文件中的位置写在PART_OF关系上，NEXT_CHUNK关系带有所属文件名
+    def add_chunks(self, file_name, chunk_rows, relationships, extracted=()):
+        for row in chunk_rows:
+            if row["id"] not in self._chunks:
+                self._chunks.add(row["id"])
+                self._write("chunks.csv", [
+                    row["id"], row["pg_content"], row["position"], row["length"], row["f_name"],
+                    row["content_offset"], row["tokens"], "true" if row["id"] in extracted else "false", CHUNK_LABEL
+                ])
+            if (row["id"], file_name) not in self._part_of:
+                self._part_of.add((row["id"], file_name))
+                self._write("part_of.csv", [row["id"], file_name, row["position"], row["content_offset"], "PART_OF"])
+        for relationship in relationships:
+            if relationship["type"] == "FIRST_CHUNK":
+                self._write("first_chunk.csv", [file_name, relationship["chunk_id"], "FIRST_CHUNK"])
+            else:
+                key = (relationship["previous_chunk_id"], relationship["current_chunk_id"], file_name)
+                if key not in self._next_chunk:
+                    self._next_chunk.add(key)
+                    self._write("next_chunk.csv", [*key, "NEXT_CHUNK"])
+
+    def _entity(self, entity_id):
+        entity = self._entities.get(entity_id)
+        if entity is None:
+            entity = self._entities[entity_id] = _Entity()
+        return entity
+
+    # 加入一个Chunk的提取结果，合并规则与MyNeo4jGraph.add_graph_documents(baseEntityLabel=True)相同：
+    # 类型标签累加，有确定类型后去掉'未知'；描述按句子哈希去重追加，不超过句子数上限；其它属性后写入的覆盖先写入的；
+    # 实体之间的关系以(源, 目标, 类型)合并，属性取第一次出现时的值
+    def add_graph_document(self, graph_document):
+        chunk_id = graph_document.source.metadata["chunk_id"]
+        for node in graph_document.nodes:
+            entity = self._entity(node.id)
+            node_type = node.type.replace("`", "")
+            if node_type and node_type not in entity.types:
+                entity.types.append(node_type)
+            properties = dict(node.properties)
+            description = properties.pop("description", None)
+            entity.properties.update(properties)
+            entity.described = True
+            for sentence in description_sentences(description):
+                if self.max_description_sentences is not None and len(entity.hashes) >= self.max_description_sentences:
+                    break
+                if sentence["hash"] not in entity.hashes:
+                    entity.hashes.append(sentence["hash"])
+                    entity.texts.append(sentence["text"])
+            if (chunk_id, node.id) not in self._mentions:
+                self._mentions.add((chunk_id, node.id))
+                self._write("mentions.csv", [chunk_id, node.id, "MENTIONS"])
+        for el in graph_document.relationships:
+            self._entity(el.source.id)
+            self._entity(el.target.id)
+            key = (el.source.id, el.target.id, normalize_relationship_type(el.type))
+            if key not in self._relationships:
+                self._relationships[key] = dict(el.properties)
+
+    def _write_entities(self):
+        keys = sorted({key for entity in self._entities.values() for key in entity.properties})
+        headers = [
+            _property_header(key, [e.properties[key] for e in self._entities.values() if key in e.properties])
+            for key in keys
+        ]
+        self._open("entities.csv", [
+            "id:ID(Entity)", "description", "descriptions:string[]", "description_hashes:string[]",
+            *headers, ":LABEL"
+        ])
+        for entity_id, entity in self._entities.items():
+            row = [entity_id]
+            if entity.described:
+                row += [join_descriptions(entity.texts), _array(entity.texts), _array(entity.hashes)]
+            else:
+                row += ["", "", ""]
+            row += [entity.properties.get(key, "") for key in keys]
+            row.append(_array(entity.labels()))
+            self._write("entities.csv", row)
+
+    def _write_relationships(self):
+        keys = sorted({key for properties in self._relationships.values() for key in properties})
+        headers = [
+            _property_header(key, [p[key] for p in self._relationships.values() if key in p])
+            for key in keys
+        ]
+        self._open("relationships.csv", [":START_ID(Entity)", ":END_ID(Entity)", ":TYPE", *headers])
+        for (source, target, rel_type), properties in self._relationships.items():
+            self._write("relationships.csv", [source, target, rel_type] + [properties.get(key, "") for key in keys])
+
+    # neo4j-admin database import命令，在输出目录中执行
+    def import_command(self, database="neo4j"):
+        return " ".join([
+            "neo4j-admin database import full",
+            "--overwrite-destination",
+            "--multiline-fields=true",
+            f"--array-delimiter={ARRAY_DELIMITER_OPTION}",
+            *(f"--nodes={name}" for name in NODE_FILES),
+            *(f"--relationships={name}" for name in RELATIONSHIP_FILES),
+            database,
+        ])
+
+    # 写入实体和实体之间的关系、导入脚本，关闭所有文件，返回各文件的行数
+    def close(self, database="neo4j"):
+        self._write_entities()
+        self._write_relationships()
+        for file in self._files.values():
+            file.close()
+        with open(os.path.join(self.directory, "import.sh"), "w", encoding="utf-8") as f:
+            f.write("#!/bin/sh\n")
+            f.write('cd "$(dirname "$0")"\n')
+            f.write(self.import_command(database) + "\n")
+            f.write("# 导入后在数据库中执行:\n")
+            for statement in POST_IMPORT_CYPHER:
+                f.write(f"# {statement}\n")
+        return dict(self.counts)
+
+_ID_COLUMN = re.compile(r"^(?:[^:]*):ID\((\w+)\)$")
+_START_COLUMN = re.compile(r"^:START_ID\((\w+)\)$")
+_END_COLUMN = re.compile(r"^:END_ID\((\w+)\)$")
+
+# 检查生成的文件：结点id在各自的id空间中唯一，关系的起点和终点都存在，
+# 每行的列数与表头相同。返回问题列表，没有问题时为空列表
+def verify(directory):
+    problems = []
+    ids = {}
+    def rows(name):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            problems.append(f"{name}: 文件不存在")
+            return
+        with open(path, encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            for line, row in enumerate(reader, start=2):
+                if len(row) != len(header):
+                    problems.append(f"{name}:{line}: 列数{len(row)}与表头{len(header)}不同")
+                    continue
+                yield header, row
+    for name in NODE_FILES:
+        for header, row in rows(name):
+            space = _ID_COLUMN.match(header[0]).group(1)
+            space_ids = ids.setdefault(space, set())
+            if row[0] in space_ids:
+                problems.append(f"{name}: 重复的结点id {row[0]}")
+            space_ids.add(row[0])
+    for name in RELATIONSHIP_FILES:
+        for header, row in rows(name):
+            start = _START_COLUMN.match(header[0]).group(1)
+            end = _END_COLUMN.match(header[1]).group(1)
+            if row[0] not in ids.get(start, ()):
+                problems.append(f"{name}: 起点不存在 {start} {row[0]}")
+            if row[1] not in ids.get(end, ()):
+                problems.append(f"{name}: 终点不存在 {end} {row[1]}")
+    return problems
+
+# 命令行工具：检查导出的文件
+# python -m my_packages.BulkExport verify DIR
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查导出的neo4j-admin导入文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser("verify", help="检查结点id唯一、关系两端存在")
+    verify_parser.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    problems = verify(args.directory)
+    for problem in problems[:100]:
+        print(problem)
+    print(f"问题数: {len(problems)}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
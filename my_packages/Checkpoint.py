@@ -0,0 +1,105 @@
+import os
+import time
+import sqlite3
+import threading
+
+# 实体关系提取阶段的断点记录
+# 每个Chunk记录一行：chunk_id、所属文件、状态（pending/done/failed）、LLM原始输出和错误信息，
+# 每个请求完成后立即提交。程序中断后以--resume重新运行时，已完成的Chunk直接使用记录的输出，
+# 只重新请求未完成的Chunk，中断最多损失当时正在进行中的请求。
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+class ExtractionCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                file_name TEXT,
+                status TEXT NOT NULL,
+                output TEXT,
+                error TEXT,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    # 开始新的一次运行：清空旧的记录，并记录本次运行的提示词指纹
+    def start(self, prompt_key):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('prompt_key', ?)", (prompt_key,))
+            self._conn.commit()
+
+    # 继续上一次运行，提示词指纹不一致时旧的输出不能复用
+    def resume(self, prompt_key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'prompt_key'").fetchone()
+        if row is not None and row[0] != prompt_key:
+            raise ValueError("checkpoint was written with a different prompt; start a new run instead of resuming.")
+        if row is None:
+            self.start(prompt_key)
+
+    # 返回已完成Chunk的{chunk_id: LLM原始输出}
+    def get_completed(self, chunk_ids):
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        found = {}
+        with self._lock:
+            # 分批查询，避免超过SQLite的参数个数限制
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, output FROM chunks WHERE status = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [DONE, *batch]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    # 记录即将请求的Chunk，items为(chunk_id, 文件名)的列表
+    def mark_pending(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, NULL, NULL, ?) "
+                "ON CONFLICT(chunk_id) DO UPDATE SET status = excluded.status, updated = excluded.updated "
+                "WHERE chunks.status <> 'done'",
+                [(chunk_id, file_name, PENDING, now) for chunk_id, file_name in items]
+            )
+            self._conn.commit()
+
+    def mark_done(self, chunk_id, output):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chunks SET status = ?, output = ?, error = NULL, updated = ? WHERE chunk_id = ?",
+                (DONE, output, time.time(), chunk_id)
+            )
+            self._conn.commit()
+
+    def mark_failed(self, chunk_id, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chunks SET status = ?, error = ?, updated = ? WHERE chunk_id = ?",
+                (FAILED, error, time.time(), chunk_id)
+            )
+            self._conn.commit()
+
+    # 各状态的Chunk数
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, count(*) FROM chunks GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
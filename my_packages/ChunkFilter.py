@@ -0,0 +1,49 @@
+import re
+
+# 提取前的Chunk预筛选
+# 爬取的数据中有很多不含医学实体的Chunk（导航、公告、免责声明等），每个仍要花费一次完整的提取请求。
+# 这里用关键词密度（每100个字符中命中医学关键词的次数）给Chunk打分，只用CPU，
+# 低于阈值的Chunk跳过或放到任务队列的最后。关键词来自实体类型列表的名称和说明中的示例，
+# 再加上常见的医学词素。
+
+# 常见的医学词素，补充实体类型列表中的示例
+MEDICAL_KEYWORDS = [
+    "疾病", "病症", "病因", "病变", "症状", "炎症", "癌症", "肿瘤", "综合征", "损伤", "梗死", "梗塞", "出血",
+    "血栓", "栓塞", "缺血", "感染", "患者", "病人", "医生", "医师", "护士", "医院", "门诊", "住院", "临床",
+    "诊断", "治疗", "手术", "康复", "护理", "检查", "药物", "用药", "剂量", "服用", "口服", "注射", "输液",
+    "疗效", "副作用", "不良反应", "禁忌", "血压", "血糖", "血脂", "胆固醇", "心率", "大脑", "脑部", "心脏",
+    "肝脏", "肾脏", "肺部", "血管", "动脉", "静脉", "神经", "细胞", "蛋白", "基因", "激素", "代谢", "免疫",
+    "预防", "预后", "死亡率", "发病率", "患病率",
+]
+
+# 关键词的最短长度，单个汉字（如"心"、"药"）在开心、安心、药店等普通词中也会命中，不作为关键词
+MIN_KEYWORD_LENGTH = 2
+
+# 从类型字典列表中提取关键词：类型名称，以及说明中"如"后面以"、"分隔的示例
+def vocabulary_from_types(types):
+    keywords = []
+    for t in types:
+        keywords.append(t["name"])
+        _, found, examples = t["description"].partition("如")
+        if found:
+            for example in re.split(r"[、，,]", examples):
+                example = example.strip().removesuffix("等").strip()
+                if example:
+                    keywords.append(example)
+    return keywords
+
+class KeywordFilter:
+    def __init__(self, keywords, min_density=2.0):
+        # 长的关键词优先匹配，避免"脑卒中"中的"卒中"重复计数
+        keywords = sorted({k for k in keywords if len(k) >= MIN_KEYWORD_LENGTH}, key=len, reverse=True)
+        if not keywords:  # 参数检查，空的模式会匹配每个位置
+            raise ValueError(f"keywords must include at least one keyword of {MIN_KEYWORD_LENGTH} or more characters.")
+        self._pattern = re.compile("|".join(re.escape(keyword) for keyword in keywords))
+        self.min_density = min_density
+
+    # 关键词密度：每100个非空白字符中命中关键词的次数
+    def score(self, text):
+        length = len("".join(text.split()))
+        if length <= 0:
+            return 0.0
+        return len(self._pattern.findall(text)) * 100 / length
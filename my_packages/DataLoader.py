@@ -1,11 +1,29 @@
 import os
-import hanlp
+import mmap
 import codecs
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
 
-# 读入测试文件。
-def read_txt_files(directory):
-    # 存放结果的列表
-    results = []
+# 大于该字节数的文件使用mmap读取，直接从映射的内存解码，不再额外复制一份原始字节
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# 读入单个文件的内容
+def read_txt_file(file_path, mmap_threshold=MMAP_THRESHOLD):
+    size = os.path.getsize(file_path)
+    if size > 0 and size >= mmap_threshold:
+        with open(file_path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return str(mapped, 'utf-8')
+    with codecs.open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+# 逐个读入测试文件，每次产出[文件名, 文件内容]，调用方处理完一个文件后即可释放其内容。
+# 文件名为相对于directory的路径（以"/"分隔），不同子目录中的同名文件不会混淆；
+# 直接位于directory中的文件与原来一样只有文件名。
+def iter_txt_files(directory, mmap_threshold=MMAP_THRESHOLD):
     # 递归遍历目录
     for root, _, files in os.walk(directory):
         for filename in files:
@@ -15,26 +33,51 @@ def read_txt_files(directory):
                 file_path = os.path.join(root, filename)
                 try:
                     # 打开并读取文件内容
-                    with codecs.open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                    # 将文件名和内容以列表形式添加到结果列表
-                        results.append([filename, content])
+                    content = read_txt_file(file_path, mmap_threshold)
                 except Exception as e:
                     print(f"读取文件 {file_path} 时出错: {e}")
+                    continue
+                # 将相对路径和内容以列表形式产出
+                yield [os.path.relpath(file_path, directory).replace(os.sep, "/"), content]
+
+# 读入测试文件。
+def read_txt_files(directory):
+    # 存放结果的列表
+    results = list(iter_txt_files(directory))
     
     return results
 
 # 文本分块
 # 单任务模型，分词，token的计数是计算词，包括标点符号。
-tokenizer = hanlp.load(hanlp.pretrained.tok.COARSE_ELECTRA_SMALL_ZH)
+# 分词模型在第一次使用时才加载，只导入本模块（如只调用read_txt_files）时不加载模型。
+# 分词模型名称，同时作为分词缓存中的模型标识
+TOKENIZER_MODEL = 'COARSE_ELECTRA_SMALL_ZH'
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+# 获取分词器，未加载时加载HanLP分词模型。
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                import hanlp
+                _tokenizer = hanlp.load(getattr(hanlp.pretrained.tok, TOKENIZER_MODEL))
+    return _tokenizer
+
+# 注入自定义分词器，传入None则恢复为按需加载的HanLP模型。
+# 分词器需可调用：输入字符串时返回token列表，输入字符串列表时返回各自的token列表，
+# 并接受batch_size关键字参数。
+def set_tokenizer(tokenizer):
+    global _tokenizer
+    with _tokenizer_lock:
+        _tokenizer = tokenizer
 
 # 划分段落。
 def split_into_paragraphs(text):
     text = text.replace('\r', '\n')
     
-    paragraphs = text.split('\n')
-    while '' in paragraphs:
-        paragraphs.remove('')
+    paragraphs = [paragraph for paragraph in text.split('\n') if paragraph != '']
         
     return paragraphs
 
@@ -42,63 +85,237 @@ def split_into_paragraphs(text):
 def is_sentence_end(token):
     return token in ['。', '！', '？']
 
-# 向后查找到句子结束符，用于动态调整chunk划分以保证chunk以完整的句子结束
-def find_sentence_boundary_forward(tokens, chunk_size):
-    end = len(tokens)  # 默认的end值设置为tokens的长度
-    for i in range(chunk_size, len(tokens)):  # 从chunk_size开始向后查找
-        if is_sentence_end(tokens[i]):
-            end = i + 1  # 包含句尾符号
-            break
-    return end  
-
-# 从位置start开始向前寻找上一句的句子结束符，以保证分块重叠的部分从一个完整的句子开始。
-def find_sentence_boundary_backward(tokens, start):
-    for i in range(start - 1, -1, -1):
-        if is_sentence_end(tokens[i]):
-            return i + 1  # 包含句尾符号
-    return 0  # 找不到
-  
+# 分词结果的扁平表示，整篇文本只分词一次，之后分块只在下标上进行。
+# tokens：所有段落的token依次拼接成的列表
+# content：所有token拼接成的文本
+# offsets：offsets[i]为第i个token在拼接文本中的字符偏移，最后一项为拼接文本的总长度
+# paragraph_ends：每个段落结束处（不含）的token下标
+# sentence_ends：句子结束符所在的token下标，升序排列，用于二分查找句子边界
+class TokenizedText:
+    __slots__ = ("tokens", "content", "offsets", "paragraph_ends", "sentence_ends")
+
+    def __init__(self, paragraph_tokens):
+        self.tokens = []
+        self.paragraph_ends = array('q')
+        for tokens in paragraph_tokens:
+            self.tokens.extend(tokens)
+            self.paragraph_ends.append(len(self.tokens))
+        self.content = ''.join(self.tokens)
+        self.offsets = array('q', [0])
+        self.offsets.extend(accumulate(map(len, self.tokens)))
+        self.sentence_ends = array('q', [i for i, token in enumerate(self.tokens) if is_sentence_end(token)])
+
+    def __len__(self):
+        return len(self.tokens)
+
+    # 取出下标范围[start, end)内token拼接成的文本
+    def text(self, start, end):
+        return self.content[self.offsets[start]:self.offsets[end]]
+
+# 文本块，只保存所属文本的引用、字符偏移和token数，文本在需要时才从所属文本中截取。
+# 同一文件的所有文本块共享一个所属文本，块间重叠的部分不会重复存储。
+class Chunk:
+    __slots__ = ("source", "start", "end", "token_count")
+
+    def __init__(self, source, start, end, token_count):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.token_count = token_count
+
+    # 文本块的内容
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+    # 文本块的字符数
+    @property
+    def length(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Chunk(start={self.start}, end={self.end}, token_count={self.token_count})"
+
+# 由分词结果和下标范围生成Chunk对象
+def make_chunks(tokenized, spans):
+    offsets = tokenized.offsets
+    return [Chunk(tokenized.content, offsets[start], offsets[end], end - start) for start, end in spans]
+
+# 在[start, stop)范围内向后查找第一个句子结束符，返回句子结束后的位置，用于保证chunk以完整的句子结束。
+# 找不到时返回stop。
+def find_sentence_boundary_forward(sentence_ends, start, stop):
+    i = bisect_left(sentence_ends, start)
+    if i < len(sentence_ends) and sentence_ends[i] < stop:
+        return sentence_ends[i] + 1  # 包含句尾符号
+    return stop
+
+# 在[lower, start)范围内向前查找上一句的句子结束符，以保证分块重叠的部分从一个完整的句子开始。
+# 找不到时返回None。
+def find_sentence_boundary_backward(sentence_ends, lower, start):
+    i = bisect_left(sentence_ends, start) - 1
+    if i >= 0 and sentence_ends[i] >= lower:
+        return sentence_ends[i] + 1  # 包含句尾符号
+    return None  # 找不到
+
 # 文本分块，文本块的参考大小为chunk_size，文本块之间重叠部分的参考大小为overlap。
 # 为了保证文本块之间重叠的部分及文本块末尾截断的部分都是完整的句子，
 # 文本块的大小和重叠部分的大小都是根据当前文本块的内容动态调整的，是浮动的值。
-def chunk_text(text, chunk_size=500, overlap=80):
+# 返回各文本块在tokenized.tokens中的下标范围(start, end)。
+def chunk_spans(tokenized, chunk_size=500, overlap=80):
     if chunk_size <= overlap:  # 参数检查
         raise ValueError("chunk_size must be greater than overlap.")
-    # 先划分为段落，段落保存了语义上的信息，整个段落去处理。  
-    paragraphs = split_into_paragraphs(text)
-    chunks = []
-    buffer = []
+    sentence_ends = tokenized.sentence_ends
+    paragraph_ends = tokenized.paragraph_ends
+    spans = []
+    # 当前缓冲区为token下标范围[start, filled)
+    start = 0
+    filled = 0
     # 逐个段落处理
     i = 0
-    while i < len(paragraphs):
-        # 注满buffer，直到大于chunk_szie，整个段落读入，段落保存了语义上的信息。
-        while len(buffer) < chunk_size and i < len(paragraphs):
-            tokens = tokenizer(paragraphs[i])
-            buffer.extend(tokens)
+    while True:
+        # 注满缓冲区，直到大于chunk_size，整个段落读入，段落保存了语义上的信息。
+        while filled - start < chunk_size and i < len(paragraph_ends):
+            filled = paragraph_ends[i]
             i += 1
-        # 当前buffer分块
-        while len(buffer) >= chunk_size:
+        # 当前缓冲区分块
+        while filled - start >= chunk_size:
             # 保证从完整的句子处截断。
-            end = find_sentence_boundary_forward(buffer, chunk_size)
-            chunk = buffer[:end]
-            chunks.append(chunk)  # 保留token的状态以便后面计数
+            end = find_sentence_boundary_forward(sentence_ends, start + chunk_size, filled)
+            spans.append((start, end))
             # 保证重叠的部分从完整的句子开始。
-            start_next = find_sentence_boundary_backward(buffer, end - overlap)
-            if start_next==0:  # 找不到了上一句的句子结束符，调整重叠范围再找一次。
-                start_next = find_sentence_boundary_backward(buffer, end-1)
-            if start_next==0:  # 真的找不到，放弃块首的完整句子重叠。
+            start_next = find_sentence_boundary_backward(sentence_ends, start, end - overlap)
+            if start_next is None:  # 找不到了上一句的句子结束符，调整重叠范围再找一次。
+                start_next = find_sentence_boundary_backward(sentence_ends, start, end - 1)
+            if start_next is None:  # 真的找不到，放弃块首的完整句子重叠。
                 start_next = end - overlap
-            buffer=buffer[start_next:]
+            start = start_next
+        if i >= len(paragraph_ends):
+            break
         
-    if buffer:  # 如果缓冲区还有剩余的token
-        if len(chunks) > 0:
+    if start < filled:  # 如果缓冲区还有剩余的token
+        if len(spans) > 0:
             # 检查一下剩余部分是否已经包含在最后一个分块之中，它只是留作块间重叠。
-            last_chunk = chunks[len(chunks)-1]
-            rest = ''.join(buffer)
-            temp = ''.join(last_chunk[len(last_chunk)-len(rest):])
-            if temp!=rest:   # 如果不是留作重叠，则是最后的一个分块。
-                chunks.append(buffer)
+            last_start, last_end = spans[-1]
+            rest = tokenized.text(start, filled)
+            # 与逐token列表切片的规则保持一致：按剩余文本的字符数截取最后一个分块末尾的token
+            tail = range(last_start, last_end)[(last_end - last_start) - len(rest):]
+            temp = tokenized.text(tail.start, tail.stop)
+            if temp != rest:   # 如果不是留作重叠，则是最后的一个分块。
+                spans.append((start, filled))
         else:
-            chunks.append(buffer)
+            spans.append((start, filled))
+    
+    return spans
+
+# 分词并分块，返回分词结果及各文本块的下标范围。
+# batch_size不为None时，先把所有段落成批送入分词器。tokenizer为None时使用get_tokenizer()返回的分词器。
+# cache为TokenCache对象时，先从缓存中查找段落的分词结果，只对未命中的段落分词。
+def chunk_text_spans(text, chunk_size=500, overlap=80, batch_size=None, tokenizer=None, cache=None):
+    if chunk_size <= overlap:  # 参数检查
+        raise ValueError("chunk_size must be greater than overlap.")
+    # 先划分为段落，段落保存了语义上的信息，整个段落去处理。  
+    paragraphs = split_into_paragraphs(text)
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+    if batch_size is None and cache is None:
+        paragraph_tokens = (tokenizer(paragraph) for paragraph in paragraphs)
+    else:
+        paragraph_tokens = tokenize_paragraphs(paragraphs, batch_size or 1, tokenizer, cache)
+    tokenized = TokenizedText(paragraph_tokens)
+    return tokenized, chunk_spans(tokenized, chunk_size, overlap)
+
+# 文本分块，返回各文本块的token列表。
+def chunk_text(text, chunk_size=500, overlap=80, batch_size=None, tokenizer=None, cache=None):
+    tokenized, spans = chunk_text_spans(text, chunk_size, overlap, batch_size, tokenizer, cache)
+    return [tokenized.tokens[start:end] for start, end in spans]
+
+# 批量分词，一次把多个段落送入分词器，减少模型前向计算的次数。
+# cache不为None时，只有缓存未命中的段落才送入分词器，分词结果写回缓存。
+def tokenize_paragraphs(paragraphs, batch_size=32, tokenizer=None, cache=None):
+    if batch_size < 1:  # 参数检查
+        raise ValueError("batch_size must be at least 1.")
+    paragraphs = list(paragraphs)
+    if not paragraphs:
+        return []
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+    if cache is None:
+        return tokenizer(paragraphs, batch_size=batch_size)
+    
+    results = cache.get_many(paragraphs)
+    missing = [i for i, tokens in enumerate(results) if tokens is None]
+    if missing:
+        missing_paragraphs = [paragraphs[i] for i in missing]
+        missing_tokens = tokenizer(missing_paragraphs, batch_size=batch_size)
+        for i, tokens in zip(missing, missing_tokens):
+            results[i] = tokens
+        cache.put_many(missing_paragraphs, missing_tokens)
+    return results
+
+# 多个文件的文本批量分块，所有文件的段落合并后一起分词，按输入顺序返回各文件的Chunk列表。
+def chunk_texts(texts, chunk_size=500, overlap=80, batch_size=32, tokenizer=None, cache=None):
+    if chunk_size <= overlap:  # 参数检查
+        raise ValueError("chunk_size must be greater than overlap.")
+    # 记录每个文件的段落在合并列表中的范围
+    all_paragraphs = []
+    spans = []
+    for text in texts:
+        paragraphs = split_into_paragraphs(text)
+        spans.append((len(all_paragraphs), len(all_paragraphs) + len(paragraphs)))
+        all_paragraphs.extend(paragraphs)
+    
+    all_tokens = tokenize_paragraphs(all_paragraphs, batch_size, tokenizer, cache)
     
-    return chunks
+    results = []
+    for start, end in spans:
+        tokenized = TokenizedText(all_tokens[start:end])
+        results.append(make_chunks(tokenized, chunk_spans(tokenized, chunk_size, overlap)))
+    return results
+
+# 多进程分块的子进程初始化，每个子进程持有自己的分词器。
+# tokenizer为None时子进程在第一次分词时自行加载HanLP模型。
+def _init_chunk_worker(tokenizer):
+    set_tokenizer(tokenizer)
+
+# 子进程中对一组文件分块，同时返回子进程中缓存的命中与未命中次数
+def _chunk_texts_worker(texts, chunk_size, overlap, batch_size, cache):
+    results = chunk_texts(texts, chunk_size, overlap, batch_size, cache=cache)
+    if cache is None:
+        return results, 0, 0
+    cache.close()
+    return results, cache.hits, cache.misses
+
+# 多进程分块，将文件按顺序分组后分配给进程池，结果仍按输入文件的顺序返回。
+# workers为1时在当前进程中串行分块。自定义的tokenizer需要能被pickle。
+# 使用cache时，各子进程分别打开缓存数据库，命中与未命中次数汇总到传入的cache对象上。
+def parallel_chunk_texts(texts, chunk_size=500, overlap=80, batch_size=32, workers=1, tokenizer=None, cache=None):
+    if chunk_size <= overlap:  # 参数检查
+        raise ValueError("chunk_size must be greater than overlap.")
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    texts = list(texts)
+    if workers == 1 or len(texts) <= 1:
+        return chunk_texts(texts, chunk_size, overlap, batch_size, tokenizer, cache)
+    
+    # 每个进程分到若干组，组内的文件一起批量分词
+    group_count = min(len(texts), workers * 4)
+    group_size = -(-len(texts) // group_count)
+    groups = [texts[i:i + group_size] for i in range(0, len(texts), group_size)]
+    
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(groups)),
+        initializer=_init_chunk_worker,
+        initargs=(tokenizer,)
+    ) as executor:
+        futures = [
+            executor.submit(_chunk_texts_worker, group, chunk_size, overlap, batch_size, cache)
+            for group in groups
+        ]
+        for future in futures:
+            group_results, hits, misses = future.result()
+            results.extend(group_results)
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+    return results
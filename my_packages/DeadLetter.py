@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+
+# 提取失败的Chunk的持久化记录（死信队列）
+# 重试后仍然失败（请求出错或输出无法解析）的Chunk记录chunk_id、所属文件、文本、token数、错误信息和失败次数，
+# 不影响其它Chunk继续处理。之后用python create.py --retry-failed只重新处理这些Chunk，成功后删除记录。
+# 与断点记录不同，死信记录在新的一次运行开始时不会被清空。
+
+class DeadLetterQueue:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                chunk_id TEXT PRIMARY KEY,
+                file_name TEXT,
+                text TEXT NOT NULL,
+                token_count INTEGER NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL,
+                first_failed REAL NOT NULL,
+                last_failed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        # 已有记录的chunk_id，成功处理的Chunk不在其中时不必访问数据库
+        self._ids = {row[0] for row in self._conn.execute("SELECT chunk_id FROM dead_letters")}
+
+    # 记录一个失败的Chunk，已有记录时累加失败次数
+    def add(self, chunk_id, file_name, text, token_count, error):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO dead_letters VALUES (?, ?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(chunk_id) DO UPDATE SET file_name = excluded.file_name, error = excluded.error, "
+                "attempts = dead_letters.attempts + 1, last_failed = excluded.last_failed",
+                (chunk_id, file_name, text, token_count, error, now, now)
+            )
+            self._conn.commit()
+            self._ids.add(chunk_id)
+
+    # 删除已成功处理的Chunk的记录
+    def remove(self, chunk_ids):
+        with self._lock:
+            chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in self._ids]
+            if not chunk_ids:
+                return
+            self._conn.executemany("DELETE FROM dead_letters WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+            self._conn.commit()
+            self._ids.difference_update(chunk_ids)
+
+    # 返回所有记录，元素为(chunk_id, 文件名, 文本, token数)
+    def get_all(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chunk_id, file_name, text, token_count FROM dead_letters ORDER BY file_name, first_failed"
+            ).fetchall()
+
+    def count(self):
+        with self._lock:
+            return len(self._ids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# 命令行工具：查看或清空死信记录
+# python -m my_packages.DeadLetter [--path PATH] list|show|clear
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看或清空提取失败的Chunk记录")
+    parser.add_argument("--path", default="./cache/dead_letters.sqlite", help="死信记录数据库路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="列出失败的Chunk")
+    list_parser.add_argument("--limit", type=int, default=50)
+    show_parser = subparsers.add_parser("show", help="输出某个Chunk的文本和错误信息")
+    show_parser.add_argument("chunk_id")
+    subparsers.add_parser("clear", help="清空记录")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"记录文件不存在: {args.path}")
+        return 1
+    conn = DeadLetterQueue(args.path)._conn
+    try:
+        if args.command == "list":
+            print(f"总记录数: {conn.execute('SELECT count(*) FROM dead_letters').fetchone()[0]}")
+            rows = conn.execute(
+                "SELECT chunk_id, file_name, attempts, last_failed, error FROM dead_letters "
+                "ORDER BY last_failed DESC LIMIT ?", (args.limit,)
+            )
+            for chunk_id, file_name, attempts, last_failed, error in rows:
+                print(f"{chunk_id}  {file_name}  失败次数: {attempts}  "
+                      f"最近失败: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_failed))}  {error[:100]}")
+        elif args.command == "show":
+            row = conn.execute(
+                "SELECT file_name, error, text FROM dead_letters WHERE chunk_id = ?", (args.chunk_id,)
+            ).fetchone()
+            if row is None:
+                print("未找到该Chunk的记录")
+                return 1
+            file_name, error, text = row
+            print(f"文件: {file_name}")
+            print(f"错误: {error}")
+            print(text)
+        elif args.command == "clear":
+            deleted = conn.execute("DELETE FROM dead_letters").rowcount
+            conn.commit()
+            print(f"已删除记录数: {deleted}")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
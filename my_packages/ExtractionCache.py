@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+# 实体关系提取结果的持久化缓存
+# 以(提示词指纹, Chunk的SHA-1)为键保存LLM的原始输出，重新运行时命中的Chunk不再调用LLM。
+# 提示词指纹由系统提示词、用户提示词、实体与关系类型列表、模型名称等计算得到，
+# 任何一项改变都会得到新的指纹，旧的结果自动失效。
+# 缓存条目数超过max_entries时，按最近使用时间淘汰最旧的条目。
+# 条目数在打开数据库时统计一次，之后按插入和删除的行数增减，写入时不再逐次count(*)。
+
+# 计算提示词指纹，parts为参与计算的各项内容（需能序列化为JSON）
+def prompt_fingerprint(*parts):
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class ExtractionCache:
+    def __init__(self, path, prompt_key, max_entries=500000):
+        if max_entries < 1:  # 参数检查
+            raise ValueError("max_entries must be at least 1.")
+        self.path = path
+        self.prompt_key = prompt_key
+        self.max_entries = max_entries
+        # 命中与未命中计数
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS extractions (
+                    prompt_key TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (prompt_key, chunk_id)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions(last_used)")
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT count(*) FROM extractions").fetchone()[0]
+        return self._conn
+
+    # 批量查询，返回{chunk_id: LLM原始输出}，只包含命中的Chunk
+    def get_many(self, chunk_ids):
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        found = {}
+        if not unique_ids:
+            return found
+        with self._lock:
+            conn = self._connect()
+            # 分批查询，避免超过SQLite的参数个数限制
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT chunk_id, output FROM extractions "
+                    f"WHERE prompt_key = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [self.prompt_key, *batch]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE extractions SET last_used = ? WHERE prompt_key = ? AND chunk_id = ?",
+                    [(now, self.prompt_key, chunk_id) for chunk_id in found]
+                )
+                conn.commit()
+        self.hits += len(found)
+        self.misses += len(unique_ids) - len(found)
+        return found
+
+    # 批量写入，items为(chunk_id, LLM原始输出)的列表，超过容量时淘汰最久未使用的条目
+    def put_many(self, items):
+        now = time.time()
+        outputs = dict(items)  # 同一Chunk只保留最后一次的输出
+        rows = [(self.prompt_key, chunk_id, output, now, now) for chunk_id, output in outputs.items()]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            # 先插入新条目，插入的行数即新增的条目数；已有的条目再更新输出
+            inserted = conn.executemany("INSERT OR IGNORE INTO extractions VALUES (?, ?, ?, ?, ?)", rows).rowcount
+            if inserted < len(rows):
+                conn.executemany(
+                    "UPDATE extractions SET output = ?, last_used = ? WHERE prompt_key = ? AND chunk_id = ?",
+                    [(output, now, self.prompt_key, chunk_id) for chunk_id, output in outputs.items()]
+                )
+            self._count += inserted
+            self._count -= _evict(conn, self.max_entries, self._count)
+            conn.commit()
+
+    # 缓存统计信息
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            entries = self._count
+            current = conn.execute(
+                "SELECT count(*) FROM extractions WHERE prompt_key = ?", (self.prompt_key,)
+            ).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "current_prompt_entries": current,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# 条目数超过max_entries时删除最久未使用的条目，返回删除的条目数；count为当前条目数，为None时查询数据库
+def _evict(conn, max_entries, count=None):
+    if count is None:
+        count = conn.execute("SELECT count(*) FROM extractions").fetchone()[0]
+    if count <= max_entries:
+        return 0
+    return conn.execute(
+        "DELETE FROM extractions WHERE rowid IN (SELECT rowid FROM extractions ORDER BY last_used LIMIT ?)",
+        (count - max_entries,)
+    ).rowcount
+
+# 命令行工具：查看或清理缓存
+# python -m my_packages.ExtractionCache [--path PATH] stats|list|show|clear|evict
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看或清理实体关系提取结果缓存")
+    parser.add_argument("--path", default="./cache/extractions.sqlite", help="缓存数据库路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="按提示词指纹统计条目数")
+    list_parser = subparsers.add_parser("list", help="列出最近使用的条目")
+    list_parser.add_argument("--limit", type=int, default=20)
+    list_parser.add_argument("--prompt-key", help="只列出该提示词指纹下的条目")
+    show_parser = subparsers.add_parser("show", help="输出某个Chunk的缓存结果")
+    show_parser.add_argument("chunk_id")
+    clear_parser = subparsers.add_parser("clear", help="清空缓存")
+    clear_parser.add_argument("--prompt-key", help="只删除该提示词指纹下的条目")
+    clear_parser.add_argument("--keep", help="删除除该提示词指纹以外的所有条目")
+    evict_parser = subparsers.add_parser("evict", help="按最近使用时间淘汰条目")
+    evict_parser.add_argument("--max-entries", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"缓存文件不存在: {args.path}")
+        return 1
+    # 借用ExtractionCache建表，保证旧文件也有完整的表结构
+    conn = ExtractionCache(args.path, "")._connect()
+    try:
+        if args.command == "stats":
+            rows = conn.execute(
+                "SELECT prompt_key, count(*), max(last_used) FROM extractions "
+                "GROUP BY prompt_key ORDER BY max(last_used) DESC"
+            ).fetchall()
+            print(f"总条目数: {sum(row[1] for row in rows)}")
+            for prompt_key, count, last_used in rows:
+                print(f"{prompt_key}  条目数: {count}  最近使用: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_used))}")
+        elif args.command == "list":
+            query = "SELECT prompt_key, chunk_id, length(output), last_used FROM extractions"
+            params = []
+            if args.prompt_key:
+                query += " WHERE prompt_key = ?"
+                params.append(args.prompt_key)
+            query += " ORDER BY last_used DESC LIMIT ?"
+            params.append(args.limit)
+            for prompt_key, chunk_id, length, last_used in conn.execute(query, params):
+                print(f"{prompt_key[:12]}  {chunk_id}  输出长度: {length}  "
+                      f"最近使用: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_used))}")
+        elif args.command == "show":
+            rows = conn.execute(
+                "SELECT prompt_key, output FROM extractions WHERE chunk_id = ?", (args.chunk_id,)
+            ).fetchall()
+            if not rows:
+                print("未找到该Chunk的缓存结果")
+                return 1
+            for prompt_key, output in rows:
+                print(f"##### {prompt_key}")
+                print(output)
+        elif args.command == "clear":
+            if args.prompt_key:
+                deleted = conn.execute("DELETE FROM extractions WHERE prompt_key = ?", (args.prompt_key,)).rowcount
+            elif args.keep:
+                deleted = conn.execute("DELETE FROM extractions WHERE prompt_key <> ?", (args.keep,)).rowcount
+            else:
+                deleted = conn.execute("DELETE FROM extractions").rowcount
+            conn.commit()
+            print(f"已删除条目数: {deleted}")
+        elif args.command == "evict":
+            deleted = _evict(conn, args.max_entries)
+            conn.commit()
+            print(f"已淘汰条目数: {deleted}")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,10 @@
-import re
 import hashlib
 from typing import List
 from langchain_core.documents import Document
 from langchain_community.vectorstores import Neo4jVector
-from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
 
-from my_packages.MyNeo4j import MyNeo4jGraph
+from my_packages.MyNeo4j import MyNeo4jGraph, merge_descriptions
+from my_packages import ResultParser
 
 # 在Neo4j中创建文档与Chunk的图结构
 # 创建Document结点，与Chunk之间按属性名fileName匹配。
@@ -18,28 +17,79 @@ def create_Document(graph, type, uri, file_name):
     doc = graph.query(query,{"file_name":file_name,"type":type,"uri":uri})
     return doc
 
-#创建Chunk结点并建立Chunk之间及与Document之间的关系
-#这个程序直接从Neo4j KG Builder拷贝引用，为了增加tokens属性稍作修改。
-def create_relation_between_chunks(graph, file_name, chunks: List)->list:
+# 文件内容的哈希值，增量构建时用于判断文件是否修改
+def document_content_hash(content):
+    return hashlib.sha1(content.encode()).hexdigest()
+
+# 记录Document结点对应文件内容的哈希值，文件全部写入完成后调用
+def update_document_hash(graph, file_name, content_hash):
+    query = """
+    MATCH (d:`__Document__` {fileName :$file_name}) SET d.contentHash=$content_hash
+    """
+    graph.query(query,{"file_name":file_name,"content_hash":content_hash})
+
+# 读取数据库中已构建的文件清单，返回{文件相对路径: 内容哈希}，未记录哈希的文件值为None
+def get_document_manifest(graph):
+    query = """
+    MATCH (d:`__Document__`)
+    RETURN d.fileName AS fileName, d.contentHash AS contentHash
+    """
+    return {row["fileName"]: row["contentHash"] for row in graph.query(query)}
+
+# 删除文件对应的Document结点、只属于该文件的Chunk结点及其MENTIONS关系，
+# 并删除因此不再被任何Chunk提及的实体。
+# 实体之间的关系没有记录来源Chunk，仍被其它Chunk提及的实体及其关系会被保留。
+# 与其它文件共有的Chunk结点保留，删除该文件的NEXT_CHUNK关系，结点上的文件名和位置改为另一个文件中的。
+def delete_document(graph, file_name):
+    shared_query = """
+    MATCH (d:`__Document__` {fileName: $file_name})<-[:PART_OF]-(c:`__Chunk__`)
+    OPTIONAL MATCH (c)-[r:NEXT_CHUNK {fileName: $file_name}]-()
+    DELETE r
+    WITH DISTINCT d, c
+    WHERE c.fileName = $file_name
+    MATCH (c)-[p:PART_OF]->(o:`__Document__`)
+    WHERE o <> d
+    WITH c, collect(p)[0] AS p
+    SET c.fileName = endNode(p).fileName, c.position = p.position, c.content_offset = p.content_offset
+    """
+    graph.query(shared_query, {"file_name": file_name})
+    query = """
+    MATCH (d:`__Document__` {fileName: $file_name})
+    OPTIONAL MATCH (d)<-[:PART_OF]-(c:`__Chunk__`)
+    WHERE NOT EXISTS { MATCH (c)-[:PART_OF]->(o:`__Document__`) WHERE o <> d }
+    OPTIONAL MATCH (c)-[:MENTIONS]->(e:`__Entity__`)
+    WITH d, collect(DISTINCT c) AS chunks, collect(DISTINCT e) AS entities
+    FOREACH (c IN chunks | DETACH DELETE c)
+    DETACH DELETE d
+    WITH entities
+    UNWIND entities AS e
+    WITH e WHERE NOT (e)<-[:MENTIONS]-()
+    DETACH DELETE e
+    """
+    graph.query(query, {"file_name": file_name})
+
+#计算各Chunk结点的属性及Chunk之间、与Document之间的关系，不访问数据库。
+#返回(各块的id和document格式的内容, Chunk结点属性列表, FIRST_CHUNK/NEXT_CHUNK关系列表)。
+#chunks为DataLoader.Chunk对象的列表。
+def build_chunk_rows(file_name, chunks: List):
     current_chunk_id = ""
     lst_chunks_including_hash = []
     batch_data = []
     relationships = []
     offset=0
     for i, chunk in enumerate(chunks):
-        page_content = ''.join(chunk)
+        page_content = chunk.text
         page_content_sha1 = hashlib.sha1(page_content.encode()) # chunk.page_content.encode()
         previous_chunk_id = current_chunk_id
         current_chunk_id = page_content_sha1.hexdigest()
         position = i + 1 
         if i>0:
-            last_page_content = ''.join(chunks[i-1])
-            offset += len(last_page_content)  # chunks[i-1].page_content
+            offset += chunks[i-1].length  # chunks[i-1].page_content
         if i == 0:
             firstChunk = True
         else:
             firstChunk = False  
-        metadata = {"position": position,"length": len(page_content), "content_offset":offset, "tokens":len(chunk)}
+        metadata = {"position": position,"length": len(page_content), "content_offset":offset, "tokens":chunk.token_count}
         chunk_document = Document(
             page_content=page_content, metadata=metadata
         )
@@ -52,7 +102,7 @@ def create_relation_between_chunks(graph, file_name, chunks: List)->list:
             "f_name": file_name,
             "previous_id" : previous_chunk_id,
             "content_offset" : offset,
-            "tokens" : len(chunk)
+            "tokens" : chunk.token_count
         }
         
         batch_data.append(chunk_data)
@@ -68,15 +118,26 @@ def create_relation_between_chunks(graph, file_name, chunks: List)->list:
                 "previous_chunk_id": previous_chunk_id,  # ID of previous chunk
                 "current_chunk_id": current_chunk_id
             })
+
+    return lst_chunks_including_hash, batch_data, relationships
+
+#创建Chunk结点并建立Chunk之间及与Document之间的关系
+#这个程序直接从Neo4j KG Builder拷贝引用，为了增加tokens属性稍作修改。
+#chunks为DataLoader.Chunk对象的列表。
+#内容相同的Chunk是同一个结点，可能属于多个文件：结点上的fileName、position、content_offset取第一次创建时的文件，
+#每个文件中的位置保存在PART_OF关系上，NEXT_CHUNK关系带有所属文件的fileName，各文件的Chunk链互不混淆。
+def create_relation_between_chunks(graph, file_name, chunks: List)->list:
+    lst_chunks_including_hash, batch_data, relationships = build_chunk_rows(file_name, chunks)
           
     query_to_create_chunk_and_PART_OF_relation = """
         UNWIND $batch_data AS data
         MERGE (c:`__Chunk__` {id: data.id})
-        SET c.text = data.pg_content, c.position = data.position, c.length = data.length, c.fileName=data.f_name, 
-            c.content_offset=data.content_offset, c.tokens=data.tokens
+        ON CREATE SET c.fileName = data.f_name, c.position = data.position, c.content_offset = data.content_offset
+        SET c.text = data.pg_content, c.length = data.length, c.tokens = data.tokens
         WITH data, c
         MATCH (d:`__Document__` {fileName: data.f_name})
-        MERGE (c)-[:PART_OF]->(d)
+        MERGE (c)-[p:PART_OF]->(d)
+        SET p.position = data.position, p.content_offset = data.content_offset
     """
     graph.query(query_to_create_chunk_and_PART_OF_relation, params={"batch_data": batch_data})
     
@@ -95,52 +156,63 @@ def create_relation_between_chunks(graph, file_name, chunks: List)->list:
         WITH c, relationship
         MATCH (pc:`__Chunk__` {id: relationship.previous_chunk_id})
         FOREACH(r IN CASE WHEN relationship.type = 'NEXT_CHUNK' THEN [1] ELSE [] END |
-                MERGE (c)<-[:NEXT_CHUNK]-(pc))
+                MERGE (c)<-[:NEXT_CHUNK {fileName: $f_name}]-(pc))
         """
-    graph.query(query_to_create_NEXT_CHUNK_relation, params={"relationships": relationships})   
+    graph.query(query_to_create_NEXT_CHUNK_relation, params={"f_name": file_name, "relationships": relationships})   
     
     return lst_chunks_including_hash
 
+# 查询已经提取过实体关系的Chunk，返回其id的集合。
+# Chunk结点以内容的SHA-1为id，内容相同的Chunk是同一个结点，提取一次即可。
+# 提取结果写入后由mark_chunks_extracted设置extracted属性，没有提取出实体的Chunk也不会再次提取；
+# 没有该属性的旧数据以已有MENTIONS关系为准。
+def get_extracted_chunk_ids(graph, chunk_ids):
+    if not chunk_ids:
+        return set()
+    query = """
+    UNWIND $chunk_ids AS chunk_id
+    MATCH (c:`__Chunk__` {id: chunk_id})
+    WHERE c.extracted = true OR (c)-[:MENTIONS]->()
+    RETURN DISTINCT c.id AS id
+    """
+    return {row["id"] for row in graph.query(query, {"chunk_ids": list(chunk_ids)})}
+
+# 记录Chunk的提取结果已经写入（包括没有提取出实体关系的Chunk）
+def mark_chunks_extracted(graph, chunk_ids):
+    if not chunk_ids:
+        return
+    query = """
+    UNWIND $chunk_ids AS chunk_id
+    MATCH (c:`__Chunk__` {id: chunk_id})
+    SET c.extracted = true
+    """
+    graph.query(query, {"chunk_ids": list(chunk_ids)})
+
+# 返回chunk_ids中在数据库里存在Chunk结点的id
+def get_existing_chunk_ids(graph, chunk_ids):
+    if not chunk_ids:
+        return set()
+    query = """
+    UNWIND $chunk_ids AS chunk_id
+    MATCH (c:`__Chunk__` {id: chunk_id})
+    RETURN c.id AS id
+    """
+    return {row["id"] for row in graph.query(query, {"chunk_ids": list(chunk_ids)})}
+
+# 多个Chunk合并为一个提取请求时，每段文本前的编号标记，输出按同样的标记拆分（见ResultParser.PackedStreamParser）
+PACK_MARKER = "<文本 {}>"
+
+# 把多段文本合并为一个请求的输入，每段以编号标记开头，编号从1开始
+def pack_texts(texts):
+    return "\n".join(f"{PACK_MARKER.format(n)}\n{text}" for n, text in enumerate(texts, start=1))
+
 # 提取的实体关系写入Neo4j
 # 由answer.content生成一个GraphDocument对象
 # 每个GraphDocument对象里增加一个metadata属性chunk_id，以便与前面建立的Chunk结点关联
 # 将每个块提取的实体关系文本转换为LangChain的GraphDocument对象
+# 使用ResultParser的单遍解析器，格式不正确的记录汇总在ResultParser.TUPLE_FORMAT中
 def convert_to_graph_document(chunk_id, input_text, result):
-    # 提取节点和关系
-    node_pattern = re.compile(r'\("entity" : "(.+?)" : "(.+?)" : "(.+?)"\)')
-    relationship_pattern = re.compile(r'\("relationship" : "(.+?)" : "(.+?)" : "(.+?)" : "(.+?)" : (.+?)\)')
-
-    nodes = {}
-    relationships = []
-
-    # 解析并创建节点
-    for match in node_pattern.findall(result):
-        node_id, node_type, description = match
-        if node_id not in nodes:
-            nodes[node_id] = Node(id=node_id, type=node_type, properties={'description': description})
-
-    # 解析并处理关系
-    for match in relationship_pattern.findall(result):
-        source_id, target_id, type, description, weight = match
-        # 确保source节点存在
-        if source_id not in nodes:
-            nodes[source_id] = Node(id=source_id, type="未知", properties={'description': ''})
-            
-        # 确保target节点存在
-        if target_id not in nodes:
-            nodes[target_id] = Node(id=target_id, type="未知", properties={'description': ''})
-            
-        relationships.append(Relationship(source=nodes[source_id], target=nodes[target_id], type=type,
-            properties={"description":description, "weight":float(weight)}))
-    
-    # 创建图对象
-    graph_document = GraphDocument(
-        nodes=list(nodes.values()),
-        relationships=relationships,
-        # page_content不能为空。
-        source=Document(page_content=input_text, metadata={"chunk_id": chunk_id})
-    )
-    return graph_document
+    return ResultParser.TUPLE_FORMAT(chunk_id, input_text, result)
 
 # 合并Chunk结点与add_graph_documents()创建的相应Document结点，
 # 迁移所有的实体关系到Chunk结点，并删除相应的Document结点。
@@ -250,38 +322,49 @@ def knn_similarity(graph, gds):
 
 # 合并相似实体
 def merge_similar_entities(graph, embeddings, merged_entities):
-    # 合并节点
-    graph.query(
+    # 读取每组待合并实体的描述，按句子哈希去重合并，句子数不超过graph.max_description_sentences
+    groups = graph.query(
         """
-        // 展开输入数据并为每组待合并节点生成一个列表
         UNWIND $data AS candidates
         CALL {
         WITH candidates
         MATCH (e:__Entity__) WHERE e.id IN candidates
-        RETURN collect(e) AS nodes
+        RETURN collect(e {.id, .description, .descriptions, .description_hashes}) AS nodes
+        }
+        WITH nodes WHERE size(nodes) > 0
+        RETURN nodes
+        """, params={"data": merged_entities}
+    )
+    batch_data = []
+    for group in groups:
+        hashes, texts, description = merge_descriptions(group["nodes"], graph.max_description_sentences)
+        batch_data.append({
+            "ids": [node["id"] for node in group["nodes"]],  # 第一个为保留的节点
+            "description_hashes": hashes,
+            "descriptions": texts,
+            "description": description,
+        })
+
+    # 合并节点
+    graph.query(
+        """
+        // 展开输入数据，第一个节点保留，其余节点合并到第一个节点
+        UNWIND $data AS entity_group
+        MATCH (firstnode:__Entity__ {id: entity_group.ids[0]})
+        CALL {
+        WITH entity_group
+        MATCH (e:__Entity__) WHERE e.id IN entity_group.ids[1..]
+        RETURN collect(e) AS others
         }
         
-        WITH nodes, nodes[0] AS firstnode
+        WITH entity_group, firstnode, [firstnode] + others AS nodes
         // 添加临时标签到第一个节点
         SET firstnode:__Combined__
 
-        // 收集所有节点的description值
-        WITH nodes, firstnode, [n IN nodes | n.description] AS descriptions
-        WITH nodes, firstnode, 
-        // 计算合并后的description
-        reduce(mergedDesc = "", desc IN descriptions | 
-            CASE 
-            WHEN mergedDesc IS NOT NULL AND mergedDesc <> "" AND desc IS NOT NULL AND desc <> "" 
-                THEN mergedDesc + "；" + desc
-            WHEN mergedDesc IS NOT NULL AND mergedDesc <> "" AND (desc IS NULL OR desc = "") 
-                THEN mergedDesc
-            WHEN (mergedDesc IS NULL OR mergedDesc = "") AND desc IS NOT NULL AND desc <> "" 
-                THEN desc
-            ELSE "" 
-            END) AS combinedDescription
-
-        // 设置合并后的description到第一个节点
-        SET firstnode.description = combinedDescription
+        // 设置合并后的描述到第一个节点
+        SET firstnode.description_hashes = entity_group.description_hashes,
+            firstnode.descriptions = entity_group.descriptions,
+            firstnode.description = entity_group.description
 
         WITH nodes
         // 使用apoc.refactor.mergeNodes合并所有节点
@@ -295,7 +378,7 @@ def merge_similar_entities(graph, embeddings, merged_entities):
         )
         YIELD node
         RETURN node
-        """, params={"data": merged_entities}
+        """, params={"data": batch_data}
     )
 
     # 合并关系
@@ -0,0 +1,91 @@
+import time
+import queue
+import threading
+
+from my_packages import GraphAbout
+
+# 后台写入线程：提取结果解析成GraphDocument后放入有界队列，由后台线程成批写入Neo4j，
+# 数据库写入与LLM请求同时进行。队列满时submit会阻塞，对提取端形成反压。
+# 每批写入后把对应的临时Document结点合并到Chunk结点（merge_relationship_between_chunk_and_entites），
+# 再记录这些Chunk已经提取（mark_chunks_extracted）。没有提取出实体关系的Chunk用mark_extracted提交chunk_id。
+_STOP = object()
+
+class BackgroundGraphWriter:
+    def __init__(self, graph, batch_size=32, max_queue=256, import_batch_size=1000):
+        if batch_size < 1:  # 参数检查
+            raise ValueError("batch_size must be at least 1.")
+        self.graph = graph
+        self.batch_size = batch_size
+        self.import_batch_size = import_batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        # 已写入的GraphDocument数和写入耗时
+        self.written = 0
+        self.write_time = 0.0
+        self._thread = threading.Thread(target=self._run, name="graph-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # 取出队列中已有的结果凑成一批
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if self._error is not None:
+                continue  # 出错后只清空队列，不再写入
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._error = e
+
+    # items的元素为GraphDocument对象或没有提取出实体关系的Chunk的chunk_id
+    def _write(self, items):
+        t0 = time.time()
+        graph_documents = [item for item in items if not isinstance(item, str)]
+        if graph_documents:
+            self.graph.add_graph_documents(
+                graph_documents,
+                baseEntityLabel=True,
+                include_source=True,
+                bulk=True,
+                batch_size=self.import_batch_size
+            )
+            GraphAbout.merge_relationship_between_chunk_and_entites(
+                self.graph, [graph_document.source.metadata["chunk_id"] for graph_document in graph_documents]
+            )
+        GraphAbout.mark_chunks_extracted(
+            self.graph, [item if isinstance(item, str) else item.source.metadata["chunk_id"] for item in items]
+        )
+        self.written += len(graph_documents)
+        self.write_time += time.time() - t0
+
+    # 提交一个GraphDocument，后台线程出错时抛出该错误
+    def submit(self, graph_document):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(graph_document)
+
+    # 提交一个没有提取出实体关系的Chunk，与GraphDocument按提交顺序记录为已提取
+    def mark_extracted(self, chunk_id):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(chunk_id)
+
+    # 等待队列中的结果全部写入后结束后台线程，后台线程出错时抛出该错误
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,87 @@
+import sys
+import time
+import random
+import argparse
+from dotenv import load_dotenv
+
+from my_packages.MyNeo4j import MyNeo4jGraph, BASE_ENTITY_LABEL
+
+# 关系导入的吞吐量测试：在数据库中生成一批合成的实体和关系，
+# 分别用逐行调用apoc.merge.relationship的动态查询和按类型分组的静态查询导入同样的关系，比较每秒导入的关系数。
+# 合成实体的id以BENCHMARK_PREFIX开头，测试结束后删除。
+# python -m my_packages.ImportBenchmark [--rows N] [--entities N] [--types N] [--batch-size N]
+BENCHMARK_PREFIX = "__benchmark__"
+
+# 生成合成的关系行，格式与MyNeo4j._relationship_row相同
+def synthetic_relationship_rows(rows, entities, types, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "source": f"{BENCHMARK_PREFIX}{rng.randrange(entities)}",
+            "source_label": "疾病",
+            "target": f"{BENCHMARK_PREFIX}{rng.randrange(entities)}",
+            "target_label": "症状",
+            "type": f"关系{rng.randrange(types)}",
+            "properties": {"description": "合成关系", "weight": rng.randint(1, 10)},
+        }
+        for _ in range(rows)
+    ]
+
+def _delete_benchmark_relationships(graph):
+    graph.query(
+        f"MATCH (n:`{BASE_ENTITY_LABEL}`)-[r]->() WHERE n.id STARTS WITH $prefix DELETE r",
+        {"prefix": BENCHMARK_PREFIX}
+    )
+
+# 对同一批关系分别用动态和静态方式导入，返回每种方式的耗时和每秒导入的关系数
+def benchmark_relationship_import(graph, rows=20000, entities=2000, types=50, batch_size=1000, repeat=3):
+    data = synthetic_relationship_rows(rows, entities, types)
+    known_types = {row["type"] for row in data}
+    graph.query(
+        f"UNWIND range(0, $entities - 1) AS i MERGE (:`{BASE_ENTITY_LABEL}` {{id: $prefix + toString(i)}})",
+        {"entities": entities, "prefix": BENCHMARK_PREFIX}
+    )
+    results = {"dynamic": [], "static": []}
+    try:
+        for _ in range(repeat):
+            # 两种方式交替进行，减小缓存预热对结果的影响
+            for mode, relationship_types in (("dynamic", set()), ("static", known_types)):
+                graph.relationship_types = relationship_types
+                _delete_benchmark_relationships(graph)
+                t0 = time.time()
+                graph.import_relationships(data, baseEntityLabel=True, batch_size=batch_size)
+                results[mode].append(time.time() - t0)
+    finally:
+        graph.query(
+            f"MATCH (n:`{BASE_ENTITY_LABEL}`) WHERE n.id STARTS WITH $prefix DETACH DELETE n",
+            {"prefix": BENCHMARK_PREFIX}
+        )
+    return {
+        mode: {"seconds": min(times), "rows_per_second": rows / min(times)}
+        for mode, times in results.items()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较动态与按类型分组的静态关系导入的吞吐量")
+    parser.add_argument("--rows", type=int, default=20000, help="合成关系数")
+    parser.add_argument("--entities", type=int, default=2000, help="合成实体数")
+    parser.add_argument("--types", type=int, default=50, help="关系类型数")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批导入的关系数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args(argv)
+
+    load_dotenv(".env")
+    graph = MyNeo4jGraph(refresh_schema=False)
+    try:
+        results = benchmark_relationship_import(
+            graph, args.rows, args.entities, args.types, args.batch_size, args.repeat
+        )
+    finally:
+        graph.close()
+    for mode, result in results.items():
+        print(f"{mode}: {result['seconds']:.2f}s  {result['rows_per_second']:.0f} 关系/秒")
+    print(f"加速比: {results['dynamic']['seconds'] / results['static']['seconds']:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
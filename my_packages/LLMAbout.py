@@ -5,13 +5,15 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables.config import RunnableConfig
 from langchain.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate
 )
 
+from my_packages.AdaptiveConcurrency import get_shared_controller
+from my_packages.MyNeo4j import description_sentences
+
 # 加载环境变量
 load_dotenv(".env")
 DEEPSEEK_API_KEY = os.environ["DEEPSEEK_API_KEY"]
@@ -100,7 +102,7 @@ def decide_entity_merge(candidates):
 
     # 调用LLM得到可以合并实体的列表
     inputs = [{"entities": ', '.join(candidate['combinedResult'])} for candidate in candidates]
-    results = chain.batch(inputs, config=RunnableConfig(max_concurrency=12))
+    results = get_shared_controller().map(chain.invoke, inputs)
 
     # 解析结果
     merged_entities = []
@@ -153,21 +155,27 @@ def rewrite_entity_descriptions(graph, min_length = 500):
     
     # 批量并行处理
     if inputs:
-        responses = chain.batch(inputs, config=RunnableConfig(max_concurrency=12))
+        responses = get_shared_controller().map(chain.invoke, inputs)
         
         # 批量更新数据库
         for entity, response in zip(entities, responses):
             new_description = response.content.strip()
+            # 句子列表与重写后的描述保持一致，之后再导入的描述在此基础上去重追加
+            sentences = description_sentences(new_description)
             
             update_query = """
             MATCH (n:__Entity__)
             WHERE elementId(n) = $node_id
-            SET n.description = $new_description
+            SET n.description = $new_description,
+                n.descriptions = $descriptions,
+                n.description_hashes = $description_hashes
             """
             
             _ = graph.query(update_query, params={
                 "node_id": entity["node_id"], 
-                "new_description": new_description
+                "new_description": new_description,
+                "descriptions": [s["text"] for s in sentences],
+                "description_hashes": [s["hash"] for s in sentences]
             })
 
 # 重写关系描述
@@ -209,7 +217,7 @@ def rewrite_relationship_descriptions(graph, min_length = 60):
     
     # 批量并行处理
     if inputs:
-        responses = chain.batch(inputs, config=RunnableConfig(max_concurrency=12))
+        responses = get_shared_controller().map(chain.invoke, inputs)
         
         # 批量更新数据库
         for rel, response in zip(relationships, responses):
@@ -366,7 +374,7 @@ def community_abstract(graph):
         community_id_map[idx] = info['communityId']  # 使用索引作为键
 
     # 使用batch并行处理
-    summaries = community_chain.batch(batch_inputs, config=RunnableConfig(max_concurrency=12))
+    summaries = get_shared_controller().map(community_chain.invoke, batch_inputs)
 
     # 组合结果
     results = []
@@ -0,0 +1,68 @@
+import time
+import threading
+from langchain_core.runnables import RunnableGenerator
+
+# 估计文本的token数：1个中文字符（含中文标点）约0.6个token，其它字符约0.3个token
+def estimate_tokens(text):
+    cjk = sum(
+        1 for ch in text
+        if '一' <= ch <= '鿿' or '　' <= ch <= '〿' or '＀' <= ch <= '￯'
+    )
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+# 估计一组消息（ChatPromptTemplate.format_messages的结果）的输入token数
+def estimate_message_tokens(messages):
+    return sum(estimate_tokens(message.content) for message in messages)
+
+# 统计LLM请求的用量：输入、输出token数，命中服务端前缀缓存的输入token数及请求耗时。
+# 用track包装"提示词 | 模型"的链，输入中的text_count表示一个请求包含的Chunk数（默认为1）。
+class UsageTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chunks = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.latency = 0.0
+
+    # 包装后的链支持invoke和stream，流式调用时逐段转发模型的输出，结束后合并各段记录用量
+    def track(self, runnable):
+        def transform(input_stream, config):
+            inputs = {}
+            for part in input_stream:
+                inputs.update(part)
+            t0 = time.time()
+            message = None
+            for chunk in runnable.stream(inputs, config):
+                message = chunk if message is None else message + chunk
+                yield chunk
+            self.record(message, time.time() - t0, inputs.get("text_count", 1))
+        return RunnableGenerator(transform)
+
+    def record(self, message, latency, chunks=1):
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        with self._lock:
+            self.calls += 1
+            self.chunks += chunks
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+            self.cache_read_tokens += details.get("cache_read", 0) or 0
+            self.latency += latency
+
+    def stats(self):
+        with self._lock:
+            chunks = self.chunks or 1
+            calls = self.calls or 1
+            return {
+                "calls": self.calls,
+                "chunks": self.chunks,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_read_tokens": self.cache_read_tokens,
+                "input_tokens_per_chunk": self.input_tokens / chunks,
+                "output_tokens_per_chunk": self.output_tokens / chunks,
+                "latency_per_call": self.latency / calls,
+                "latency_per_chunk": self.latency / chunks,
+            }
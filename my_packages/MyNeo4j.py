@@ -1,10 +1,16 @@
 # 重载Neo4jGraph类，使节点合并时对description属性进行拼接而非直接替代
 from langchain_neo4j.graphs.graph_document import GraphDocument
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from langchain_neo4j import Neo4jGraph
 from hashlib import md5
+import re
 
 BASE_ENTITY_LABEL = "__Entity__"
+UNKNOWN_LABEL = "未知"
+# 实体描述拼接时的分隔符
+DESCRIPTION_SEPARATOR = "；"
+# 每个实体保留的描述句子数上限，为None时不限制
+MAX_DESCRIPTION_SENTENCES = 40
 
 include_docs_query = (
     "MERGE (d:Document {id:$document.metadata.id}) "
@@ -13,12 +19,43 @@ include_docs_query = (
     "WITH d "
 )
 
+# 批量导入：一次查询包含多个文档，$batch中每项为{document, nodes}
+include_docs_bulk_query = (
+    "UNWIND $batch AS item "
+    "MERGE (d:Document {id:item.document.metadata.id}) "
+    "SET d.text = item.document.page_content "
+    "SET d += item.document.metadata "
+    "WITH d, item "
+    "UNWIND item.nodes AS row "
+)
+
+# 批量导入时先单独导入文档结点，$documents中每项为一个文档
+import_docs_query = (
+    "UNWIND $documents AS document "
+    "MERGE (d:Document {id:document.metadata.id}) "
+    "SET d.text = document.page_content "
+    "SET d += document.metadata"
+)
+
+# 批量导入时实体导入后再建立文档到实体的MENTIONS关系，$data中每项为{document, id}
+mentions_query = (
+    "UNWIND $data AS row "
+    "MATCH (d:Document {id:row.document}) "
+    f"MATCH (source:`{BASE_ENTITY_LABEL}` {{id: row.id}}) "
+    "MERGE (d)-[:MENTIONS]->(source)"
+)
+
+# 节点导入查询的开头：逐个文档导入时展开$data，批量导入时按文档展开$batch
+def _node_rows_query(include_source: bool, bulk: bool) -> str:
+    if include_source and bulk:
+        return include_docs_bulk_query
+    return f"{include_docs_query if include_source else ''}UNWIND $data AS row "
+
 # 修改后的节点合并函数
-def my_get_node_import_query(baseEntityLabel: bool, include_source: bool) -> str:
+def my_get_node_import_query(baseEntityLabel: bool, include_source: bool, bulk: bool = False) -> str:
     if baseEntityLabel:
         return (
-            f"{include_docs_query if include_source else ''}"
-            "UNWIND $data AS row "
+            f"{_node_rows_query(include_source, bulk)}"
             f"MERGE (source:`{BASE_ENTITY_LABEL}` {{id: row.id}}) "
             
             # 对description属性进行拼接处理
@@ -74,14 +111,160 @@ def my_get_node_import_query(baseEntityLabel: bool, include_source: bool) -> str
         )
     else:
         return (
-            f"{include_docs_query if include_source else ''}"
-            "UNWIND $data AS row "
+            f"{_node_rows_query(include_source, bulk)}"
             "CALL apoc.merge.node([row.type], {id: row.id}, "
             "row.properties, {}) YIELD node "
             f"{'MERGE (d)-[:MENTIONS]->(node) ' if include_source else ''}"
             "RETURN distinct 'done' AS result"
         )
 
+# 实体描述按句保存：descriptions为去重后的句子列表，description_hashes为对应的句子哈希。
+# 再次提到同一实体时只追加哈希不重复的句子，句子数达到上限后不再追加，
+# description字符串在每次导入结束后由finalize_entities_query统一生成。
+# 只有description字符串的旧数据，导入前由MyNeo4jGraph.split_legacy_descriptions按同样的规则拆分。
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])")
+# 句末标点，保存句子时去掉，拼接时不会出现"。；"
+SENTENCE_END_PUNCTUATION = "。！？!?；;."
+
+# 去掉首尾空白和句末标点
+def _strip_sentence(sentence: str) -> str:
+    return sentence.strip().rstrip(SENTENCE_END_PUNCTUATION + " ").strip()
+
+# 句子的哈希，忽略首尾空白和句末标点
+def sentence_hash(sentence: str) -> str:
+    return md5(_strip_sentence(sentence).encode("utf-8")).hexdigest()[:16]
+
+# 描述拆分为句子，去掉句末标点，返回去重后的[{"hash", "text"}]
+def description_sentences(text: Optional[str]) -> List[Dict[str, str]]:
+    sentences = []
+    seen = set()
+    for sentence in _SENTENCE_END.split(text or ""):
+        sentence = _strip_sentence(sentence)
+        if not sentence:
+            continue
+        key = sentence_hash(sentence)
+        if key not in seen:
+            seen.add(key)
+            sentences.append({"hash": key, "text": sentence})
+    return sentences
+
+# 句子列表拼接为描述字符串，句子中残留的句末标点（之前保存的句子）先去掉
+def join_descriptions(texts: Iterable[str]) -> str:
+    return DESCRIPTION_SEPARATOR.join(text for text in map(_strip_sentence, texts) if text)
+
+# 合并多个实体的描述句子，nodes中每项为包含description、descriptions、description_hashes的字典，
+# 没有句子列表的（旧数据）从description拆分。返回(哈希列表, 句子列表, 描述字符串)
+def merge_descriptions(nodes, max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES):
+    hashes: List[str] = []
+    texts: List[str] = []
+    for node in nodes:
+        if node.get("descriptions") is not None:
+            sentences = zip(node.get("description_hashes") or [], node["descriptions"])
+        else:
+            sentences = ((s["hash"], s["text"]) for s in description_sentences(node.get("description")))
+        for key, text in sentences:
+            if max_sentences is not None and len(hashes) >= max_sentences:
+                break
+            if key not in hashes:
+                hashes.append(key)
+                texts.append(text)
+    return hashes, texts, join_descriptions(texts)
+
+# 旧数据的description字符串拆分为句子列表，rows中每项为{id, description}，
+# 返回set_description_sentences_query的参数，每项为{id, descriptions, description_hashes}
+def legacy_description_rows(rows, max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES) -> List[Dict[str, Any]]:
+    data = []
+    for row in rows:
+        sentences = description_sentences(row["description"])[:max_sentences]
+        data.append({
+            "id": row["id"],
+            "descriptions": [s["text"] for s in sentences],
+            "description_hashes": [s["hash"] for s in sentences],
+        })
+    return data
+
+# 导入前查找本次导入的实体中只有description字符串、没有句子列表的旧数据
+legacy_descriptions_query = (
+    "UNWIND $ids AS id "
+    f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: id}}) "
+    "WHERE n.description_hashes IS NULL AND coalesce(n.description, '') <> '' "
+    "RETURN n.id AS id, n.description AS description"
+)
+
+# 写入旧数据拆分后的句子列表，$data中每项为{id, descriptions, description_hashes}
+set_description_sentences_query = (
+    "UNWIND $data AS row "
+    f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: row.id}}) "
+    "SET n.descriptions = row.descriptions, n.description_hashes = row.description_hashes"
+)
+
+# 按类型分组导入节点：一组内的行主类型相同，用静态的SET source:`类型`设置标签，不再逐行调用apoc.create.setLabels。
+# '未知'标签和description字符串在导入后由finalize_entities_query统一处理。node_types为空时不设置类型标签。
+# 每个实体在一次查询中只有一行（见_merge_node_rows），行中的sentences为合并后的描述句子，properties中不含description。
+def get_typed_node_import_query(
+    include_source: bool, node_types: Sequence[str], bulk: bool = False,
+    max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES
+) -> str:
+    limit = f"[..{max_sentences}]" if max_sentences is not None else ""
+    labels = "".join(f":`{node_type}`" for node_type in node_types)
+    return (
+        f"{_node_rows_query(include_source, bulk)}"
+        f"MERGE (source:`{BASE_ENTITY_LABEL}` {{id: row.id}}) "
+        f"{'WITH d, source, row, ' if include_source else 'WITH source, row, '}"
+        "coalesce(source.description_hashes, []) AS hashes, "
+        "coalesce(source.descriptions, []) AS texts "
+        f"{'WITH d, source, row, ' if include_source else 'WITH source, row, '}"
+        "hashes, texts, [s IN row.sentences WHERE NOT s.hash IN hashes] AS added "
+        "SET source += row.properties "
+        f"SET source.description_hashes = (hashes + [s IN added | s.hash]){limit}, "
+        f"    source.descriptions = (texts + [s IN added | s.text]){limit} "
+        f"{'MERGE (d)-[:MENTIONS]->(source) ' if include_source else ''}"
+        f"{f'SET source{labels} ' if labels else ''}"
+        "RETURN distinct 'done' AS result"
+    )
+
+# 按类型分组导入实体时，没有已配置类型的实体所在组的键
+UNTYPED = ""
+
+# 给实体添加查询中不能静态设置的标签（未配置的类型、一个实体的多个类型），$data中每项为{id, labels}。
+# 只有一种查询文本，不随类型组合变化
+add_labels_query = (
+    "UNWIND $data AS row "
+    f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: row.id}}) "
+    "CALL apoc.create.addLabels(n, row.labels) YIELD node "
+    "RETURN count(node) AS count"
+)
+
+# 每个已配置的实体类型一个导入查询，另有一个不设置类型标签的查询，键为(是否包含文档, 类型)。
+# 查询文本的种类数固定，不随一批数据中出现的类型组合增长，Neo4j的查询计划缓存不会被占满
+def build_node_import_queries(
+    node_types: Iterable[str], max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES
+) -> Dict[Tuple[bool, str], str]:
+    return {
+        (with_source, node_type): get_typed_node_import_query(
+            with_source, [node_type] if node_type else [], False, max_sentences
+        )
+        for with_source in (True, False)
+        for node_type in [UNTYPED, *node_types]
+    }
+
+# 导入结束后处理本次导入的实体：
+# 由句子列表生成description字符串；
+# 已有其它类型标签的实体去掉'未知'标签，结果与逐行处理'未知'的标签合并逻辑相同：
+# 实体只被识别为'未知'时保留'未知'标签，一旦有确定的类型就只保留确定的类型
+finalize_entities_query = (
+    "UNWIND $ids AS id "
+    f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: id}}) "
+    # 与join_descriptions相同，去掉之前保存的句子中残留的句末标点
+    "SET n.description = reduce(s = '', t IN [t IN coalesce(n.descriptions, []) | "
+    f"    CASE WHEN right(t, 1) IN {[c for c in SENTENCE_END_PUNCTUATION]!r} THEN left(t, size(t) - 1) ELSE t END] | "
+    f"    CASE WHEN t = '' THEN s WHEN s = '' THEN t ELSE s + '{DESCRIPTION_SEPARATOR}' + t END) "
+    "WITH n "
+    f"WHERE n:`{UNKNOWN_LABEL}` "
+    f"  AND size([l IN labels(n) WHERE l <> '{BASE_ENTITY_LABEL}' AND l <> '{UNKNOWN_LABEL}']) > 0 "
+    f"REMOVE n:`{UNKNOWN_LABEL}`"
+)
+
 def _get_rel_import_query(baseEntityLabel: bool) -> str:
     if baseEntityLabel:
         return (
@@ -105,9 +288,106 @@ def _get_rel_import_query(baseEntityLabel: bool) -> str:
             "RETURN distinct 'done'"
         )
 
+# 按类型分组导入关系：一组内的关系类型相同，用静态的MERGE (source)-[rel:`类型`]->(target)，
+# 不再逐行调用apoc.merge.relationship。与apoc.merge.relationship相同，属性只在创建关系时设置。
+def get_typed_rel_import_query(baseEntityLabel: bool, rel_type: str) -> str:
+    if baseEntityLabel:
+        return (
+            "UNWIND $data AS row "
+            f"MERGE (source:`{BASE_ENTITY_LABEL}` {{id: row.source}}) "
+            f"MERGE (target:`{BASE_ENTITY_LABEL}` {{id: row.target}}) "
+            f"MERGE (source)-[rel:`{rel_type}`]->(target) "
+            "ON CREATE SET rel += row.properties "
+            "RETURN distinct 'done'"
+        )
+    else:
+        return (
+            "UNWIND $data AS row "
+            "CALL apoc.merge.node([row.source_label], {id: row.source},"
+            "{}, {}) YIELD node as source "
+            "CALL apoc.merge.node([row.target_label], {id: row.target},"
+            "{}, {}) YIELD node as target "
+            f"MERGE (source)-[rel:`{rel_type}`]->(target) "
+            "ON CREATE SET rel += row.properties "
+            "RETURN distinct 'done'"
+        )
+
 def _remove_backticks(text: str) -> str:
     return text.replace("`", "")
 
+# 关系类型写入数据库时的形式
+def normalize_relationship_type(rel_type: str) -> str:
+    return _remove_backticks(rel_type.replace(" ", "_").upper())
+
+# 按id合并节点：UNWIND的每一行都读取查询开始前的节点，同一实体在一次查询中有多行时只有最后一行的描述和标签会保留，
+# 因此导入前每个实体合并为一行。类型取并集，描述句子按哈希去重后依次追加（不超过max_sentences），
+# 其它属性后出现的覆盖先出现的
+def _merge_node_rows(nodes, max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES) -> List[Dict[str, Any]]:
+    rows: Dict[str, Dict[str, Any]] = {}
+    hashes: Dict[str, set] = {}
+    for el in nodes:
+        row = rows.get(el.id)
+        if row is None:
+            row = rows[el.id] = {"id": el.id, "types": [], "properties": {}, "sentences": []}
+            hashes[el.id] = set()
+        if el.type and el.type not in row["types"]:
+            row["types"].append(el.type)
+        properties = dict(el.properties)
+        description = properties.pop("description", None)
+        row["properties"].update(properties)
+        for sentence in description_sentences(description):
+            if max_sentences is not None and len(row["sentences"]) >= max_sentences:
+                break
+            if sentence["hash"] not in hashes[el.id]:
+                hashes[el.id].add(sentence["hash"])
+                row["sentences"].append(sentence)
+    return list(rows.values())
+
+# 选出实体的主类型和需要另外添加的标签：主类型是第一个已配置的确定类型（没有时为'未知'或UNTYPED），
+# 由该类型的静态查询设置标签；其余类型作为labels另外添加，有其它类型时不再添加'未知'
+def _primary_type(types: Sequence[str], node_types) -> Tuple[str, List[str]]:
+    known = [t for t in types if t in node_types]
+    primary = next((t for t in known if t != UNKNOWN_LABEL), known[0] if known else UNTYPED)
+    labels = [t for t in types if t != primary and not (t == UNKNOWN_LABEL and len(types) > 1)]
+    return primary, labels
+
+# 节点合并为每个实体一行后按主类型分组，行中的labels为需要另外添加的标签；
+# 不使用__Entity__标签时不合并也不分组（键为None）
+def _group_nodes_by_type(
+    nodes, baseEntityLabel: bool, max_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES, node_types=frozenset()
+) -> Dict[Optional[str], List[Dict[str, Any]]]:
+    if not baseEntityLabel:
+        return {None: [el.__dict__ for el in nodes]} if nodes else {}
+    groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for row in _merge_node_rows(nodes, max_sentences):
+        primary, row["labels"] = _primary_type(row["types"], node_types)
+        groups.setdefault(primary, []).append(row)
+    return groups
+
+# 批量导入时的MENTIONS关系：按(文档id, 实体id)去重，顺序与首次出现的顺序相同
+def _mention_pairs(graph_documents: List[GraphDocument]) -> List[Dict[str, str]]:
+    pairs = dict.fromkeys(
+        (document.source.metadata["id"], el.id) for document in graph_documents for el in document.nodes
+    )
+    return [{"document": document_id, "id": entity_id} for document_id, entity_id in pairs]
+
+# 关系行按类型分组，类型不在relationship_types中的关系分在一组（键为None）
+def _group_relationships_by_type(rows, relationship_types) -> Dict[Optional[str], List[Dict[str, Any]]]:
+    groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(row["type"] if row["type"] in relationship_types else None, []).append(row)
+    return groups
+
+def _relationship_row(el) -> Dict[str, Any]:
+    return {
+        "source": el.source.id,
+        "source_label": _remove_backticks(el.source.type),
+        "target": el.target.id,
+        "target_label": _remove_backticks(el.target.type),
+        "type": normalize_relationship_type(el.type),
+        "properties": el.properties,
+    }
+
 class MyNeo4jGraph(Neo4jGraph):
     def __init__(
         self, 
@@ -121,8 +401,21 @@ class MyNeo4jGraph(Neo4jGraph):
         *,
         driver_config: Optional[Dict] = None,
         enhanced_schema: bool = False,
+        relationship_types: Optional[Iterable[str]] = None,
+        entity_types: Optional[Iterable[str]] = None,
+        max_description_sentences: Optional[int] = MAX_DESCRIPTION_SENTENCES,
     ):
-        
+        # 每个实体保留的描述句子数上限，为None时只去重不限制
+        self.max_description_sentences = max_description_sentences
+        # 已知的实体类型（如提取时限定的类型列表），每个类型的导入查询在这里生成一次，
+        # 其它类型的标签由add_labels_query添加
+        self.entity_types = {_remove_backticks(t) for t in (entity_types or [])} | {UNKNOWN_LABEL}
+        self._node_import_queries = build_node_import_queries(sorted(self.entity_types), max_description_sentences)
+        # 已知的关系类型（如提取时限定的类型列表），这些类型的关系按类型分组用静态查询导入，
+        # 其它类型仍逐行调用apoc.merge.relationship
+        self.relationship_types = {
+            normalize_relationship_type(rel_type) for rel_type in (relationship_types or [])
+        }
         super().__init__(
             url, username, password, 
             database, timeout, sanitize, refresh_schema, 
@@ -135,6 +428,8 @@ class MyNeo4jGraph(Neo4jGraph):
         graph_documents: List[GraphDocument],
         include_source: bool = False,
         baseEntityLabel: bool = False,
+        bulk: bool = False,
+        batch_size: int = 1000,
     ) -> None:
         """
         This method constructs nodes and relationships in the graph based on the
@@ -154,11 +449,19 @@ class MyNeo4jGraph(Neo4jGraph):
         - baseEntityLabel (bool, optional): If True, each newly created node
         gets a secondary __Entity__ label, which is indexed and improves import
         speed and performance. Defaults to False.
+        - bulk (bool, optional): If True, nodes and relationships of all
+        documents are flattened and imported in UNWIND batches of `batch_size`
+        rows, one query (transaction) per batch, instead of two queries per
+        document. Defaults to False.
+        - batch_size (int, optional): Number of rows per batch in bulk mode.
+        Defaults to 1000.
 
         Raises:
             RuntimeError: If the connection has been closed.
         """
         self._check_driver_state()
+        if batch_size < 1:  # 参数检查
+            raise ValueError("batch_size must be at least 1.")
         if baseEntityLabel:  # Check if constraint already exists
             constraint_exists = any(
                 [
@@ -187,40 +490,132 @@ class MyNeo4jGraph(Neo4jGraph):
                         "but at least one document has no `source`."
                     )
 
-        node_import_query = my_get_node_import_query(baseEntityLabel, include_source)
-        rel_import_query = _get_rel_import_query(baseEntityLabel)
         for document in graph_documents:
-            node_import_query_params: dict[str, Any] = {
-                "data": [el.__dict__ for el in document.nodes]
-            }
             if include_source and document.source:
                 if not document.source.metadata.get("id"):
                     document.source.metadata["id"] = md5(
                         document.source.page_content.encode("utf-8")
                     ).hexdigest()
-                node_import_query_params["document"] = document.source.__dict__
-
             # Remove backticks from node types
             for node in document.nodes:
                 node.type = _remove_backticks(node.type)
-            # Import nodes
-            self.query(node_import_query, node_import_query_params)
-            # Import relationships
-            self.query(
-                rel_import_query,
-                {
-                    "data": [
-                        {
-                            "source": el.source.id,
-                            "source_label": _remove_backticks(el.source.type),
-                            "target": el.target.id,
-                            "target_label": _remove_backticks(el.target.type),
-                            "type": _remove_backticks(
-                                el.type.replace(" ", "_").upper()
-                            ),
-                            "properties": el.properties,
-                        }
-                        for el in document.relationships
-                    ]
-                },
+
+        if baseEntityLabel:
+            ids = list({el.id for document in graph_documents for el in document.nodes})
+            self.split_legacy_descriptions(ids, batch_size)
+
+        # 节点导入查询：使用__Entity__标签时为按主类型生成好的查询，否则为逐行调用apoc的查询
+        def node_import_query(node_type: Optional[str], with_source: bool = include_source) -> str:
+            if node_type is None:
+                return my_get_node_import_query(baseEntityLabel, with_source, bulk)
+            return self._node_import_queries[(with_source, node_type)]
+
+        if bulk:
+            self._bulk_import(graph_documents, include_source, baseEntityLabel, batch_size, node_import_query)
+        else:
+            for document in graph_documents:
+                groups = _group_nodes_by_type(
+                    document.nodes, baseEntityLabel, self.max_description_sentences, self.entity_types
+                )
+                if include_source and not groups:  # 没有节点时仍创建Document结点
+                    groups = {UNTYPED if baseEntityLabel else None: []}
+                # Import nodes
+                for node_type, nodes in groups.items():
+                    node_import_query_params: dict[str, Any] = {"data": nodes}
+                    if include_source and document.source:
+                        node_import_query_params["document"] = document.source.__dict__
+                    self.query(node_import_query(node_type), node_import_query_params)
+                if baseEntityLabel:
+                    self._add_labels([row for rows in groups.values() for row in rows], batch_size)
+                # Import relationships
+                self.import_relationships(
+                    [_relationship_row(el) for el in document.relationships], baseEntityLabel, batch_size
+                )
+
+        # 统一生成description字符串、处理'未知'标签
+        if baseEntityLabel:
+            for start in range(0, len(ids), batch_size):
+                self.query(finalize_entities_query, {"ids": ids[start:start + batch_size]})
+
+    # 只有description字符串的旧数据按description_sentences拆分为句子列表，
+    # 之后导入时的去重与新数据相同（句子哈希），句子数不超过max_description_sentences
+    def split_legacy_descriptions(self, ids: List[str], batch_size: int = 1000) -> None:
+        for start in range(0, len(ids), batch_size):
+            rows = self.query(legacy_descriptions_query, {"ids": ids[start:start + batch_size]})
+            data = legacy_description_rows(rows, self.max_description_sentences)
+            if data:
+                self.query(set_description_sentences_query, {"data": data})
+
+    # 添加实体行（_group_nodes_by_type的结果）中主类型以外的标签
+    def _add_labels(self, rows: List[Dict[str, Any]], batch_size: int) -> None:
+        data = [{"id": row["id"], "labels": row["labels"]} for row in rows if row["labels"]]
+        for start in range(0, len(data), batch_size):
+            self.query(add_labels_query, {"data": data[start:start + batch_size]})
+
+    # 批量导入：所有文档的节点、关系分别展开后按batch_size分批，每批一次查询（一个事务）。
+    # 使用__Entity__标签时，所有文档的节点按id合并为每个实体一行后按主类型分组导入，
+    # 包含文档时先导入文档结点，实体导入后再由(文档id, 实体id)建立MENTIONS关系；
+    # 先导入全部节点再导入全部关系，description拼接和标签处理与逐个文档导入相同。
+    def _bulk_import(
+        self,
+        graph_documents: List[GraphDocument],
+        include_source: bool,
+        baseEntityLabel: bool,
+        batch_size: int,
+        node_import_query,
+    ) -> None:
+        if baseEntityLabel:
+            if include_source:
+                documents = list({
+                    document.source.metadata["id"]: document.source.__dict__ for document in graph_documents
+                }.values())
+                for start in range(0, len(documents), batch_size):
+                    self.query(import_docs_query, {"documents": documents[start:start + batch_size]})
+            groups = _group_nodes_by_type(
+                [el for document in graph_documents for el in document.nodes], True,
+                self.max_description_sentences, self.entity_types
+            )
+            for node_type, rows in groups.items():
+                for start in range(0, len(rows), batch_size):
+                    self.query(node_import_query(node_type, False), {"data": rows[start:start + batch_size]})
+            self._add_labels([row for rows in groups.values() for row in rows], batch_size)
+            if include_source:
+                mentions = _mention_pairs(graph_documents)
+                for start in range(0, len(mentions), batch_size):
+                    self.query(mentions_query, {"data": mentions[start:start + batch_size]})
+        elif include_source:
+            # 每批按文档分组，节点数累计到batch_size为止，节点数超过batch_size的文档单独成批
+            batch: List[Dict[str, Any]] = []
+            size = 0
+            for document in graph_documents:
+                nodes = [el.__dict__ for el in document.nodes]
+                if batch and size + len(nodes) > batch_size:
+                    self.query(node_import_query(None), {"batch": batch})
+                    batch, size = [], 0
+                batch.append({"document": document.source.__dict__, "nodes": nodes})
+                size += len(nodes)
+            if batch:
+                self.query(node_import_query(None), {"batch": batch})
+        else:
+            nodes = [el.__dict__ for document in graph_documents for el in document.nodes]
+            for start in range(0, len(nodes), batch_size):
+                self.query(node_import_query(None), {"data": nodes[start:start + batch_size]})
+
+        self.import_relationships(
+            [_relationship_row(el) for document in graph_documents for el in document.relationships],
+            baseEntityLabel, batch_size
+        )
+
+    # 导入关系行（_relationship_row的结果）：类型在self.relationship_types中的按类型分组用静态查询导入，
+    # 其它类型用apoc.merge.relationship导入，每组按batch_size分批
+    def import_relationships(
+        self, rows: List[Dict[str, Any]], baseEntityLabel: bool = True, batch_size: int = 1000
+    ) -> None:
+        for rel_type, group in _group_relationships_by_type(rows, self.relationship_types).items():
+            query = (
+                _get_rel_import_query(baseEntityLabel)
+                if rel_type is None
+                else get_typed_rel_import_query(baseEntityLabel, rel_type)
             )
+            for start in range(0, len(group), batch_size):
+                self.query(query, {"data": group[start:start + batch_size]})
@@ -0,0 +1,359 @@
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from langchain_core.documents import Document
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+# LLM提取结果的流式解析
+# 输出按行解析，可以在模型生成的同时用feed逐段输入，每得到一行完整的记录就立即创建Node/Relationship，
+# 不必等整个输出生成完。格式不正确的行记录下来并汇总到所属的输出格式对象，而不是静默丢弃。
+# 输出格式对象（TupleFormat、TerseFormat）在各线程间共用，解析器对象每个Chunk一个。
+
+# 原来的元组格式中一条记录的开头，一行中可能有多条记录
+RECORD_START = re.compile(r'\(\s*"(entity|relationship)"')
+# 多个Chunk合并为一个请求时，输出中每段结果前的编号标记和全部完成后的结束标记
+PACK_MARKER_PATTERN = re.compile(r'^[ \t]*<文本\s*(\d+)>[ \t]*$')
+PACK_END = "<全部完成>"
+# 关系中出现未识别的实体时使用的类型，及不能归类时的类型
+UNKNOWN_TYPE = "未知"
+OTHER_TYPE = "其他"
+# 不像实体或关系记录的行（如"文本中没有实体"之类的说明文字）的原因，这样的行不会使解析失败
+NOT_A_RECORD = "不是实体或关系记录"
+
+# 输出中有像记录的行但全部无法解析
+class UnparseableResult(ValueError):
+    pass
+
+# 一个Chunk的流式解析器，由输出格式对象的parser方法创建
+class StreamingParser:
+    def __init__(self, result_format, chunk_id, input_text):
+        self.format = result_format
+        self.chunk_id = chunk_id
+        self.input_text = input_text
+        self.nodes = {}
+        self.relationships = []
+        # 格式不正确的记录，元素为(行内容, 原因)
+        self.malformed = []
+        self._buffer = ""
+
+    # 输入一段输出文本，解析其中已完整的行
+    def feed(self, text):
+        if "\n" not in text:
+            self._buffer += text
+            return
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self.format.parse_line(self, line)
+
+    # 输出结束，解析剩余内容并返回GraphDocument对象。
+    # 不计入格式统计，解析结果被采用时再调用accept，被拒绝后重试的输出不重复统计
+    def close(self):
+        if self._buffer:
+            self.format.parse_line(self, self._buffer)
+            self._buffer = ""
+        return GraphDocument(
+            nodes=list(self.nodes.values()),
+            relationships=self.relationships,
+            # page_content不能为空。
+            source=Document(page_content=self.input_text, metadata={"chunk_id": self.chunk_id})
+        )
+
+    def add_entity(self, name, type, description):
+        node = self.nodes.get(name)
+        if node is None:
+            self.nodes[name] = Node(id=name, type=type, properties={'description': description})
+        elif node.type == UNKNOWN_TYPE and not node.properties['description']:
+            # 先出现在关系中的实体，用随后的实体记录补全
+            node.type = type
+            node.properties['description'] = description
+
+    def add_relationship(self, source, target, type, description, weight):
+        # 确保source节点和target节点存在
+        for node_id in (source, target):
+            if node_id not in self.nodes:
+                self.nodes[node_id] = Node(id=node_id, type=UNKNOWN_TYPE, properties={'description': ''})
+        self.relationships.append(Relationship(source=self.nodes[source], target=self.nodes[target], type=type,
+            properties={"description": description, "weight": weight}))
+
+    def reject(self, line, reason):
+        self.malformed.append((line, reason))
+
+    # 格式错误的行中像记录的行
+    def _malformed_records(self):
+        return [(line, reason) for line, reason in self.malformed if reason != NOT_A_RECORD]
+
+    # 输出中有像记录但格式错误的行且没有解析出任何实体和关系，视为解析失败；
+    # 只有说明文字、没有像记录的行时是空结果，不是解析失败
+    @property
+    def failed(self):
+        return not self.nodes and not self.relationships and bool(self._malformed_records())
+
+    # 解析失败时抛出UnparseableResult
+    def check(self):
+        if self.failed:
+            records = self._malformed_records()
+            line, reason = records[0]
+            raise UnparseableResult(f"{len(records)} malformed records, first: {reason}: {line[:100]}")
+
+    # 采用这次的解析结果，把记录数和格式错误计入输出格式的统计
+    def accept(self):
+        self.format.report(self.chunk_id, len(self.nodes) + len(self.relationships), self.malformed)
+
+# 输出格式的公共部分：解析一个完整输出，以及格式错误的统计
+class ResultFormat(ABC):
+    def __init__(self, max_examples=20):
+        self._lock = threading.Lock()
+        self.records = 0
+        self.malformed_count = 0
+        self.malformed_chunks = 0
+        # 最近的格式错误示例，元素为(chunk_id, 行内容, 原因)
+        self.examples = deque(maxlen=max_examples)
+
+    # 创建一个Chunk的流式解析器
+    def parser(self, chunk_id, input_text):
+        return StreamingParser(self, chunk_id, input_text)
+
+    # 解析一个完整的输出，返回GraphDocument对象
+    def __call__(self, chunk_id, input_text, result):
+        parser = self.parser(chunk_id, input_text)
+        parser.feed(result)
+        graph_document = parser.close()
+        parser.accept()
+        return graph_document
+
+    # 解析一行输出，把记录交给parser的add_entity/add_relationship，格式错误的行交给reject
+    @abstractmethod
+    def parse_line(self, parser, line):
+        pass
+
+    def report(self, chunk_id, records, malformed):
+        with self._lock:
+            self.records += records
+            if malformed:
+                self.malformed_count += len(malformed)
+                self.malformed_chunks += 1
+                self.examples.extend((chunk_id, line, reason) for line, reason in malformed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "records": self.records,
+                "malformed": self.malformed_count,
+                "malformed_chunks": self.malformed_chunks,
+            }
+
+# 原来的元组格式：
+# ("entity" : "实体名称" : "类型" : "描述")
+# ("relationship" : "源实体" : "目标实体" : "类型" : "描述" : 强度)
+# 每条记录先用预编译的整条匹配解析，描述取到记录末尾的引号为止，描述中含有分隔符时也能正确解析；
+# 匹配失败时再按已知的字段数切分，兼容缺少引号、空格不一致等情况，仍失败时记为格式错误。
+class TupleFormat(ResultFormat):
+    def __init__(self, tuple_delimiter=" : ", max_examples=20):
+        super().__init__(max_examples)
+        self.tuple_delimiter = tuple_delimiter
+        separator = r'"\s*' + re.escape(tuple_delimiter.strip()) + r'\s*'
+        self._entity = re.compile(
+            r'\(\s*"entity' + separator + r'"(.*?)' + separator + r'"(.*?)' + separator + r'"(.*)"\s*\)\s*'
+        )
+        self._relationship = re.compile(
+            r'\(\s*"relationship' + separator + r'"(.*?)' + separator + r'"(.*?)' + separator + r'"(.*?)'
+            + separator + r'"(.*)' + separator + r'"?(-?\d+(?:\.\d+)?)"?\s*\)\s*'
+        )
+
+    def parse_line(self, parser, line):
+        # 常见情况：一行恰好是一条完整的记录，按开头的记录类型只做一次整条匹配
+        start = RECORD_START.match(line)
+        if start is not None:
+            if start.group(1) == "entity":
+                fields = self._entity.fullmatch(line)
+                if fields and fields.group(1) and '("' not in fields.group(3):
+                    parser.add_entity(*fields.groups())
+                    return
+            else:
+                fields = self._relationship.fullmatch(line)
+                if fields and fields.group(1) and fields.group(2) and '("' not in fields.group(4):
+                    source, target, type, description, weight = fields.groups()
+                    parser.add_relationship(source, target, type, description, float(weight))
+                    return
+        # 一行中有多条记录或记录格式不标准时逐条解析
+        matches = list(RECORD_START.finditer(line))
+        if not matches:
+            if line.strip():
+                parser.reject(line, NOT_A_RECORD)
+            return
+        for k, match in enumerate(matches):
+            end = matches[k + 1].start() if k + 1 < len(matches) else len(line)
+            self._parse_record(parser, match.group(1), line[match.start():end], line[match.end():end])
+
+    # 按字段数切分一条记录，整条匹配失败时使用
+    def _parse_record(self, parser, kind, record, body):
+        body = body.strip()
+        if not body.endswith(")"):
+            parser.reject(record, "记录不完整")
+            return
+        body = body[:-1].strip()
+        separator = self.tuple_delimiter.strip()
+        if not body.startswith(separator):
+            parser.reject(record, "缺少分隔符")
+            return
+        body = body[len(separator):].strip()
+        if kind == "entity":
+            fields = body.split(self.tuple_delimiter, 2)
+            if len(fields) != 3:
+                parser.reject(record, "实体字段数不足")
+                return
+            name, type, description = (_unquote(field) for field in fields)
+            if not name:
+                parser.reject(record, "实体名称为空")
+                return
+            parser.add_entity(name, type, description)
+        else:
+            fields = body.split(self.tuple_delimiter, 3)
+            if len(fields) != 4 or self.tuple_delimiter not in fields[3]:
+                parser.reject(record, "关系字段数不足")
+                return
+            description, weight = fields[3].rsplit(self.tuple_delimiter, 1)
+            source, target, type = (_unquote(field) for field in fields[:3])
+            if not source or not target:
+                parser.reject(record, "关系的实体名称为空")
+                return
+            try:
+                weight = float(_unquote(weight))
+            except ValueError:
+                parser.reject(record, "关系强度不是数字")
+                return
+            parser.add_relationship(source, target, type, _unquote(description), weight)
+
+# 去掉字段两端的空白和引号
+def _unquote(field):
+    field = field.strip()
+    if len(field) >= 2 and field[0] == '"' and field[-1] == '"':
+        field = field[1:-1]
+    return field.strip()
+
+# 紧凑输出格式：每行一条记录，字段以"|"分隔，类型用编号表示，0表示"其他"
+# 实体：E|实体名称|类型编号|描述
+# 关系：R|源实体|目标实体|类型编号|强度|描述
+# 描述放在最后一个字段，其中出现的"|"不影响解析。
+TERSE_SEPARATOR = "|"
+
+# 生成紧凑输出格式的类型编号说明："1=名称(说明)；2=名称(说明)；…"，types为类型字典的列表
+def encode_type_codes(types):
+    return "；".join(f"{n}={t['name']}({t['description']})" for n, t in enumerate(types, start=1))
+
+# entity_types和relationship_types为类型名称列表，编号从1开始
+class TerseFormat(ResultFormat):
+    def __init__(self, entity_types, relationship_types, max_examples=20):
+        super().__init__(max_examples)
+        self.entity_types = self._code_table(entity_types)
+        self.relationship_types = self._code_table(relationship_types)
+
+    # 编号和名称都可以查到类型名称，模型直接输出类型名称时也能识别
+    @staticmethod
+    def _code_table(types):
+        table = {"0": OTHER_TYPE, OTHER_TYPE: OTHER_TYPE}
+        for n, name in enumerate(types, start=1):
+            table[str(n)] = name
+            table[name] = name
+        return table
+
+    def parse_line(self, parser, line):
+        line = line.strip()
+        if line.startswith("E" + TERSE_SEPARATOR):
+            fields = line.split(TERSE_SEPARATOR, 3)
+            if len(fields) != 4:
+                parser.reject(line, "实体字段数不足")
+                return
+            _, name, code, description = (field.strip() for field in fields)
+            if not name:
+                parser.reject(line, "实体名称为空")
+                return
+            parser.add_entity(name, self.entity_types.get(code, OTHER_TYPE), description)
+        elif line.startswith("R" + TERSE_SEPARATOR):
+            fields = line.split(TERSE_SEPARATOR, 5)
+            if len(fields) != 6:
+                parser.reject(line, "关系字段数不足")
+                return
+            _, source, target, code, weight, description = (field.strip() for field in fields)
+            if not source or not target:
+                parser.reject(line, "关系的实体名称为空")
+                return
+            try:
+                weight = float(weight)
+            except ValueError:
+                parser.reject(line, "关系强度不是数字")
+                return
+            parser.add_relationship(
+                source, target, self.relationship_types.get(code, OTHER_TYPE), description, weight
+            )
+        elif line:
+            parser.reject(line, NOT_A_RECORD)
+
+# 合并请求的流式解析：按编号标记把输出的各行分发给对应Chunk的解析器，同时保留每段的原始输出。
+# 重复出现的编号只取第一次；没有结束标记时输出可能被截断，最后一段视为缺失；解析失败的段也视为缺失。
+class PackedStreamParser:
+    def __init__(self, parsers):
+        self.parsers = parsers
+        self._texts = [None] * len(parsers)
+        self._current = None
+        self._last = None
+        self._complete = False
+        self._buffer = ""
+
+    def feed(self, text):
+        if "\n" not in text:
+            self._buffer += text
+            return
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self._route(line)
+
+    def _route(self, line):
+        if self._complete:
+            return
+        if PACK_END in line:
+            self._complete = True
+            line = line[:line.index(PACK_END)]
+            if line.strip() and self._current is not None:
+                self._texts[self._current].append(line)
+                self.parsers[self._current].feed(line + "\n")
+            return
+        match = PACK_MARKER_PATTERN.match(line)
+        if match:
+            n = int(match.group(1))
+            self._current = None
+            if 1 <= n <= len(self.parsers) and self._texts[n - 1] is None:
+                self._current = n - 1
+                self._last = n - 1
+                self._texts[n - 1] = []
+            return
+        if self._current is not None:
+            self._texts[self._current].append(line)
+            self.parsers[self._current].feed(line + "\n")
+
+    # 输出结束，返回每段的(原始输出, GraphDocument对象)，缺失或解析失败的段为None，
+    # 只有返回的段计入格式统计
+    def close(self):
+        if self._buffer:
+            self._route(self._buffer)
+            self._buffer = ""
+        if not self._complete and self._last is not None:
+            self._texts[self._last] = None
+        results = []
+        for parser, lines in zip(self.parsers, self._texts):
+            if lines is None:
+                results.append(None)
+                continue
+            graph_document = parser.close()
+            if parser.failed:
+                results.append(None)
+                continue
+            parser.accept()
+            results.append(("\n".join(lines).strip("\n"), graph_document))
+        return results
+
+# 默认的元组格式解析，GraphAbout.convert_to_graph_document使用
+TUPLE_FORMAT = TupleFormat()
@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+# 分词结果的持久化缓存
+# 以(分词模型标识, 段落内容的SHA-1)为键，保存段落中各token的起止字符位置，
+# 重复分词同一段落时直接从缓存中还原token，不再调用分词模型。
+# 缓存条目数超过max_entries时，按最近使用时间淘汰最旧的条目。
+# 条目数在打开数据库时统计一次，之后按插入和删除的行数增减，写入时不再逐次count(*)。
+class TokenCache:
+    def __init__(self, path, model_id, max_entries=1000000):
+        if max_entries < 1:  # 参数检查
+            raise ValueError("max_entries must be at least 1.")
+        self.path = path
+        self.model_id = model_id
+        self.max_entries = max_entries
+        # 命中与未命中计数
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    # 多进程分块时缓存对象会被pickle到子进程，子进程各自重新打开数据库连接
+    def __getstate__(self):
+        return {"path": self.path, "model_id": self.model_id, "max_entries": self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["model_id"], state["max_entries"])
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tokens (
+                    model_id TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    spans BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model_id, hash)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens(last_used)")
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT count(*) FROM tokens").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def _hash(paragraph):
+        return hashlib.sha1(paragraph.encode()).hexdigest()
+
+    # 把token列表编码为各token在段落中的起止位置，token不是段落的顺序子串时返回None（不缓存）
+    @staticmethod
+    def _encode(paragraph, tokens):
+        spans = array('I')
+        position = 0
+        for token in tokens:
+            start = paragraph.find(token, position)
+            if start < 0:
+                return None
+            position = start + len(token)
+            spans.append(start)
+            spans.append(position)
+        return spans.tobytes()
+
+    @staticmethod
+    def _decode(paragraph, blob):
+        spans = array('I')
+        spans.frombytes(blob)
+        return [paragraph[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2)]
+
+    # 批量查询，返回与paragraphs一一对应的token列表，未命中的位置为None
+    def get_many(self, paragraphs):
+        if not paragraphs:
+            return []
+        hashes = [self._hash(paragraph) for paragraph in paragraphs]
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            unique_hashes = list(dict.fromkeys(hashes))
+            # 分批查询，避免超过SQLite的参数个数限制
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT hash, spans FROM tokens WHERE model_id = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [self.model_id, *batch]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE tokens SET last_used = ? WHERE model_id = ? AND hash = ?",
+                    [(now, self.model_id, h) for h in found]
+                )
+                conn.commit()
+
+        results = []
+        for paragraph, h in zip(paragraphs, hashes):
+            if h in found:
+                results.append(self._decode(paragraph, found[h]))
+                self.hits += 1
+            else:
+                results.append(None)
+                self.misses += 1
+        return results
+
+    # 批量写入，超过容量时淘汰最久未使用的条目
+    def put_many(self, paragraphs, token_lists):
+        now = time.time()
+        blobs = {}  # 同一段落只写入一次
+        for paragraph, tokens in zip(paragraphs, token_lists):
+            blob = self._encode(paragraph, tokens)
+            if blob is not None:
+                blobs[self._hash(paragraph)] = blob
+        if not blobs:
+            return
+        rows = [(self.model_id, h, blob, now) for h, blob in blobs.items()]
+        with self._lock:
+            conn = self._connect()
+            # 先插入新条目，插入的行数即新增的条目数；已有的条目再更新
+            inserted = conn.executemany("INSERT OR IGNORE INTO tokens VALUES (?, ?, ?, ?)", rows).rowcount
+            if inserted < len(rows):
+                conn.executemany(
+                    "UPDATE tokens SET spans = ?, last_used = ? WHERE model_id = ? AND hash = ?",
+                    [(blob, now, self.model_id, h) for h, blob in blobs.items()]
+                )
+            self._count += inserted
+            if self._count > self.max_entries:
+                self._count -= conn.execute(
+                    "DELETE FROM tokens WHERE rowid IN (SELECT rowid FROM tokens ORDER BY last_used LIMIT ?)",
+                    (self._count - self.max_entries,)
+                ).rowcount
+            conn.commit()
+
+    # 缓存统计信息
+    def stats(self):
+        with self._lock:
+            self._connect()
+            entries = self._count
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    # 清空缓存
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM tokens")
+            conn.commit()
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -7,6 +7,7 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from my_packages import LLMAbout
 from my_packages import GraphAbout
 from my_packages.MyNeo4j import MyNeo4jGraph
+from create import DESCRIPTION_MAX_SENTENCES
 
 # 加载环境变量
 load_dotenv(".env")
@@ -15,7 +16,8 @@ NEO4J_USERNAME = os.environ["NEO4J_USERNAME"]
 NEO4J_PASSWORD = os.environ["NEO4J_PASSWORD"]
 
 if __name__ == '__main__':
-    graph = MyNeo4jGraph()
+    # 描述句子数上限与构建图谱时相同
+    graph = MyNeo4jGraph(max_description_sentences=DESCRIPTION_MAX_SENTENCES)
     print("数据库成功连接")
     print('')
     
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# create.py在导入时读取这些环境变量，测试不连接数据库也不调用真实的LLM
+for name in ("NEO4J_URI", "NEO4J_USERNAME", "NEO4J_PASSWORD", "DEEPSEEK_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试写入Neo4j的结点的id或fileName都以此开头，测试前后删除
+NEO4J_TEST_PREFIX = "__test"
+
+# 连接NEO4J_TEST_URI指定的测试数据库，未设置时跳过需要Neo4j的测试
+@pytest.fixture
+def neo4j_graph():
+    if not os.environ.get("NEO4J_TEST_URI"):
+        pytest.skip("NEO4J_TEST_URI未设置，跳过需要Neo4j的测试")
+    from my_packages.MyNeo4j import MyNeo4jGraph
+    graph = MyNeo4jGraph(
+        url=os.environ["NEO4J_TEST_URI"],
+        username=os.environ.get("NEO4J_TEST_USERNAME", "neo4j"),
+        password=os.environ.get("NEO4J_TEST_PASSWORD"),
+        refresh_schema=False,
+    )
+    cleanup = (
+        "MATCH (n) WHERE any(key IN ['id', 'fileName'] WHERE n[key] STARTS WITH $prefix) "
+        "DETACH DELETE n"
+    )
+    graph.query(cleanup, {"prefix": NEO4J_TEST_PREFIX})
+    yield graph
+    graph.query(cleanup, {"prefix": NEO4J_TEST_PREFIX})
+    graph.close()
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from my_packages.AdaptiveConcurrency import AdaptiveConcurrencyController, is_retryable_error
+
+# 带HTTP状态码的请求错误
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+class RateLimitError(Exception):
+    pass
+
+# 按顺序抛出errors中的错误，之后返回result
+class Flaky:
+    def __init__(self, errors, result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+def test_retryable_errors():
+    assert is_retryable_error(StatusError(429))
+    assert is_retryable_error(StatusError(503))
+    assert not is_retryable_error(StatusError(400))
+    assert is_retryable_error(RateLimitError())
+    assert not is_retryable_error(ValueError())
+
+# 成功请求使并发数加性增加：每完成一轮当前并发数的请求约增加increase，且不超过max_concurrency
+def test_additive_increase():
+    controller = AdaptiveConcurrencyController(initial_concurrency=4, max_concurrency=6, increase=1.0)
+    for _ in range(4):
+        controller.acquire()
+        controller.release(latency=0.1)
+    assert controller.concurrency == 4
+    controller.acquire()
+    controller.release(latency=0.1)
+    assert controller.concurrency == 5
+    for _ in range(100):
+        controller.acquire()
+        controller.release(latency=0.1)
+    assert controller.concurrency == 6
+
+# 限流使并发数乘性减小，一个冷却周期内的多次限流只减小一次，且不低于min_concurrency
+def test_multiplicative_decrease_once_per_cooldown():
+    controller = AdaptiveConcurrencyController(initial_concurrency=16, min_concurrency=3)
+    for _ in range(3):
+        controller.acquire()
+        controller.release(throttled=True)
+    assert controller.concurrency == 8
+    assert controller.stats()["throttled"] == 3
+    for _ in range(3):
+        controller._last_decrease = 0.0  # 跳过冷却时间
+        controller.acquire()
+        controller.release(throttled=True)
+    assert controller.concurrency == 3
+
+# 延迟明显高于基线时视为拥塞，减小并发数
+def test_latency_increase_decreases_concurrency():
+    controller = AdaptiveConcurrencyController(initial_concurrency=10, max_concurrency=10)
+    for _ in range(30):
+        controller.acquire()
+        controller.release(latency=0.1)
+    assert controller.concurrency == 10
+    for _ in range(5):
+        controller.acquire()
+        controller.release(latency=1.0)
+    assert controller.concurrency == 5
+
+# 可重试的错误重试后成功，不可重试的错误直接抛出，重试超过max_retries后抛出最后的错误
+def test_call_retries_only_retryable_errors():
+    controller = AdaptiveConcurrencyController(max_retries=2, base_delay=0.0)
+    fn = Flaky([StatusError(429), RateLimitError()])
+    assert controller.call(fn) == "ok"
+    assert fn.calls == 3 and controller.retries == 2
+
+    fn = Flaky([StatusError(400)])
+    with pytest.raises(StatusError):
+        controller.call(fn)
+    assert fn.calls == 1 and controller.errors == 1
+
+    fn = Flaky([StatusError(503)] * 3)
+    with pytest.raises(StatusError):
+        controller.call(fn)
+    assert fn.calls == 3
+    assert controller.stats()["in_flight"] == 0
+
+# map按输入顺序返回结果，同时进行的请求数不超过并发数
+def test_map_respects_concurrency_limit():
+    controller = AdaptiveConcurrencyController(initial_concurrency=3, max_concurrency=3)
+    lock = threading.Lock()
+    active = [0, 0]  # 当前进行中的请求数，最大值
+
+    def work(x):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return x * x
+
+    assert controller.map(work, range(20)) == [x * x for x in range(20)]
+    assert 1 <= active[1] <= 3
+    assert controller.map(work, []) == []
+
+def test_concurrency_bounds_checked():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrencyController(initial_concurrency=8, max_concurrency=4)
+    with pytest.raises(ValueError):
+        AdaptiveConcurrencyController(decrease_factor=1.0)
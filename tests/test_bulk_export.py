@@ -0,0 +1,126 @@
+import csv
+import os
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from langchain_neo4j.graphs.graph_document import GraphDocument, Node, Relationship
+
+import create
+from my_packages import GraphAbout
+from my_packages.BulkExport import (
+    ARRAY_DELIMITER, ARRAY_DELIMITER_OPTION, NODE_FILES, RELATIONSHIP_FILES, BulkImportWriter, verify
+)
+from my_packages.MyNeo4j import BASE_ENTITY_LABEL
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.token_count = len(text)
+
+def read_csv(directory, name):
+    with open(os.path.join(directory, name), encoding="utf-8", newline="") as f:
+        header, *rows = csv.reader(f)
+    return header, [dict(zip(header, row)) for row in rows]
+
+def graph_document(chunk_id, nodes, relationships=()):
+    return GraphDocument(
+        nodes=nodes, relationships=list(relationships),
+        source=Document(page_content="文本", metadata={"chunk_id": chunk_id})
+    )
+
+# 两个文件共有一个Chunk，同一实体在两个Chunk中被提到，第二次只出现在关系中，类型为'未知'
+def write_small_graph(directory):
+    writer = BulkImportWriter(str(directory))
+    texts = {"a.txt": ["脑卒中是急性脑血管疾病。", "两个文件共有的一段。"], "b.txt": ["偏瘫常见于脑卒中。", "两个文件共有的一段。"]}
+    chunk_ids = {}
+    for file_name, file_texts in texts.items():
+        chunks, chunk_rows, relationships = GraphAbout.build_chunk_rows(file_name, [FakeChunk(t) for t in file_texts])
+        chunk_ids[file_name] = [chunk["chunk_id"] for chunk in chunks]
+        writer.add_document(file_name, "local", "./data", f"hash-{file_name}")
+        writer.add_chunks(file_name, chunk_rows, relationships, extracted={chunk_ids[file_name][0]})
+    stroke = Node(id="脑卒中", type="疾病", properties={"description": "脑卒中是急性脑血管疾病。发病急；"})
+    stroke_again = Node(id="脑卒中", type="未知", properties={"description": "脑卒中可导致偏瘫。发病急"})
+    hemiplegia = Node(id="偏瘫", type="症状", properties={"description": "偏瘫是一侧肢体瘫痪。"})
+    writer.add_graph_document(graph_document(chunk_ids["a.txt"][0], [stroke]))
+    writer.add_graph_document(graph_document(
+        chunk_ids["b.txt"][0], [stroke_again, hemiplegia],
+        [Relationship(source=stroke_again, target=hemiplegia, type="临床 表现", properties={"weight": 8.0})]
+    ))
+    return writer.close(), chunk_ids
+
+# 生成的文件通过检查，表头与定义相同，id和标签列、数组列使用约定的分隔符
+def test_export_writes_valid_import_files(tmp_path):
+    counts, chunk_ids = write_small_graph(tmp_path)
+    assert verify(str(tmp_path)) == []
+    assert counts["chunks.csv"] == 3 and counts["part_of.csv"] == 4 and counts["mentions.csv"] == 3
+
+    for name, expected in {**NODE_FILES, **RELATIONSHIP_FILES}.items():
+        header, _ = read_csv(tmp_path, name)
+        if expected is not None:
+            assert header == expected
+
+    header, entities = read_csv(tmp_path, "entities.csv")
+    assert header[0] == "id:ID(Entity)" and header[-1] == ":LABEL"
+    assert "descriptions:string[]" in header and "description_hashes:string[]" in header
+    stroke = next(row for row in entities if row["id:ID(Entity)"] == "脑卒中")
+    assert stroke[":LABEL"].split(ARRAY_DELIMITER) == [BASE_ENTITY_LABEL, "疾病"]
+    assert stroke["descriptions:string[]"].split(ARRAY_DELIMITER) == ["脑卒中是急性脑血管疾病", "发病急", "脑卒中可导致偏瘫"]
+    assert stroke["description"] == "脑卒中是急性脑血管疾病；发病急；脑卒中可导致偏瘫"
+    assert len(stroke["description_hashes:string[]"].split(ARRAY_DELIMITER)) == 3
+
+    header, relationships = read_csv(tmp_path, "relationships.csv")
+    assert header == [":START_ID(Entity)", ":END_ID(Entity)", ":TYPE", "weight:float"]
+    assert [(r[":START_ID(Entity)"], r[":END_ID(Entity)"], r[":TYPE"]) for r in relationships] == [("脑卒中", "偏瘫", "临床_表现")]
+
+    # 共有的Chunk只有一个结点，属性取第一次出现时的值，在每个文件中的位置写在PART_OF关系上
+    _, chunks = read_csv(tmp_path, "chunks.csv")
+    shared = chunk_ids["a.txt"][1]
+    assert [row["fileName"] for row in chunks if row["id:ID(Chunk)"] == shared] == ["a.txt"]
+    assert {row["id:ID(Chunk)"]: row["extracted:boolean"] for row in chunks}[chunk_ids["a.txt"][0]] == "true"
+    _, part_of = read_csv(tmp_path, "part_of.csv")
+    assert sorted(row[":END_ID(Document)"] for row in part_of if row[":START_ID(Chunk)"] == shared) == ["a.txt", "b.txt"]
+    _, next_chunk = read_csv(tmp_path, "next_chunk.csv")
+    assert sorted(row["fileName"] for row in next_chunk) == ["a.txt", "b.txt"]
+
+    with open(tmp_path / "import.sh", encoding="utf-8") as f:
+        script = f.read()
+    assert f"--array-delimiter={ARRAY_DELIMITER_OPTION}" in script
+    assert all(f"--nodes={name}" in script for name in NODE_FILES)
+
+# 检查能发现重复的id、不存在的关系端点和列数不对的行
+def test_verify_reports_problems(tmp_path):
+    write_small_graph(tmp_path)
+    with open(tmp_path / "mentions.csv", "a", encoding="utf-8", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerows([["不存在的Chunk", "脑卒中", "MENTIONS"], ["少一列", "MENTIONS"]])
+    with open(tmp_path / "documents.csv", "a", encoding="utf-8", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerow(["a.txt", "local", "./data", "", "__Document__"])
+    problems = verify(str(tmp_path))
+    assert len(problems) == 3
+    assert any("起点不存在" in problem for problem in problems)
+    assert any("列数" in problem for problem in problems)
+    assert any("重复的结点id" in problem for problem in problems)
+
+# 分组导出时，之前的组中出现过的Chunk不再提取，共有的Chunk的实体只写入一次
+def test_export_groups_share_seen_chunks(monkeypatch, tmp_path):
+    def chunk_files(file_contents, token_cache, workers=1):
+        for file_content in file_contents:
+            file_content.append([FakeChunk(text) for text in file_content[1].split("\n")])
+    monkeypatch.setattr(create, "chunk_files", chunk_files)
+    calls = []
+    def llm(inputs):
+        calls.append(inputs["input_text"])
+        return '("entity" : "脑卒中" : "疾病" : "一种疾病")\n'
+
+    writer = BulkImportWriter(str(tmp_path))
+    seen = set()
+    for group in (
+        [["a.txt", "第一段。\n共有的一段。"]],
+        [["b.txt", "共有的一段。\n第二段。"]],
+    ):
+        create.export_files(writer, RunnableLambda(llm), {}, group, seen=seen)
+    writer.close()
+    assert sorted(calls) == sorted(["第一段。", "共有的一段。", "第二段。"])
+    assert verify(str(tmp_path)) == []
+    _, chunks = read_csv(tmp_path, "chunks.csv")
+    assert len(chunks) == 3 and all(row["extracted:boolean"] == "true" for row in chunks)
@@ -0,0 +1,57 @@
+import pytest
+
+from my_packages.ExtractionCache import ExtractionCache
+from my_packages.TokenCache import TokenCache
+
+# 写入时记录执行的SQL语句
+def trace(cache):
+    statements = []
+    cache._connect().set_trace_callback(statements.append)
+    return statements
+
+def count_rows(cache, table):
+    return cache._connect().execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+# 重复写入、覆盖和淘汰后，维护的条目数与数据库中的条目数相同，写入时不执行count(*)
+def test_extraction_cache_keeps_running_count(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "extractions.sqlite"), "prompt", max_entries=5)
+    statements = trace(cache)
+    cache.put_many([("a", "1"), ("b", "2"), ("a", "3")])
+    cache.put_many([("b", "4"), ("c", "5")])
+    assert not any("count(" in statement for statement in statements)
+    assert cache.stats()["entries"] == count_rows(cache, "extractions") == 3
+    assert cache.get_many(["a", "b"]) == {"a": "3", "b": "4"}
+    statements.clear()
+    cache.put_many([(str(i), "x") for i in range(3)])
+    assert not any("count(" in statement for statement in statements)
+    assert cache.stats()["entries"] == count_rows(cache, "extractions") == 5
+    # 最近读取的a、b保留，最早写入且没有再使用的c被淘汰
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "b"}
+    cache.close()
+
+    # 重新打开时从数据库统计条目数
+    reopened = ExtractionCache(str(tmp_path / "extractions.sqlite"), "prompt", max_entries=5)
+    assert reopened.stats()["entries"] == 5
+    reopened.close()
+
+def test_token_cache_keeps_running_count(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.sqlite"), "model", max_entries=3)
+    statements = trace(cache)
+    cache.put_many(["脑卒中", "偏瘫", "脑卒中"], [["脑", "卒中"], ["偏瘫"], ["脑卒中"]])
+    assert not any("count(" in statement for statement in statements)
+    assert cache.stats()["entries"] == count_rows(cache, "tokens") == 2
+    assert cache.get_many(["脑卒中"]) == [["脑卒中"]]
+    statements.clear()
+    cache.put_many(["高血压", "糖尿病"], [["高血压"], ["糖尿病"]])
+    assert not any("count(" in statement for statement in statements)
+    assert cache.stats()["entries"] == count_rows(cache, "tokens") == 3
+    # 最近读取的"脑卒中"保留，"偏瘫"被淘汰
+    assert cache.get_many(["脑卒中", "偏瘫"]) == [["脑卒中"], None]
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+@pytest.mark.parametrize("cache_class", [ExtractionCache, TokenCache])
+def test_max_entries_must_be_positive(tmp_path, cache_class):
+    with pytest.raises(ValueError):
+        cache_class(str(tmp_path / "cache.sqlite"), "key", max_entries=0)
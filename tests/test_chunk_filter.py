@@ -0,0 +1,35 @@
+import pytest
+
+from my_packages.ChunkFilter import KeywordFilter, MEDICAL_KEYWORDS, vocabulary_from_types
+
+TYPES = [
+    {"name": "疾病", "description": "疾病名称，如脑卒中、高血压、糖尿病等"},
+    {"name": "药物", "description": "治疗用的药物"},
+]
+
+# 关键词包括类型名称和说明中"如"后面的示例
+def test_vocabulary_from_types():
+    assert vocabulary_from_types(TYPES) == ["疾病", "脑卒中", "高血压", "糖尿病", "药物"]
+
+# 单个汉字不作为关键词，开心、药店之类的普通词不命中
+def test_single_character_keywords_ignored():
+    chunk_filter = KeywordFilter(["心", "药", "血压"])
+    assert chunk_filter.score("今天很开心，去药店买了东西") == 0.0
+    assert chunk_filter.score("测量血压") == 25.0
+    with pytest.raises(ValueError):
+        KeywordFilter(["心", "药"])
+
+# 长的关键词优先匹配，"脑卒中"只计一次，不再计入其中的"卒中"
+def test_longest_keyword_counted_once():
+    chunk_filter = KeywordFilter(["卒中", "脑卒中"])
+    assert chunk_filter.score("脑卒中") == pytest.approx(100 / 3)
+
+# 网站导航、免责声明等文本得分低于默认阈值，医学文本高于阈值；空白不计入长度
+def test_boilerplate_scores_below_threshold():
+    chunk_filter = KeywordFilter(MEDICAL_KEYWORDS + vocabulary_from_types(TYPES))
+    boilerplate = "首页 | 关于我们 | 联系我们 | 网站地图 | 版权所有 © 2024 本站内容仅供参考，转载请注明出处。"
+    medical = "脑卒中患者发病后应尽快就诊，医生通过头颅CT明确诊断，缺血性脑卒中可在时间窗内静脉溶栓治疗，高血压患者需长期服用药物控制血压。"
+    assert chunk_filter.score(boilerplate) < chunk_filter.min_density
+    assert chunk_filter.score(medical) >= chunk_filter.min_density
+    assert chunk_filter.score("  \n ") == 0.0
+    assert chunk_filter.score("血压 血压") == chunk_filter.score("血压血压")
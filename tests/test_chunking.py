@@ -0,0 +1,183 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from my_packages import DataLoader
+from my_packages.TokenCache import TokenCache
+
+# 按字符分词的分词器，与HanLP分词器的调用方式相同：输入字符串返回token列表，输入列表返回各自的token列表
+class CharTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text, batch_size=None):
+        self.calls += 1
+        if isinstance(text, list):
+            return [list(paragraph) for paragraph in text]
+        return list(text)
+
+# 随机生成的多段文本，句子长短不一，部分段落没有句子结束符
+def make_text(seed, paragraphs=30):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(1, 8)):
+            sentence = "".join(rng.choice("脑卒中高血压患者治疗康复护理") for _ in range(rng.randint(3, 60)))
+            sentences.append(sentence + rng.choice(["。", "！", "？", "，", ""]))
+        lines.append("".join(sentences))
+    return "\n".join(lines)
+
+TEXTS = [make_text(seed) for seed in range(8)] + ["", "没有句子结束符的短文本", "一句。\n\n两句。三句！"]
+
+# 原来逐段分词、在token列表上切片的分块实现，作为分块结果的参照
+def reference_chunk_text(text, tokenizer, chunk_size=500, overlap=80):
+    def forward(tokens, size):
+        for i in range(size, len(tokens)):
+            if DataLoader.is_sentence_end(tokens[i]):
+                return i + 1
+        return len(tokens)
+
+    def backward(tokens, start):
+        for i in range(start - 1, -1, -1):
+            if DataLoader.is_sentence_end(tokens[i]):
+                return i + 1
+        return 0
+
+    paragraphs = DataLoader.split_into_paragraphs(text)
+    chunks = []
+    buffer = []
+    i = 0
+    while i < len(paragraphs):
+        while len(buffer) < chunk_size and i < len(paragraphs):
+            buffer.extend(tokenizer(paragraphs[i]))
+            i += 1
+        while len(buffer) >= chunk_size:
+            end = forward(buffer, chunk_size)
+            chunks.append(buffer[:end])
+            start_next = backward(buffer, end - overlap)
+            if start_next == 0:
+                start_next = backward(buffer, end - 1)
+            if start_next == 0:
+                start_next = end - overlap
+            buffer = buffer[start_next:]
+    if buffer:
+        if chunks:
+            last_chunk = chunks[-1]
+            rest = "".join(buffer)
+            if "".join(last_chunk[len(last_chunk) - len(rest):]) != rest:
+                chunks.append(buffer)
+        else:
+            chunks.append(buffer)
+    return chunks
+
+# 在token下标上分块的结果与原来在token列表上切片的结果相同
+@pytest.mark.parametrize("chunk_size, overlap", [(500, 80), (120, 30), (40, 39)])
+def test_chunk_spans_match_list_based_chunker(chunk_size, overlap):
+    tokenizer = CharTokenizer()
+    for text in TEXTS:
+        expected = reference_chunk_text(text, tokenizer, chunk_size, overlap)
+        assert DataLoader.chunk_text(text, chunk_size, overlap, tokenizer=tokenizer) == expected
+
+# 批量分词与逐段分词的分块结果相同，批量分词时分词器的调用次数与段落数无关
+def test_batched_tokenization_matches_per_paragraph():
+    for text in TEXTS:
+        per_paragraph = DataLoader.chunk_text(text, 120, 30, tokenizer=CharTokenizer())
+        tokenizer = CharTokenizer()
+        batched = DataLoader.chunk_text(text, 120, 30, batch_size=16, tokenizer=tokenizer)
+        assert batched == per_paragraph
+        assert tokenizer.calls <= 1
+
+# Chunk对象的文本、长度和token数与token列表一致，同一文件的Chunk共享一个所属文本
+def test_chunks_match_token_lists():
+    tokenizer = CharTokenizer()
+    results = DataLoader.chunk_texts(TEXTS, 120, 30, batch_size=8, tokenizer=tokenizer)
+    assert len(results) == len(TEXTS)
+    for text, chunks in zip(TEXTS, results):
+        expected = reference_chunk_text(text, tokenizer, 120, 30)
+        assert [chunk.text for chunk in chunks] == ["".join(tokens) for tokens in expected]
+        assert [chunk.token_count for chunk in chunks] == [len(tokens) for tokens in expected]
+        assert [chunk.length for chunk in chunks] == [len("".join(tokens)) for tokens in expected]
+        assert len({id(chunk.source) for chunk in chunks}) <= 1
+
+def test_chunk_size_must_exceed_overlap():
+    with pytest.raises(ValueError):
+        DataLoader.chunk_text("文本。", 80, 80, tokenizer=CharTokenizer())
+
+# 只导入DataLoader并读入文件时不加载HanLP
+def test_import_does_not_load_hanlp(tmp_path):
+    (tmp_path / "a.txt").write_text("文本。", encoding="utf-8")
+    code = (
+        "import sys\n"
+        "from my_packages import DataLoader\n"
+        f"DataLoader.read_txt_files({str(tmp_path)!r})\n"
+        "print('hanlp' in sys.modules)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+# 注入的分词器在没有传入tokenizer时使用，传入None后恢复为按需加载
+def test_set_tokenizer_injects_default():
+    tokenizer = CharTokenizer()
+    DataLoader.set_tokenizer(tokenizer)
+    try:
+        assert DataLoader.get_tokenizer() is tokenizer
+        assert DataLoader.chunk_text(TEXTS[0], 120, 30) == reference_chunk_text(TEXTS[0], CharTokenizer(), 120, 30)
+        assert tokenizer.calls > 0
+    finally:
+        DataLoader.set_tokenizer(None)
+    assert DataLoader._tokenizer is None
+
+def chunk_summary(results):
+    return [[(chunk.text, chunk.token_count) for chunk in chunks] for chunks in results]
+
+# 多进程分块的结果与串行分块相同，且按输入文件的顺序返回
+def test_parallel_chunking_matches_serial():
+    serial = DataLoader.chunk_texts(TEXTS, 120, 30, tokenizer=CharTokenizer())
+    parallel = DataLoader.parallel_chunk_texts(TEXTS, 120, 30, workers=2, tokenizer=CharTokenizer())
+    assert chunk_summary(parallel) == chunk_summary(serial)
+    assert DataLoader.parallel_chunk_texts([], 120, 30, workers=2, tokenizer=CharTokenizer()) == []
+
+def test_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        DataLoader.parallel_chunk_texts(TEXTS, 120, 30, workers=0, tokenizer=CharTokenizer())
+
+# 第二次分块时所有段落命中分词缓存，不再调用分词器，分块结果不变；多进程分块的命中次数汇总到传入的缓存对象
+def test_token_cache_reuses_tokenization(tmp_path):
+    path = str(tmp_path / "tokens.sqlite")
+    paragraph_count = len(set(p for text in TEXTS for p in DataLoader.split_into_paragraphs(text)))
+    cache = TokenCache(path, "char")
+    first = DataLoader.chunk_texts(TEXTS, 120, 30, tokenizer=CharTokenizer(), cache=cache)
+    assert cache.hits == 0 and cache.stats()["entries"] == paragraph_count
+    tokenizer = CharTokenizer()
+    second = DataLoader.chunk_texts(TEXTS, 120, 30, tokenizer=tokenizer, cache=cache)
+    assert tokenizer.calls == 0
+    assert chunk_summary(second) == chunk_summary(first)
+    cache.close()
+
+    cache = TokenCache(path, "char")
+    parallel = DataLoader.parallel_chunk_texts(TEXTS, 120, 30, workers=2, tokenizer=CharTokenizer(), cache=cache)
+    assert chunk_summary(parallel) == chunk_summary(first)
+    assert cache.misses == 0 and cache.hits > 0
+    cache.close()
+
+    # 模型标识不同时不使用其它模型的分词结果
+    cache = TokenCache(path, "other")
+    assert cache.get_many(DataLoader.split_into_paragraphs(TEXTS[0])[:1]) == [None]
+    cache.close()
+
+# 逐个产出子目录中的.txt文件，文件名为以"/"分隔的相对路径，mmap读取的内容与普通读取相同
+def test_iter_txt_files_relative_paths(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.txt").write_text(TEXTS[0], encoding="utf-8")
+    (tmp_path / "sub" / "a.txt").write_text(TEXTS[1], encoding="utf-8")
+    (tmp_path / "b.md").write_text("不是文本文件", encoding="utf-8")
+    files = DataLoader.iter_txt_files(str(tmp_path))
+    assert not isinstance(files, list)
+    assert sorted(files) == [["a.txt", TEXTS[0]], ["sub/a.txt", TEXTS[1]]]
+    mapped = DataLoader.iter_txt_files(str(tmp_path), mmap_threshold=1)
+    assert sorted(mapped) == sorted(DataLoader.read_txt_files(str(tmp_path)))
@@ -0,0 +1,287 @@
+import time
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+import create
+
+OUTPUT = (
+    '("entity" : "脑卒中" : "疾病" : "一种疾病")\n'
+    '("entity" : "偏瘫" : "症状" : "偏瘫症状")\n'
+    '("relationship" : "脑卒中" : "偏瘫" : "有症状" : "脑卒中有偏瘫症状" : 8)\n'
+)
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.token_count = len(text)
+
+def make_file_contents(count):
+    texts = [f"第{i}段关于脑卒中的文本。" for i in range(count)]
+    return [[
+        "f.txt", "".join(texts), [FakeChunk(text) for text in texts],
+        [{"chunk_id": f"chunk-{i}", "chunk_doc": Document(page_content=text)} for i, text in enumerate(texts)],
+    ]]
+
+# 处理结果出错或被中断时，尚未调用LLM的请求被取消，不会在抛出异常前等待全部请求完成
+@pytest.mark.parametrize("error", [RuntimeError, KeyboardInterrupt])
+def test_pending_requests_cancelled_when_on_result_fails(error):
+    calls = []
+    lock = threading.Lock()
+
+    def llm(inputs):
+        with lock:
+            calls.append(inputs["input_text"])
+        time.sleep(0.05)
+        return OUTPUT
+
+    results = []
+    def on_result(file_content, i, graph_document=None):
+        results.append(i)
+        if len(results) == 2:
+            raise error("writer failed")
+
+    with pytest.raises(error):
+        create.extract_entities_and_relationships(None, RunnableLambda(llm), {}, make_file_contents(40), on_result=on_result)
+    # 等待进行中的请求结束后，请求数不再增加
+    time.sleep(0.5)
+    with lock:
+        count = len(calls)
+    time.sleep(0.2)
+    assert len(calls) == count
+    assert count < 40
+
+# 被拒绝后重试的输出不计入格式统计，只统计最终采用的解析结果
+def test_format_stats_count_only_accepted_parses(monkeypatch):
+    monkeypatch.setattr(create, "EXTRACTION_RETRY_DELAY", 0)
+    attempts = {}
+    lock = threading.Lock()
+
+    def llm(inputs):
+        with lock:
+            attempts[inputs["input_text"]] = attempts.get(inputs["input_text"], 0) + 1
+            first = attempts[inputs["input_text"]] == 1
+        return '("entity" : "脑卒中")\n' if first else OUTPUT
+
+    result_format = create.ResultParser.TupleFormat()
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(llm), {}, make_file_contents(3), result_format=result_format
+    )
+    assert all(count == 2 for count in attempts.values())
+    assert result_format.stats() == {"records": 9, "malformed": 0, "malformed_chunks": 0}
+
+# 预筛选跳过的Chunk记入死信记录，可以用--retry-failed重新提取
+def test_prefilter_skipped_chunks_recorded_as_dead_letters(monkeypatch, tmp_path):
+    monkeypatch.setattr(create, "PREFILTER_MODE", "skip")
+    monkeypatch.setattr(create, "PREFILTER_REPORT_PATH", str(tmp_path / "prefilter_report.tsv"))
+    file_contents = make_file_contents(2)
+    file_contents[0][2][1].text = "首页 | 关于我们 | 联系我们 | 网站地图"
+    calls = []
+    def llm(inputs):
+        calls.append(inputs["input_text"])
+        return OUTPUT
+
+    dead_letters = create.DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+    chunk_filter = create.KeywordFilter(create.MEDICAL_KEYWORDS + ["脑卒中"])
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(llm), {}, file_contents, dead_letters=dead_letters, chunk_filter=chunk_filter
+    )
+    assert calls == [file_contents[0][2][0].text]
+    assert [row[0] for row in dead_letters.get_all()] == ["chunk-1"]
+    dead_letters.close()
+
+# 记录写入的图对象和查询的图对象，不连接数据库；extracted为数据库中已提取的chunk_id
+class FakeGraph:
+    def __init__(self, extracted=()):
+        self.extracted = set(extracted)
+        self.graph_documents = []
+        self.marked = []
+
+    def query(self, query, params=None):
+        if "c.extracted = true OR" in query:
+            return [{"id": chunk_id} for chunk_id in params["chunk_ids"] if chunk_id in self.extracted]
+        if "SET c.extracted = true" in query:
+            self.marked.extend(params["chunk_ids"])
+        return []
+
+    def add_graph_documents(self, graph_documents, **kwargs):
+        self.graph_documents.extend(graph_documents)
+
+# 没有提取出实体关系的Chunk也记录为已提取，之后不再请求LLM；提取失败的Chunk不记录
+@pytest.mark.parametrize("overlap_writes", [True, False])
+def test_empty_results_marked_extracted(monkeypatch, overlap_writes):
+    monkeypatch.setattr(create, "OVERLAP_WRITES", overlap_writes)
+    monkeypatch.setattr(create, "EXTRACTION_RETRY_DELAY", 0)
+    file_contents = make_file_contents(3)
+    texts = [chunk.text for chunk in file_contents[0][2]]
+    def llm(inputs):
+        if inputs["input_text"] == texts[1]:
+            return ""
+        if inputs["input_text"] == texts[2]:
+            raise RuntimeError("request failed")
+        return OUTPUT
+
+    graph = FakeGraph()
+    create.extract_and_write(graph, RunnableLambda(llm), {}, file_contents)
+    assert sorted(graph.marked) == ["chunk-0", "chunk-1"]
+    assert [d.source.metadata["chunk_id"] for d in graph.graph_documents] == ["chunk-0"]
+
+    calls = []
+    def counting_llm(inputs):
+        calls.append(inputs["input_text"])
+        return OUTPUT
+    create.extract_and_write(FakeGraph(graph.marked), RunnableLambda(counting_llm), {}, make_file_contents(3))
+    assert calls == [texts[2]]
+
+# 只有说明文字的输出是空结果：不重试，不记入死信记录，Chunk记录为已提取
+def test_prose_reply_not_retried(monkeypatch, tmp_path):
+    monkeypatch.setattr(create, "EXTRACTION_RETRY_DELAY", 0)
+    calls = []
+    def llm(inputs):
+        calls.append(inputs["input_text"])
+        return "文本中没有实体。"
+
+    graph = FakeGraph()
+    dead_letters = create.DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+    create.extract_and_write(graph, RunnableLambda(llm), {}, make_file_contents(2), dead_letters=dead_letters)
+    assert len(calls) == 2
+    assert dead_letters.get_all() == []
+    assert sorted(graph.marked) == ["chunk-0", "chunk-1"]
+    dead_letters.close()
+
+# 内容相同的Chunk（chunk_id相同）只请求一次LLM，包括在同一文件中和不同文件中重复出现的；
+# 只有第一次出现处有提取结果
+def test_duplicate_chunks_extracted_once():
+    file_contents = make_file_contents(2) + make_file_contents(2)
+    file_contents[0][2].append(FakeChunk(file_contents[0][2][0].text))
+    file_contents[0][3].append(dict(file_contents[0][3][0]))
+    calls = []
+    lock = threading.Lock()
+    def llm(inputs):
+        with lock:
+            calls.append(inputs["input_text"])
+        return OUTPUT
+
+    results = []
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(llm), {}, file_contents,
+        on_result=lambda file_content, i, graph_document=None: results.append(file_content[3][i]["chunk_id"])
+    )
+    assert sorted(calls) == sorted(chunk.text for chunk in file_contents[0][2][:2])
+    assert sorted(results) == ["chunk-0", "chunk-1"]
+    assert file_contents[0][4] == [OUTPUT, OUTPUT, None]
+    assert file_contents[1][4] == [None, None]
+
+# 所有文件的Chunk进入同一个任务队列，不同文件的请求同时进行，不必等前一个文件全部完成
+def test_chunks_of_different_files_requested_concurrently():
+    file_contents = []
+    for n in range(6):
+        file_content = make_file_contents(1)[0]
+        file_content[0] = f"f{n}.txt"
+        file_content[2][0].text += str(n)
+        file_content[3][0]["chunk_id"] = f"chunk-{n}"
+        file_contents.append(file_content)
+    lock = threading.Lock()
+    active = set()
+    overlapping = set()
+    def llm(inputs):
+        with lock:
+            active.add(inputs["input_text"])
+            if len(active) > 1:
+                overlapping.update(active)
+        time.sleep(0.05)
+        with lock:
+            active.discard(inputs["input_text"])
+        return OUTPUT
+
+    create.extract_entities_and_relationships(None, RunnableLambda(llm), {}, file_contents)
+    assert len(overlapping) > 1
+    assert all(file_content[4] == [OUTPUT] for file_content in file_contents)
+
+# 从断点继续时已完成的Chunk使用记录的输出，只重新请求失败或未完成的Chunk；提示词不同时不能继续
+def test_resume_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(create, "EXTRACTION_RETRY_DELAY", 0)
+    path = str(tmp_path / "checkpoint.sqlite")
+    texts = [chunk.text for chunk in make_file_contents(3)[0][2]]
+    def failing_llm(inputs):
+        if inputs["input_text"] == texts[2]:
+            raise RuntimeError("request failed")
+        return OUTPUT
+
+    checkpoint = create.ExtractionCheckpoint(path)
+    checkpoint.start("prompt")
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(failing_llm), {}, make_file_contents(3), checkpoint=checkpoint
+    )
+    assert checkpoint.stats() == {"done": 2, "failed": 1}
+    checkpoint.close()
+
+    calls = []
+    def llm(inputs):
+        calls.append(inputs["input_text"])
+        return OUTPUT
+    checkpoint = create.ExtractionCheckpoint(path)
+    checkpoint.resume("prompt")
+    file_contents = make_file_contents(3)
+    results = []
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(llm), {}, file_contents, checkpoint=checkpoint,
+        on_result=lambda file_content, i, graph_document=None: results.append(i)
+    )
+    assert calls == [texts[2]]
+    assert sorted(results) == [0, 1, 2] and file_contents[0][4] == [OUTPUT] * 3
+    assert checkpoint.stats() == {"done": 3}
+    checkpoint.close()
+
+    checkpoint = create.ExtractionCheckpoint(path)
+    with pytest.raises(ValueError):
+        checkpoint.resume("changed prompt")
+    checkpoint.close()
+
+# 数据库中存在的Chunk结点，用于重新处理死信记录
+class ChunkGraph(FakeGraph):
+    def __init__(self, chunk_ids):
+        super().__init__()
+        self.chunk_ids = set(chunk_ids)
+
+    def query(self, query, params=None):
+        if "RETURN c.id AS id" in query and "extracted" not in query:
+            return [{"id": chunk_id} for chunk_id in params["chunk_ids"] if chunk_id in self.chunk_ids]
+        return super().query(query, params)
+
+# 出错的Chunk重试后成功时不记入死信记录；重试EXTRACTION_MAX_ATTEMPTS次仍失败的记入死信记录，不影响其它Chunk。
+# 之后只重新处理死信记录中的Chunk，成功后删除记录，Chunk结点已不存在的记录直接删除
+def test_failed_chunks_retried_then_dead_lettered(monkeypatch, tmp_path):
+    monkeypatch.setattr(create, "EXTRACTION_RETRY_DELAY", 0)
+    file_contents = make_file_contents(3)
+    texts = [chunk.text for chunk in file_contents[0][2]]
+    attempts = {}
+    lock = threading.Lock()
+    def llm(inputs):
+        with lock:
+            attempts[inputs["input_text"]] = attempts.get(inputs["input_text"], 0) + 1
+            count = attempts[inputs["input_text"]]
+        if inputs["input_text"] == texts[2] or (inputs["input_text"] == texts[1] and count == 1):
+            raise RuntimeError("request failed")
+        return OUTPUT
+
+    graph = FakeGraph()
+    dead_letters = create.DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+    create.extract_and_write(graph, RunnableLambda(llm), {}, file_contents, dead_letters=dead_letters)
+    assert attempts == {texts[0]: 1, texts[1]: 2, texts[2]: create.EXTRACTION_MAX_ATTEMPTS}
+    assert sorted(graph.marked) == ["chunk-0", "chunk-1"]
+    assert dead_letters.get_all() == [("chunk-2", "f.txt", texts[2], len(texts[2]))]
+    dead_letters.add("stale-chunk", "g.txt", "已修改的文件中的文本。", 10, "request failed")
+
+    calls = []
+    def retry_llm(inputs):
+        calls.append(inputs["input_text"])
+        return OUTPUT
+    graph = ChunkGraph(["chunk-0", "chunk-1", "chunk-2"])
+    create.retry_failed_chunks(graph, RunnableLambda(retry_llm), {}, dead_letters)
+    assert calls == [texts[2]]
+    assert graph.marked == ["chunk-2"]
+    assert dead_letters.get_all() == []
+    dead_letters.close()
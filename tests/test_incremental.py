@@ -0,0 +1,108 @@
+import hashlib
+
+from langchain_core.documents import Document
+from langchain_neo4j.graphs.graph_document import GraphDocument, Node, Relationship
+
+import create
+from my_packages import GraphAbout
+
+PREFIX = "__test_incremental__"
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.token_count = len(text)
+
+# 按增量构建的流程写入一个文件：Document结点、Chunk结构、各Chunk提取出的实体和关系。
+# chunks的元素为(Chunk文本, 实体id列表)，实体类型都是'疾病'，相邻的实体之间建立'相关'关系
+def import_file(graph, file_name, chunks):
+    GraphAbout.create_Document(graph, "local", "./data", file_name)
+    chunk_docs = GraphAbout.create_relation_between_chunks(graph, file_name, [FakeChunk(text) for text, _ in chunks])
+    graph_documents = []
+    for chunk, (_, entity_ids) in zip(chunk_docs, chunks):
+        if not entity_ids:  # 与create.build_graph_document相同，没有实体的Chunk不写入图对象
+            continue
+        nodes = [Node(id=entity_id, type="疾病", properties={"description": f"{entity_id}的描述"}) for entity_id in entity_ids]
+        graph_documents.append(GraphDocument(
+            nodes=nodes,
+            relationships=[Relationship(source=a, target=b, type="相关") for a, b in zip(nodes, nodes[1:])],
+            source=Document(page_content=chunk["chunk_doc"].page_content, metadata={"chunk_id": chunk["chunk_id"]})
+        ))
+    graph.add_graph_documents(graph_documents, include_source=True, baseEntityLabel=True, bulk=True)
+    GraphAbout.merge_relationship_between_chunk_and_entites(graph, [chunk["chunk_id"] for chunk in chunk_docs])
+
+def entity_ids(graph):
+    rows = graph.query("MATCH (e:`__Entity__`) WHERE e.id STARTS WITH $prefix RETURN e.id AS id", {"prefix": PREFIX})
+    return {row["id"] for row in rows}
+
+# 删除一个文件时，只属于该文件的实体被删除，仍被其它文件提及的实体及其关系保留；
+# 两个文件共有的Chunk结点保留，并且仍属于另一个文件
+def test_delete_document_keeps_entities_mentioned_elsewhere(neo4j_graph):
+    shared, only_a, only_b = f"{PREFIX}脑卒中", f"{PREFIX}偏瘫", f"{PREFIX}高血压"
+    file_a, file_b = f"{PREFIX}a.txt", f"{PREFIX}b.txt"
+    import_file(neo4j_graph, file_a, [(f"{PREFIX}文件A的第一段。", [shared, only_a]), (f"{PREFIX}两个文件共有的一段。", [shared])])
+    import_file(neo4j_graph, file_b, [(f"{PREFIX}文件B的第一段。", [shared, only_b]), (f"{PREFIX}两个文件共有的一段。", [shared])])
+    assert entity_ids(neo4j_graph) == {shared, only_a, only_b}
+
+    # 共有的Chunk在两个文件中的位置分别保存在PART_OF关系上，各文件的NEXT_CHUNK关系带有文件名
+    shared_chunk = neo4j_graph.query(
+        "MATCH (c:`__Chunk__` {text: $text})-[p:PART_OF]->(d:`__Document__`) "
+        "RETURN d.fileName AS fileName, p.position AS position, c.fileName AS chunkFileName",
+        {"text": f"{PREFIX}两个文件共有的一段。"}
+    )
+    assert sorted((row["fileName"], row["position"]) for row in shared_chunk) == [(file_a, 2), (file_b, 2)]
+    assert {row["chunkFileName"] for row in shared_chunk} == {file_a}
+    next_chunks = neo4j_graph.query(
+        "MATCH (:`__Chunk__`)-[r:NEXT_CHUNK]->(c:`__Chunk__` {text: $text}) RETURN r.fileName AS fileName",
+        {"text": f"{PREFIX}两个文件共有的一段。"}
+    )
+    assert sorted(row["fileName"] for row in next_chunks) == [file_a, file_b]
+
+    GraphAbout.delete_document(neo4j_graph, file_a)
+
+    assert entity_ids(neo4j_graph) == {shared, only_b}
+    assert neo4j_graph.query(
+        "MATCH (:`__Entity__` {id: $source})-[r]->(:`__Entity__` {id: $target}) RETURN count(r) AS count",
+        {"source": shared, "target": only_b}
+    )[0]["count"] == 1
+    manifest = GraphAbout.get_document_manifest(neo4j_graph)
+    assert file_a not in manifest and file_b in manifest
+    chunks = neo4j_graph.query(
+        "MATCH (c:`__Chunk__`)-[:PART_OF]->(d:`__Document__`) WHERE d.fileName STARTS WITH $prefix "
+        "RETURN c.text AS text, d.fileName AS fileName, c.fileName AS chunkFileName, "
+        "COUNT { (c)-[:NEXT_CHUNK {fileName: $deleted}]-() } AS deletedNextChunks",
+        {"prefix": PREFIX, "deleted": file_a}
+    )
+    assert sorted((row["text"], row["fileName"], row["chunkFileName"]) for row in chunks) == [
+        (f"{PREFIX}两个文件共有的一段。", file_b, file_b), (f"{PREFIX}文件B的第一段。", file_b, file_b)
+    ]
+    assert all(row["deletedNextChunks"] == 0 for row in chunks)
+
+# 提取结果写入后Chunk记为已提取，没有提取出实体的Chunk也不会再次提取
+def test_chunk_without_entities_counts_as_extracted(neo4j_graph):
+    file_name = f"{PREFIX}c.txt"
+    import_file(neo4j_graph, file_name, [(f"{PREFIX}有实体的一段。", [f"{PREFIX}脑卒中"]), (f"{PREFIX}没有实体的一段。", [])])
+    chunk_ids = GraphAbout.get_existing_chunk_ids(
+        neo4j_graph, [hashlib.sha1(f"{PREFIX}{text}".encode()).hexdigest() for text in ("有实体的一段。", "没有实体的一段。")]
+    )
+    assert len(chunk_ids) == 2
+    assert len(GraphAbout.get_extracted_chunk_ids(neo4j_graph, chunk_ids)) == 1
+    GraphAbout.mark_chunks_extracted(neo4j_graph, chunk_ids)
+    assert GraphAbout.get_extracted_chunk_ids(neo4j_graph, chunk_ids) == chunk_ids
+
+# 只处理新增和内容有变化的文件，有变化的文件先删除旧数据；seen记录读到的所有文件，用于找出已删除的文件
+def test_select_changed_files(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(GraphAbout, "delete_document", lambda graph, file_name: deleted.append(file_name))
+    file_contents = [["a.txt", "未修改"], ["sub/b.txt", "修改后"], ["c.txt", "新文件"]]
+    manifest = {
+        "a.txt": GraphAbout.document_content_hash("未修改"),
+        "sub/b.txt": GraphAbout.document_content_hash("修改前"),
+        "d.txt": GraphAbout.document_content_hash("已删除"),
+    }
+    seen = set()
+    selected = create.select_changed_files(None, iter(file_contents), manifest, seen)
+    assert [file_content[0] for file_content in selected] == ["sub/b.txt", "c.txt"]
+    assert deleted == ["sub/b.txt"]
+    assert set(manifest) - seen == {"d.txt"}
@@ -0,0 +1,187 @@
+import random
+
+import pytest
+from langchain_core.documents import Document
+from langchain_neo4j.graphs.graph_document import GraphDocument, Node, Relationship
+
+from my_packages.MyNeo4j import (
+    BASE_ENTITY_LABEL, UNKNOWN_LABEL, UNTYPED, build_node_import_queries, description_sentences, finalize_entities_query,
+    get_typed_node_import_query, get_typed_rel_import_query, join_descriptions, legacy_description_rows, merge_descriptions, sentence_hash,
+    normalize_relationship_type, _group_nodes_by_type, _group_relationships_by_type, _mention_pairs,
+    _merge_node_rows, _primary_type, _relationship_row
+)
+
+PREFIX = "__test_import__"
+
+# 两个文档提到同一实体，描述不同；第二个文档中该实体只出现在关系中，类型为'未知'
+def make_documents():
+    stroke = Node(id=f"{PREFIX}脑卒中", type="疾病", properties={"description": "脑卒中是急性脑血管疾病。"})
+    hemiplegia = Node(id=f"{PREFIX}偏瘫", type="症状", properties={"description": "偏瘫是一侧肢体瘫痪。"})
+    stroke_again = Node(id=f"{PREFIX}脑卒中", type="未知", properties={"description": "脑卒中可导致偏瘫。"})
+    return [
+        GraphDocument(
+            nodes=[stroke], relationships=[],
+            source=Document(page_content="第一段", metadata={"id": f"{PREFIX}doc-1"})
+        ),
+        GraphDocument(
+            nodes=[stroke_again, hemiplegia],
+            relationships=[Relationship(source=stroke_again, target=hemiplegia, type="导致")],
+            source=Document(page_content="第二段", metadata={"id": f"{PREFIX}doc-2"})
+        ),
+    ]
+
+# 同一实体在一次导入中合并为一行：类型取并集，各文档的描述句子按哈希去重后依次追加，其它属性后出现的覆盖先出现的
+def test_merge_node_rows_across_documents():
+    documents = make_documents()
+    documents[1].nodes[0].properties.update({"description": "脑卒中可导致偏瘫。脑卒中是急性脑血管疾病", "source": "第二段"})
+    rows = _merge_node_rows([el for document in documents for el in document.nodes])
+    assert [row["id"] for row in rows] == [f"{PREFIX}脑卒中", f"{PREFIX}偏瘫"]
+    stroke = rows[0]
+    assert stroke["types"] == ["疾病", "未知"]
+    assert [s["text"] for s in stroke["sentences"]] == ["脑卒中是急性脑血管疾病", "脑卒中可导致偏瘫"]
+    assert stroke["properties"] == {"source": "第二段"}
+
+    limited = _merge_node_rows([el for document in documents for el in document.nodes], max_sentences=1)
+    assert [s["text"] for s in limited[0]["sentences"]] == ["脑卒中是急性脑血管疾病"]
+
+# 按主类型分组，同一实体只出现在一组中，其余类型作为另外添加的标签；不使用__Entity__标签时不合并
+def test_group_nodes_by_type():
+    nodes = [el for document in make_documents() for el in document.nodes]
+    groups = _group_nodes_by_type(nodes, True, node_types={"疾病", UNKNOWN_LABEL})
+    assert {node_type: [(row["id"], row["labels"]) for row in rows] for node_type, rows in groups.items()} == {
+        "疾病": [(f"{PREFIX}脑卒中", [])], UNTYPED: [(f"{PREFIX}偏瘫", ["症状"])]
+    }
+    assert [row["id"] for row in _group_nodes_by_type(nodes, False)[None]] == [el.id for el in nodes]
+    assert _group_nodes_by_type([], False) == {}
+
+@pytest.mark.parametrize("types, primary, labels", [
+    (["疾病"], "疾病", []),
+    (["未知", "疾病"], "疾病", []),
+    (["疾病", "症状", "新类型"], "疾病", ["症状", "新类型"]),
+    (["未知"], UNKNOWN_LABEL, []),
+    (["未知", "新类型"], UNKNOWN_LABEL, ["新类型"]),
+    (["新类型"], UNTYPED, ["新类型"]),
+    ([], UNTYPED, []),
+])
+def test_primary_type(types, primary, labels):
+    assert _primary_type(types, {"疾病", "症状", UNKNOWN_LABEL}) == (primary, labels)
+
+# 按类型分组的导入查询静态设置类型标签，不逐行调用apoc设置标签；'未知'标签在导入后统一去掉
+def test_typed_node_import_query_sets_labels_statically():
+    for include_source in (True, False):
+        query = get_typed_node_import_query(include_source, ["疾病", "症状"])
+        assert "SET source:`疾病`:`症状`" in query
+        assert "apoc." not in query
+        assert ("MERGE (d)-[:MENTIONS]->(source)" in query) == include_source
+    assert "SET source:" not in get_typed_node_import_query(False, [])
+    assert f"REMOVE n:`{UNKNOWN_LABEL}`" in finalize_entities_query
+
+# 导入查询的种类数只与配置的类型数有关：任意类型组合的实体都使用预先生成的查询
+def test_node_import_query_shapes_bounded():
+    node_types = {"疾病", "症状", "药物", UNKNOWN_LABEL}
+    queries = build_node_import_queries(sorted(node_types))
+    assert len(set(queries.values())) == 2 * (len(node_types) + 1)
+    rng = random.Random(0)
+    nodes = [
+        Node(id=f"实体{rng.randrange(200)}", type=rng.choice(["疾病", "症状", "药物", "未知", "新类型1", "新类型2"]))
+        for _ in range(1000)
+    ]
+    groups = _group_nodes_by_type(nodes, True, node_types=node_types)
+    assert len({len(rows[0]["types"]) for rows in groups.values()}) > 1  # 有多个类型的实体
+    assert all((with_source, node_type) in queries for node_type in groups for with_source in (True, False))
+    assert {label for rows in groups.values() for row in rows for label in row["labels"]} <= {
+        "疾病", "症状", "药物", "新类型1", "新类型2"
+    }
+    assert "SET source:`疾病`" in queries[(False, "疾病")] and "SET source:" not in queries[(False, UNTYPED)]
+
+# 已知类型的关系按类型分组，用静态的MERGE导入，属性只在创建时设置；其它类型分在一组，逐行调用apoc
+def test_group_relationships_by_type():
+    stroke, hemiplegia = make_documents()[1].nodes[0], make_documents()[1].nodes[1]
+    rows = [
+        _relationship_row(Relationship(source=stroke, target=hemiplegia, type=rel_type))
+        for rel_type in ["临床 表现", "导致", "临床_表现", "新关系"]
+    ]
+    relationship_types = {normalize_relationship_type(t) for t in ["临床 表现", "导致"]}
+    groups = _group_relationships_by_type(rows, relationship_types)
+    assert {rel_type: [row["type"] for row in group] for rel_type, group in groups.items()} == {
+        "临床_表现": ["临床_表现", "临床_表现"], "导致": ["导致"], None: ["新关系"]
+    }
+    query = get_typed_rel_import_query(True, "临床_表现")
+    assert "MERGE (source)-[rel:`临床_表现`]->(target) ON CREATE SET rel += row.properties" in query
+    assert "apoc." not in query
+
+# 每个(文档, 实体)对只建立一次MENTIONS关系
+def test_mention_pairs():
+    documents = make_documents()
+    documents.append(documents[1])
+    assert _mention_pairs(documents) == [
+        {"document": f"{PREFIX}doc-1", "id": f"{PREFIX}脑卒中"},
+        {"document": f"{PREFIX}doc-2", "id": f"{PREFIX}脑卒中"},
+        {"document": f"{PREFIX}doc-2", "id": f"{PREFIX}偏瘫"},
+    ]
+
+# 描述按句末标点拆分，去掉句末标点和空白后按哈希去重
+def test_description_sentences():
+    sentences = description_sentences("脑卒中是急性脑血管疾病。 脑卒中可导致偏瘫！脑卒中是急性脑血管疾病；；")
+    assert [s["text"] for s in sentences] == ["脑卒中是急性脑血管疾病", "脑卒中可导致偏瘫"]
+    assert sentences[0]["hash"] == sentence_hash("脑卒中是急性脑血管疾病。")
+    assert description_sentences(None) == description_sentences("") == []
+
+# 拼接时去掉句子中残留的句末标点，不会出现"。；"
+def test_join_descriptions():
+    assert join_descriptions(["脑卒中是急性脑血管疾病。", "", "发病急", "  "]) == "脑卒中是急性脑血管疾病；发病急"
+    assert join_descriptions([]) == ""
+
+# 合并多个实体的描述：有句子列表的直接使用，旧数据从description拆分，按哈希去重并限制句子数
+def test_merge_descriptions():
+    first = description_sentences("脑卒中是急性脑血管疾病。发病急。")
+    nodes = [
+        {"descriptions": [s["text"] for s in first], "description_hashes": [s["hash"] for s in first]},
+        {"description": "发病急。脑卒中可导致偏瘫。"},
+        {"description": None},
+    ]
+    hashes, texts, description = merge_descriptions(nodes)
+    assert texts == ["脑卒中是急性脑血管疾病", "发病急", "脑卒中可导致偏瘫"]
+    assert len(set(hashes)) == 3
+    assert description == "脑卒中是急性脑血管疾病；发病急；脑卒中可导致偏瘫"
+    assert merge_descriptions(nodes, max_sentences=2)[2] == "脑卒中是急性脑血管疾病；发病急"
+
+# 只有description字符串的旧数据拆分为句子，哈希与新导入的句子相同，句子数不超过上限
+def test_legacy_description_rows():
+    rows = [{"id": f"{PREFIX}脑卒中", "description": "脑卒中是急性脑血管疾病。；脑卒中可导致偏瘫。"}]
+    assert legacy_description_rows(rows) == [{
+        "id": f"{PREFIX}脑卒中",
+        "descriptions": ["脑卒中是急性脑血管疾病", "脑卒中可导致偏瘫"],
+        "description_hashes": [s["hash"] for s in description_sentences("脑卒中是急性脑血管疾病。脑卒中可导致偏瘫")],
+    }]
+    assert legacy_description_rows(rows, max_sentences=1)[0]["descriptions"] == ["脑卒中是急性脑血管疾病"]
+
+# 实际导入两个提到同一实体的文档，两个文档的描述都保留，'未知'标签被确定的类型取代
+@pytest.mark.parametrize("bulk", [True, False])
+def test_import_keeps_descriptions_of_shared_entity(neo4j_graph, bulk):
+    neo4j_graph.add_graph_documents(make_documents(), include_source=True, baseEntityLabel=True, bulk=bulk)
+    result = neo4j_graph.query(
+        f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: $id}}) "
+        "RETURN n.descriptions AS descriptions, n.description AS description, labels(n) AS labels, "
+        "COUNT { (:Document)-[:MENTIONS]->(n) } AS mentions",
+        {"id": f"{PREFIX}脑卒中"}
+    )
+    assert len(result) == 1
+    entity = result[0]
+    assert entity["descriptions"] == ["脑卒中是急性脑血管疾病", "脑卒中可导致偏瘫"]
+    assert entity["description"] == "脑卒中是急性脑血管疾病；脑卒中可导致偏瘫"
+    assert sorted(entity["labels"]) == sorted([BASE_ENTITY_LABEL, "疾病"])
+    assert entity["mentions"] == 2
+
+# 旧数据的描述拆分后与新导入的相同句子去重，拼接时没有"。；"
+def test_import_splits_legacy_description(neo4j_graph):
+    neo4j_graph.query(
+        f"CREATE (:`{BASE_ENTITY_LABEL}`:疾病 {{id: $id, description: '脑卒中是急性脑血管疾病。；发病急。'}})",
+        {"id": f"{PREFIX}脑卒中"}
+    )
+    neo4j_graph.add_graph_documents(make_documents(), include_source=True, baseEntityLabel=True, bulk=True)
+    result = neo4j_graph.query(
+        f"MATCH (n:`{BASE_ENTITY_LABEL}` {{id: $id}}) RETURN n.description AS description",
+        {"id": f"{PREFIX}脑卒中"}
+    )
+    assert result[0]["description"] == "脑卒中是急性脑血管疾病；发病急；脑卒中可导致偏瘫"
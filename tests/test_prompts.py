@@ -0,0 +1,52 @@
+from langchain_core.messages import AIMessageChunk
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableGenerator
+
+import create
+from my_packages.LLMUsage import UsageTracker
+
+TYPES = [{"name": "疾病", "description": "疾病名称"}, {"name": "症状", "description": "疾病的表现"}]
+
+def test_encode_types():
+    assert create.encode_types(TYPES) == "疾病(疾病名称)；症状(疾病的表现)"
+
+# 去掉每行的缩进和首尾空行，模板中的变量保留
+def test_compact_prompt_strips_indentation():
+    prompt = """
+        -目标-
+            实体类型：{entity_types}
+        文本：{input_text}
+    """
+    assert create.compact_prompt(prompt) == "-目标-\n实体类型：{entity_types}\n文本：{input_text}"
+
+# 紧凑编码的类型列表比原来的字典列表短，合并请求的开销平均到每个Chunk
+def test_prompt_overhead_tokens():
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", "实体类型：{entity_types}"),
+        ("human", "共{text_count}段文本：{input_text}"),
+    ])
+    legacy = create.prompt_overhead_tokens(chat_prompt, {"entity_types": TYPES})
+    compact = create.prompt_overhead_tokens(chat_prompt, {"entity_types": create.encode_types(TYPES)})
+    assert 0 < compact < legacy
+    packed = create.prompt_overhead_tokens(chat_prompt, {"entity_types": create.encode_types(TYPES)}, 4)
+    assert packed < compact
+
+# 模型的流式输出，最后一段带有用量信息
+def fake_model(input_stream):
+    for _ in input_stream:
+        pass
+    yield AIMessageChunk(content="第一段")
+    yield AIMessageChunk(content="第二段", usage_metadata={
+        "input_tokens": 100, "output_tokens": 20, "total_tokens": 120, "input_token_details": {"cache_read": 64}
+    })
+
+# 包装后的链逐段转发输出，结束后记录用量，text_count计入Chunk数
+def test_usage_tracker_records_streamed_usage():
+    tracker = UsageTracker()
+    chain = tracker.track(RunnableGenerator(fake_model))
+    assert [chunk.content for chunk in chain.stream({"text_count": 4})] == ["第一段", "第二段"]
+    chain.invoke({})
+    stats = tracker.stats()
+    assert (stats["calls"], stats["chunks"]) == (2, 5)
+    assert (stats["input_tokens"], stats["output_tokens"], stats["cache_read_tokens"]) == (200, 40, 128)
+    assert stats["input_tokens_per_chunk"] == 40
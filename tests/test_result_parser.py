@@ -0,0 +1,172 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+import create
+from my_packages import GraphAbout, ResultParser
+from my_packages.LLMUsage import estimate_tokens
+
+def entity(name, type="疾病"):
+    return f'("entity" : "{name}" : "{type}" : "{name}的描述")\n'
+
+# 逐字符输入，模拟流式输出在任意位置断开
+def feed_by_char(parser, text):
+    for ch in text:
+        parser.feed(ch)
+
+def make_router(count, result_format=None):
+    result_format = result_format or ResultParser.TupleFormat()
+    return ResultParser.PackedStreamParser([result_format.parser(f"chunk-{n}", f"文本{n}") for n in range(count)])
+
+# 按编号标记分发各段输出，编号可以乱序，重复的编号只取第一次，超出范围的编号忽略
+def test_packed_output_routed_by_marker():
+    router = make_router(3)
+    feed_by_char(router, (
+        "<文本 2>\n" + entity("偏瘫", "症状")
+        + "<文本1>\n" + entity("脑卒中")
+        + "<文本 9>\n" + entity("无关")
+        + "<文本 2>\n" + entity("重复")
+        + "<文本 3>\n" + entity("高血压") + "<全部完成>"
+    ))
+    results = router.close()
+    assert [[node.id for node in document.nodes] for _, document in results] == [["脑卒中"], ["偏瘫"], ["高血压"]]
+    assert results[1][0] == entity("偏瘫", "症状").strip("\n")
+    assert [document.source.metadata["chunk_id"] for _, document in results] == ["chunk-0", "chunk-1", "chunk-2"]
+
+# 没有结束标记时输出可能被截断，最后一段和没有出现的段视为缺失
+def test_truncated_packed_output_drops_last_segment():
+    router = make_router(3)
+    router.feed("<文本 1>\n" + entity("脑卒中") + "<文本 2>\n" + '("entity" : "偏')
+    results = router.close()
+    assert results[0][1].nodes[0].id == "脑卒中"
+    assert results[1:] == [None, None]
+
+# 解析失败的段视为缺失，不计入格式统计
+def test_unparseable_segment_is_missing():
+    result_format = ResultParser.TupleFormat()
+    router = make_router(2, result_format)
+    router.feed("<文本 1>\n" + entity("脑卒中") + '<文本 2>\n("entity" : "偏瘫")\n<全部完成>')
+    results = router.close()
+    assert results[0] is not None and results[1] is None
+    assert result_format.stats() == {"records": 1, "malformed": 0, "malformed_chunks": 0}
+
+# 只有说明文字的输出是空结果，不是解析失败；有像记录的行但全部无法解析时才失败
+@pytest.mark.parametrize("result_format", [
+    ResultParser.TupleFormat(), ResultParser.TerseFormat(["疾病"], ["治疗"])
+], ids=["tuple", "terse"])
+def test_prose_reply_is_empty_result(result_format):
+    parser = result_format.parser("chunk", "文本")
+    parser.feed("文本中没有实体。\n")
+    document = parser.close()
+    parser.check()
+    assert document.nodes == [] and document.relationships == []
+
+    parser = result_format.parser("chunk", "文本")
+    parser.feed('文本中的实体如下：\n("entity" : "脑卒中")\nE|脑卒中\n')
+    parser.close()
+    with pytest.raises(ResultParser.UnparseableResult, match="1 malformed records"):
+        parser.check()
+
+# 合并请求中某段只有说明文字时，该段是空结果，不单独重试
+def test_prose_segment_in_pack_is_empty_result():
+    router = make_router(2)
+    router.feed("<文本 1>\n" + entity("脑卒中") + "<文本 2>\n本段文本没有实体和关系。\n<全部完成>")
+    results = router.close()
+    assert results[1][0] == "本段文本没有实体和关系。"
+    assert results[1][1].nodes == []
+
+# 输出格式必须实现parse_line，实现后可以像内置格式一样解析输出
+def test_result_format_requires_parse_line():
+    class NoParse(ResultParser.ResultFormat):
+        pass
+
+    with pytest.raises(TypeError):
+        NoParse()
+
+    class NameOnly(ResultParser.ResultFormat):
+        def parse_line(self, parser, line):
+            if line.strip():
+                parser.add_entity(line.strip(), ResultParser.OTHER_TYPE, "")
+
+    result_format = NameOnly()
+    document = result_format("chunk", "文本", "脑卒中\n偏瘫")
+    assert [node.id for node in document.nodes] == ["脑卒中", "偏瘫"]
+    assert result_format.stats()["records"] == 2
+
+# 合并的输入文本中每段前有编号标记，与解析时识别的标记一致
+def test_pack_texts_markers_match_parser():
+    packed = GraphAbout.pack_texts(["第一段", "第二段"])
+    markers = [line for line in packed.split("\n") if ResultParser.PACK_MARKER_PATTERN.match(line)]
+    assert [int(ResultParser.PACK_MARKER_PATTERN.match(line).group(1)) for line in markers] == [1, 2]
+
+class FakeChunk:
+    def __init__(self, text, token_count):
+        self.text = text
+        self.token_count = token_count
+
+# 按顺序分包，每包不超过token预算和Chunk数，超过预算的Chunk单独成包
+def test_make_packs_respects_budget_and_count():
+    file_contents = [
+        ["a.txt", "", [FakeChunk("", n) for n in (300, 300, 300, 900, 100)]],
+        ["b.txt", "", [FakeChunk("", n) for n in (100, 100, 100)]],
+    ]
+    tasks = [(f, i) for f, file_content in enumerate(file_contents) for i in range(len(file_content[2]))]
+    assert create.make_packs(file_contents, tasks, 800, 3) == [
+        [(0, 0), (0, 1)], [(0, 2)], [(0, 3)], [(0, 4), (1, 0), (1, 1)], [(1, 2)]
+    ]
+    assert create.make_packs(file_contents, [], 800, 3) == []
+
+# 合并请求的输出中缺失的Chunk单独重试，其余Chunk使用合并请求的结果
+def test_missing_pack_segment_falls_back_to_single_request(monkeypatch):
+    monkeypatch.setattr(create, "PACK_MAX_CHUNKS", 4)
+    monkeypatch.setattr(create, "PACK_TOKEN_BUDGET", 10000)
+    texts = [f"第{i}段关于脑卒中的文本。" for i in range(4)]
+    file_contents = [["f.txt", "".join(texts), [FakeChunk(text, len(text)) for text in texts],
+        [{"chunk_id": f"chunk-{i}", "chunk_doc": Document(page_content=text)} for i, text in enumerate(texts)]]]
+    packed_calls = []
+    def packed(inputs):
+        packed_calls.append(inputs["text_count"])
+        # 漏掉第3段
+        return "".join(f"<文本 {n}>\n" + entity(f"实体{n}") for n in (1, 2, 4)) + "<全部完成>"
+    single_calls = []
+    def single(inputs):
+        single_calls.append(inputs["input_text"])
+        return entity("单独")
+
+    results = {}
+    create.extract_entities_and_relationships(
+        None, RunnableLambda(single), {}, file_contents, packed_chain=RunnableLambda(packed),
+        on_result=lambda file_content, i, graph_document: results.setdefault(i, graph_document)
+    )
+    assert packed_calls == [4]
+    assert single_calls == [texts[2]]
+    assert {i: [node.id for node in document.nodes] for i, document in results.items()} == {
+        0: ["实体1"], 1: ["实体2"], 2: ["单独"], 3: ["实体4"]
+    }
+    assert file_contents[0][4][2] == entity("单独")
+
+# 同样的记录用两种输出格式表示，解析结果相同，紧凑格式的输出更短
+def test_terse_format_parses_same_records_with_fewer_tokens():
+    entities = [("脑卒中", "疾病", "急性脑血液循环障碍"), ("偏瘫", "症状", "一侧肢体运动障碍"), ("头颅CT", "检查", "急诊首选检查")]
+    relationships = [("脑卒中", "偏瘫", "临床表现", "脑卒中后常出现偏瘫", 8), ("头颅CT", "脑卒中", "诊断", "用于早期诊断", 7)]
+    entity_types, relationship_types = ["疾病", "症状", "检查"], ["临床表现", "诊断"]
+    tuple_output = "\n".join(
+        [f'("entity" : "{n}" : "{t}" : "{d}")' for n, t, d in entities]
+        + [f'("relationship" : "{s}" : "{o}" : "{t}" : "{d}" : {w})' for s, o, t, d, w in relationships]
+    )
+    terse_output = "\n".join(
+        [f"E|{n}|{entity_types.index(t) + 1}|{d}" for n, t, d in entities]
+        + [f"R|{s}|{o}|{relationship_types.index(t) + 1}|{w}|{d}" for s, o, t, d, w in relationships]
+    )
+    documents = [
+        ResultParser.TupleFormat()("chunk", "文本", tuple_output),
+        ResultParser.TerseFormat(entity_types, relationship_types)("chunk", "文本", terse_output),
+    ]
+    nodes = [sorted((n.id, n.type, n.properties["description"]) for n in document.nodes) for document in documents]
+    edges = [
+        sorted((r.source.id, r.target.id, r.type, r.properties["weight"]) for r in document.relationships)
+        for document in documents
+    ]
+    assert nodes[0] == nodes[1] and len(nodes[0]) == 3
+    assert edges[0] == edges[1] and len(edges[0]) == 2
+    assert estimate_tokens(terse_output) < estimate_tokens(tuple_output) * 0.75